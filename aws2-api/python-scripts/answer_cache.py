@@ -0,0 +1,177 @@
+"""
+센서 질의 답변 캐시 (해석된 데이터 구간 + 질문 구분자 기준)
+"8월 11일 14시 온도 알려줘", "8월 11일 오후 2시 온도는?"처럼 표현만 다르면 같은 항목을 쓰고,
+"14시 온도면 에어컨 켜야 해?"처럼 같은 구간에 다른 질문이면 다른 항목을 쓴다.
+
+키
+- 구간(window): {"kind", "points" 또는 "start"/"end", "fields", "question"} → 정규화한 JSON의 sha1
+  question = 의도 플래그 + 센서 필드 + 집계 종류 + 단위 (질의 분석 결과, chatbot.resolve_answer_window)
+- 구간 + 컨텍스트 digest: 검색된 컨텍스트가 같을 때만 재사용 (Bedrock만 생략)
+- 봉인된 과거 구간은 구간 키만으로도 조회 가능 → S3 검색과 Bedrock 모두 생략
+
+저장: <cache_dir>/xx/<sha1>.json (디스크, 프로세스 간 공유)
+- 봉인 구간 TTL(기본 7일) / 열린 구간 TTL(기본 5분), 만료 항목은 읽을 때 삭제
+- 전체 크기가 max_disk_bytes를 넘으면 오래 안 쓴 파일부터 90%까지 제거
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+_DT_KEYS = ("time", "start_time", "end_time")
+
+def context_digest(context: str) -> str:
+    return hashlib.sha1((context or "").encode("utf-8")).hexdigest()
+
+def encode_followup(followup: Optional[Dict]) -> Optional[Dict]:
+    """후속질문 컨텍스트 {"type", "data"}를 JSON 저장용으로 변환 (datetime → ISO 문자열)"""
+    if not followup or not followup.get("type"):
+        return None
+    data = {}
+    for k, v in (followup.get("data") or {}).items():
+        data[k] = v.isoformat() if isinstance(v, datetime) else v
+    return {"type": followup["type"], "data": data}
+
+def decode_followup(followup: Optional[Dict]) -> Optional[Dict]:
+    """encode_followup의 역변환 (시각 필드만 datetime으로 복원)"""
+    if not followup or not followup.get("type"):
+        return None
+    data = dict(followup.get("data") or {})
+    for k in _DT_KEYS:
+        if isinstance(data.get(k), str):
+            try:
+                data[k] = datetime.fromisoformat(data[k])
+            except ValueError:
+                pass
+    return {"type": followup["type"], "data": data}
+
+class AnswerCache:
+    """구간 기준 답변 디스크 캐시 (스레드 안전, 여러 프로세스가 같은 디렉터리를 써도 됨)"""
+
+    def __init__(self, cache_dir: str, max_disk_bytes: int = 64 * 1024 * 1024,
+                 sealed_ttl: float = 7 * 24 * 3600, open_ttl: float = 300):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.sealed_ttl = sealed_ttl
+        self.open_ttl = open_ttl
+        self._disk_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self.stats = {"window_hits": 0, "context_hits": 0, "misses": 0, "puts": 0, "expired": 0}
+
+    # ----- 키 -----
+    @staticmethod
+    def window_id(window: Dict) -> str:
+        canonical = {k: v for k, v in window.items() if k != "sealed"}
+        return json.dumps(canonical, ensure_ascii=False, sort_keys=True, default=str)
+
+    def _path(self, *parts: str) -> str:
+        digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    # ----- 조회 -----
+    def lookup_window(self, window: Dict) -> Optional[Dict]:
+        """봉인된 구간의 마지막 답변 (S3 검색 전에 호출)"""
+        if not window or not window.get("sealed"):
+            return None
+        entry = self._load(self._path("w", self.window_id(window)), window)
+        with self._lock:
+            self.stats["window_hits" if entry else "misses"] += 1
+        return entry
+
+    def get(self, window: Dict, digest: str) -> Optional[Dict]:
+        """같은 구간 + 같은 컨텍스트로 만든 답변 (검색 후, LLM 호출 전에 호출)"""
+        if not window:
+            return None
+        entry = self._load(self._path("wd", self.window_id(window), digest), window)
+        with self._lock:
+            self.stats["context_hits" if entry else "misses"] += 1
+        return entry
+
+    def put(self, window: Dict, digest: str, answer: str, route: str, followup: Dict = None):
+        if not window or not answer:
+            return
+        sealed = bool(window.get("sealed"))
+        now = time.time()
+        entry = {
+            "window": self.window_id(window),
+            "digest": digest,
+            "answer": answer,
+            "route": route,
+            "followup": encode_followup(followup),
+            "sealed": sealed,
+            "created_at": now,
+            "expires_at": now + (self.sealed_ttl if sealed else self.open_ttl),
+        }
+        self._save(self._path("wd", entry["window"], digest), entry)
+        if sealed:
+            self._save(self._path("w", entry["window"]), entry)
+        with self._lock:
+            self.stats["puts"] += 1
+
+    # ----- 디스크 -----
+    def _load(self, path: str, window: Dict) -> Optional[Dict]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry.get("window") != self.window_id(window):
+                return None
+            if entry.get("expires_at", 0) < time.time():
+                os.remove(path)
+                with self._lock:
+                    self.stats["expired"] += 1
+                return None
+            os.utime(path)  # LRU용 접근 시각 갱신
+            entry["followup"] = decode_followup(entry.get("followup"))
+            return entry
+        except Exception as e:
+            print(f"[경고] 답변 캐시 읽기 실패: {e}")
+            return None
+
+    def _save(self, path: str, entry: Dict):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+                else:
+                    self._disk_bytes += os.path.getsize(path)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+        except Exception as e:
+            print(f"[경고] 답변 캐시 저장 실패: {e}")
+
+    def _scan_disk(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        """오래 안 쓴 파일부터 지워 최대 용량의 90%까지 줄임"""
+        files = sorted(self._scan_disk(), key=lambda x: x[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
@@ -2,54 +2,203 @@
 """
 API Wrapper for chatbot.py
 NestJS API와 chatbot.py 간의 인터페이스 역할
+
+실행 방식:
+  python3 api_wrapper.py            # 단발 모드: stdin JSON 1개 → stdout JSON 1개
+  python3 api_wrapper.py --worker   # 워커 모드: 한 줄에 JSON 요청 1개씩 읽고 한 줄씩 응답 (NDJSON)
+
+S3 쓰기(채팅 로그/세션): 단발 모드는 동기 PUT (백엔드가 프로세스 종료(close)를 기다리므로
+종료 시 비우는 쓰기 지연 큐는 응답 시간을 줄이지 못함), 워커 모드만 쓰기 지연 큐 사용
+(AIRWATCH_WRITE_BEHIND로 직접 지정하면 그 값을 따름)
+
+요청 추적: 입력 JSON에 "trace": true (또는 환경변수 AIRWATCH_TRACE=1) → 응답에 "trace" 필드 추가,
+chatbot.TRACE_DIR/trace-YYYYMMDD.jsonl 에도 한 줄 기록
+
+스트리밍: 입력 JSON에 "stream": true → 응답 하나 대신 NDJSON 프레임을 여러 줄 출력 (두 모드 공통)
+  {"type": "meta", "route", "session_id"}      라우팅 직후 1번
+  {"type": "delta", "text"}                     답변 조각마다
+  {"type": "final", "answer", "route", ..., "stream_stats"}   기존 응답 필드 전체 + 통계
+워커 모드에서는 모든 프레임에 request_id가 붙음
+
+검색 계획 확인: 입력 JSON에 "explain": true → 검색/LLM 호출 없이 검색 계획만 응답 (route "explain")
+  "plan": {"kind", "steps": [{"step", "families", "partitions", "aggregates", "est_list", "est_get"}],
+           "options", "estimate", "budget", "within_budget", "downgrades"}
+  answer에는 사람이 읽는 요약, 히스토리에는 남기지 않음 (stream 플래그는 무시)
 """
 
+import os
 import sys
 import json
 import traceback
+import contextlib
 from datetime import datetime
+from typing import Optional
 
-def process_chatbot_query(query: str, session_id: str = None) -> dict:
+import request_trace
+from request_trace import stage
+
+TRACE_ENV_ENABLED = os.environ.get("AIRWATCH_TRACE", "").lower() in ("1", "true", "yes")
+
+def _finish_trace(result: dict):
+    """활성 추적을 종료하고 응답에 붙인 뒤 로컬 추적 파일에 기록"""
+    trace = request_trace.end_trace()
+    if not trace:
+        return
+    result["trace"] = trace
+    chatbot = sys.modules.get("chatbot")
+    if chatbot is not None:
+        request_trace.write_trace_file(trace, chatbot.TRACE_DIR, extra={
+            "route": result.get("route"),
+            "session_id": result.get("session_id"),
+            "processing_time": result.get("processing_time"),
+        })
+
+def process_chatbot_query(query: str, session_id: str = None, trace: bool = False, request_id: str = None, on_event=None, explain: bool = False) -> dict:
     """
     챗봇 쿼리를 처리하고 결과를 반환
+    trace=True면 단계별 시간과 S3/Bedrock 호출 집계를 응답의 "trace"에 포함
+    explain=True면 라우팅까지만 하고 검색 계획을 "plan"으로 반환 (S3 검색/LLM/히스토리 저장 없음)
+    on_event가 있으면 스트리밍: 라우팅 직후 meta 프레임, 답변 조각마다 delta 프레임을 on_event(dict)로 넘기고
+    결과에 "stream_stats" 추가 (final 프레임은 호출 측이 반환값으로 만듦)
     """
+    start_time = datetime.now()
+    if trace or TRACE_ENV_ENABLED:
+        request_trace.start_trace(request_id)
+
+    stream_stats = {"meta_sent": False, "deltas": 0, "first_token_sec": None}
+
+    def _emit_meta(route, sid):
+        if on_event is None or stream_stats["meta_sent"]:
+            return
+        stream_stats["meta_sent"] = True
+        on_event({"type": "meta", "route": route, "session_id": sid})
+
+    def _emit_delta(text):
+        if on_event is None or not text:
+            return
+        if stream_stats["deltas"] == 0:
+            stream_stats["first_token_sec"] = (datetime.now() - start_time).total_seconds()
+        stream_stats["deltas"] += 1
+        on_event({"type": "delta", "text": text})
+
+    def _stream_stats(processing_time):
+        return {
+            "first_token_sec": stream_stats["first_token_sec"],
+            "deltas": stream_stats["deltas"],
+            "total_sec": processing_time,
+        }
+
     try:
         # chatbot.py 모듈 import
-        import chatbot
-        
-        start_time = datetime.now()
+        with stage("startup"):
+            import chatbot
         
         # 세션 관리
         if not session_id:
             session_id = chatbot.SESSION_ID
             
-        session = chatbot.get_or_create_session(session_id)
+        with stage("session"):
+            session = chatbot.get_or_create_session(session_id)
+        
+        # 질의 분석은 요청당 한 번 (확장된 경우에만 다시 분석)
+        with stage("query_analysis"):
+            analysis = chatbot.analyze_query(query)
         
         # 후속 질문 확장 (이전 컨텍스트 활용)
-        expanded_query = chatbot.expand_followup_query_with_last_window(query, session)
+        with stage("followup_expansion"):
+            expanded_query = chatbot.expand_followup_query_with_last_window(query, session, analysis)
+            if expanded_query != query:
+                analysis = chatbot.analyze_query(expanded_query)
         
         # 라우팅 결정
-        route = chatbot.decide_route(expanded_query)
+        with stage("routing"):
+            route = chatbot.decide_route(expanded_query, analysis)
+        
+        # 검색 계획 (예산 안에서 어떤 패밀리/해상도로 읽을지, S3 조회 없음)
+        plan = None
+        if route == "sensor":
+            with stage("planning"):
+                try:
+                    plan = chatbot.plan_retrieval(analysis)
+                except Exception as plan_error:
+                    print(f"[경고] 검색 계획 실패, 기본 경로로 검색: {plan_error}")
+        
+        if explain:
+            result = {
+                "answer": plan.describe() if plan else "일반 질문: 센서 데이터 검색 없이 답변합니다.",
+                "route": "explain",
+                "session_id": session.session_id,
+                "turn_id": len(session.history),
+                "processing_time": (datetime.now() - start_time).total_seconds(),
+                "mode": "explain",
+                "planned_route": route,
+                "plan": plan.to_dict() if plan else None,
+            }
+            _finish_trace(result)
+            return result
+        
+        _emit_meta(route, session.session_id)
+        
+        prompt_cache = None
+        
+        def _llm(messages, system=None):
+            nonlocal prompt_cache
+            if on_event is None:
+                text, payload = chatbot._invoke_claude(messages, system=system)
+            else:
+                text, payload = chatbot._invoke_claude_stream(messages, system=system, on_delta=_emit_delta)
+            prompt_cache = (payload or {}).get("prompt_cache")
+            return text, payload
+        
+        answer_cache_status = None
         
         if route == "sensor":
             # 센서 데이터 관련 질문
             try:
-                # S3에서 관련 문서 검색
-                docs, context = chatbot.retrieve_documents_from_s3(expanded_query, session=session)
+                # 답변 캐시: 봉인된 과거 구간이면 S3 검색/LLM 없이 바로 응답
+                with stage("answer_cache"):
+                    answer_cache = chatbot.get_answer_cache()
+                    window = chatbot.resolve_answer_window(analysis) if answer_cache else None
+                    cached = answer_cache.lookup_window(window) if window else None
                 
-                if not context or context.strip() == "":
-                    answer = "죄송합니다. 요청하신 시간대의 센서 데이터를 찾을 수 없습니다."
-                    route = "sensor_no_data"
+                if cached:
+                    answer = cached["answer"]
+                    answer_cache_status = "window_hit"
+                    if cached.get("followup"):
+                        chatbot.set_followup_context(cached["followup"]["type"], cached["followup"]["data"], session)
                 else:
-                    # 프롬프트 구성 및 Claude 호출
-                    prompt = chatbot.build_prompt(expanded_query, context, session.history[-5:] if session.history else [])
-                    messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
-                    answer, raw_response = chatbot._invoke_claude(messages)
+                    # S3에서 관련 문서 검색 (검색 중 설정된 후속질문 컨텍스트는 캐시 항목에 함께 저장)
+                    followup_before = getattr(session, "recent_context", None)
+                    with stage("retrieval"):
+                        docs, context = chatbot.retrieve_documents_from_s3(expanded_query, session=session, analysis=analysis, plan=plan)
+                    followup_after = getattr(session, "recent_context", None)
+                    followup = followup_after if followup_after is not followup_before else None
                     
-                    # 응답이 비어있는 경우 처리
-                    if not answer or answer.strip() == "":
-                        answer = "죄송합니다. 요청을 처리하는 중 문제가 발생했습니다."
-                        route = "sensor_error"
+                    if not context or context.strip() == "":
+                        answer = "죄송합니다. 요청하신 시간대의 센서 데이터를 찾을 수 없습니다."
+                        route = "sensor_no_data"
+                    else:
+                        # 같은 구간 + 같은 컨텍스트로 만든 답변이 있으면 LLM 생략
+                        digest = chatbot.context_digest(context)
+                        cached = answer_cache.get(window, digest) if window else None
+                        if cached:
+                            answer = cached["answer"]
+                            answer_cache_status = "context_hit"
+                        else:
+                            # 프롬프트 구성 및 Claude 호출
+                            with stage("prompt_build"):
+                                system_prompt, prompt = chatbot.build_prompt_parts(expanded_query, context, session.history, session.history_window)
+                                messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+                            with stage("llm"):
+                                answer, raw_response = _llm(messages, system_prompt)
+                            
+                            # 응답이 비어있는 경우 처리
+                            if not answer or answer.strip() == "":
+                                answer = "죄송합니다. 요청을 처리하는 중 문제가 발생했습니다."
+                                route = "sensor_error"
+                            elif window:
+                                answer_cache.put(window, digest, answer, route, followup=followup)
+                                answer_cache_status = "miss"
                         
             except Exception as sensor_error:
                 answer = f"센서 데이터 처리 중 오류가 발생했습니다: {str(sensor_error)}"
@@ -58,9 +207,11 @@ def process_chatbot_query(query: str, session_id: str = None) -> dict:
         else:
             # 일반 질문
             try:
-                prompt = chatbot.build_general_prompt(expanded_query, session.history[-5:] if session.history else [])
-                messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
-                answer, raw_response = chatbot._invoke_claude(messages)
+                with stage("prompt_build"):
+                    system_prompt, prompt = chatbot.build_general_prompt_parts(expanded_query, session.history, session.history_window)
+                    messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+                with stage("llm"):
+                    answer, raw_response = _llm(messages, system_prompt)
                 route = "general"
                 
                 if not answer or answer.strip() == "":
@@ -71,8 +222,13 @@ def process_chatbot_query(query: str, session_id: str = None) -> dict:
                 answer = f"일반 질문 처리 중 오류가 발생했습니다: {str(general_error)}"
                 route = "general_error"
         
+        # LLM을 거치지 않은 답변(데이터 없음/오류 안내)은 한 조각으로 전송
+        if stream_stats["deltas"] == 0:
+            _emit_delta(answer)
+        
         # 히스토리에 추가
-        session.add_to_history(query, answer, route)
+        with stage("history_save"):
+            session.add_to_history(query, answer, route)
         
         processing_time = (datetime.now() - start_time).total_seconds()
         
@@ -84,14 +240,21 @@ def process_chatbot_query(query: str, session_id: str = None) -> dict:
             "processing_time": processing_time,
             "mode": "rag" if route.startswith("sensor") else "general"
         }
+        if answer_cache_status:
+            result["answer_cache"] = answer_cache_status
+        if prompt_cache:
+            result["prompt_cache"] = prompt_cache
+        if on_event is not None:
+            result["stream_stats"] = _stream_stats(processing_time)
         
+        _finish_trace(result)
         return result
         
     except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
         error_msg = f"챗봇 처리 중 오류가 발생했습니다: {str(e)}"
         
-        return {
+        result = {
             "answer": error_msg,
             "route": "error",
             "session_id": session_id or "",
@@ -101,11 +264,40 @@ def process_chatbot_query(query: str, session_id: str = None) -> dict:
             "error": str(e),
             "traceback": traceback.format_exc()
         }
+        if on_event is not None:
+            _emit_meta("error", session_id or "")
+            result["stream_stats"] = _stream_stats(processing_time)
+        
+        _finish_trace(result)
+        return result
+
+def stream_chatbot_query(query: str, session_id: str = None, trace: bool = False, request_id: str = None, write_frame=None) -> dict:
+    """
+    스트리밍 처리: meta → delta... → final 프레임을 write_frame(dict)으로 순서대로 내보내고 결과 반환
+    request_id가 있으면 모든 프레임에 붙임
+    """
+    def _frame(frame: dict):
+        if request_id is not None:
+            frame["request_id"] = request_id
+        write_frame(frame)
+
+    result = process_chatbot_query(query, session_id, trace=trace, request_id=request_id, on_event=_frame)
+    _frame({"type": "final", **result})
+    return result
+
+def _frame_writer(out):
+    """NDJSON 한 줄 쓰고 바로 flush (조각이 버퍼에 머물지 않도록)"""
+    def write(frame: dict):
+        out.write(json.dumps(frame, ensure_ascii=False) + "\n")
+        out.flush()
+    return write
 
 def main():
     """
     메인 함수 - JSON 입력을 받아 처리하고 JSON 출력
     """
+    # 단발 모드: 쓰기 지연 큐를 쓰면 종료 시 drain이 그대로 응답 경로에 남으므로 동기 쓰기
+    os.environ.setdefault("AIRWATCH_WRITE_BEHIND", "0")
     try:
         # stdin에서 JSON 입력 읽기
         input_data = sys.stdin.read().strip()
@@ -124,12 +316,21 @@ def main():
             
         query = request_data["query"]
         session_id = request_data.get("session_id")
+        explain = bool(request_data.get("explain"))
+        
+        # 스트리밍: stdout은 프레임 전용, 처리 중 print 출력은 stderr로
+        if request_data.get("stream") and not explain:
+            write_frame = _frame_writer(sys.stdout)
+            with contextlib.redirect_stdout(sys.stderr):
+                stream_chatbot_query(query, session_id, trace=bool(request_data.get("trace")), write_frame=write_frame)
+            return
         
         # 쿼리 처리
-        result = process_chatbot_query(query, session_id)
+        result = process_chatbot_query(query, session_id, trace=bool(request_data.get("trace")), explain=explain)
         
-        # JSON 출력
+        # JSON 출력 (남은 S3 쓰기는 종료 시 atexit에서 전송되므로 응답부터 내보냄)
         print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.stdout.flush()
         
     except Exception as e:
         # 에러 응답
@@ -147,5 +348,87 @@ def main():
         print(json.dumps(error_response, ensure_ascii=False, indent=2))
         sys.exit(1)
 
+def handle_worker_request(line: str, write_frame=None) -> Optional[dict]:
+    """
+    워커 모드 요청 한 줄 처리 - 응답 dict 반환 (예외를 밖으로 던지지 않음)
+    "stream": true 요청은 write_frame으로 프레임을 직접 내보내고 None 반환
+    """
+    request_id = None
+    try:
+        try:
+            request_data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON input: {e}")
+        if not isinstance(request_data, dict):
+            raise ValueError("Request must be a JSON object")
+
+        request_id = request_data.get("request_id")
+
+        # 헬스체크용 핑
+        if request_data.get("command") == "ping":
+            return {"status": "ok", "mode": "worker", "request_id": request_id}
+
+        if "query" not in request_data:
+            raise ValueError("Missing required field: query")
+
+        explain = bool(request_data.get("explain"))
+        if request_data.get("stream") and write_frame is not None and not explain:
+            stream_chatbot_query(
+                request_data["query"], request_data.get("session_id"),
+                trace=bool(request_data.get("trace")), request_id=request_id, write_frame=write_frame,
+            )
+            return None
+
+        result = process_chatbot_query(
+            request_data["query"], request_data.get("session_id"),
+            trace=bool(request_data.get("trace")), request_id=request_id, explain=explain,
+        )
+
+    except Exception as e:
+        result = {
+            "error": str(e),
+            "answer": "요청 처리 중 오류가 발생했습니다.",
+            "route": "error",
+            "session_id": "",
+            "turn_id": 0,
+            "processing_time": 0,
+            "mode": "error",
+            "traceback": traceback.format_exc()
+        }
+
+    if request_id is not None:
+        result["request_id"] = request_id
+    return result
+
+def run_worker():
+    """
+    워커 모드 - 프로세스를 유지하면서 NDJSON 요청을 순차 처리
+    chatbot 모듈, boto3 클라이언트, USER_SESSIONS, lru_cache가 요청 간에 재사용됨
+    stdout은 응답 전용이므로 처리 중 print 출력은 stderr로 돌림
+    """
+    out = sys.stdout
+    write_frame = _frame_writer(out)
+
+    # 모듈/클라이언트를 미리 로드해서 첫 요청 지연 제거
+    with contextlib.redirect_stdout(sys.stderr):
+        import chatbot  # noqa: F401
+
+    out.write(json.dumps({"status": "ready", "mode": "worker"}, ensure_ascii=False) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        with contextlib.redirect_stdout(sys.stderr):
+            result = handle_worker_request(line, write_frame)
+
+        if result is not None:
+            write_frame(result)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--worker" in sys.argv[1:]:
+        run_worker()
+    else:
+        main()
\ No newline at end of file
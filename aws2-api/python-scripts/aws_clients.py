@@ -0,0 +1,98 @@
+"""
+공용 AWS 클라이언트 레지스트리 (chatbot / 추천봇 공용)
+서비스+리전마다 클라이언트 하나를 프로세스 전체에서 공유한다.
+
+- 지연 생성: 모듈 전역에는 LazyClient만 두고 첫 API 호출 때 실제 클라이언트 생성
+  (캐시 히트로 끝나는 짧은 호출은 자격 증명 확인/커넥션 풀 생성 비용을 내지 않음)
+- 커넥션 풀: 기본 10개 대신 병렬 워커 수에 맞춘 크기 (configure)
+- 재시도: adaptive 모드 (스로틀링 시 클라이언트 쪽 속도 조절 + 재시도)
+boto3.client 생성은 스레드 안전하지 않으므로 잠금 안에서 만든다.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+DEFAULT_REGION = "ap-northeast-2"
+DEFAULT_MAX_POOL = int(os.environ.get("AIRWATCH_AWS_MAX_POOL", "32"))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("AIRWATCH_AWS_MAX_ATTEMPTS", "4"))
+DEFAULT_RETRY_MODE = os.environ.get("AIRWATCH_AWS_RETRY_MODE", "adaptive")
+CONNECT_TIMEOUT_SEC = 5
+# 서비스별 읽기 타임아웃 (Bedrock 스트리밍은 생성이 길어질 수 있음)
+READ_TIMEOUT_SEC = {"s3": 20, "bedrock-runtime": 120}
+
+_SETTINGS = {"max_pool_connections": DEFAULT_MAX_POOL, "max_attempts": DEFAULT_MAX_ATTEMPTS,
+             "retry_mode": DEFAULT_RETRY_MODE}
+_CLIENTS: Dict[Tuple[str, str], object] = {}
+_LOCK = threading.Lock()
+
+def configure(max_pool_connections: int = None, max_attempts: int = None, retry_mode: str = None):
+    """
+    클라이언트 설정 변경 (이미 만들어진 클라이언트에는 적용되지 않음 → 모듈 로드 시 호출)
+    풀 크기는 기존 값보다 작아지지 않음 (여러 모듈이 각자 필요한 크기를 요청)
+    """
+    with _LOCK:
+        if max_pool_connections:
+            _SETTINGS["max_pool_connections"] = max(_SETTINGS["max_pool_connections"], int(max_pool_connections))
+        if max_attempts:
+            _SETTINGS["max_attempts"] = int(max_attempts)
+        if retry_mode:
+            _SETTINGS["retry_mode"] = retry_mode
+
+def _build_config(service: str):
+    try:
+        from botocore.config import Config
+    except ImportError:
+        return None
+    return Config(
+        max_pool_connections=_SETTINGS["max_pool_connections"],
+        retries={"mode": _SETTINGS["retry_mode"], "max_attempts": _SETTINGS["max_attempts"]},
+        connect_timeout=CONNECT_TIMEOUT_SEC,
+        read_timeout=READ_TIMEOUT_SEC.get(service, 60),
+        tcp_keepalive=True,
+    )
+
+def get_client(service: str, region: str = DEFAULT_REGION):
+    """(서비스, 리전)별 공유 클라이언트 (최초 호출 때 생성)"""
+    key = (service, region)
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            import boto3
+            config = _build_config(service)
+            kwargs = {"region_name": region}
+            if config is not None:
+                kwargs["config"] = config
+            client = boto3.client(service, **kwargs)
+            _CLIENTS[key] = client
+    return client
+
+def reset():
+    """만들어진 클라이언트 폐기 (테스트/벤치마크에서 boto3 대역 교체 후)"""
+    with _LOCK:
+        _CLIENTS.clear()
+
+class LazyClient:
+    """첫 속성 접근 때 get_client로 실제 클라이언트를 가져오는 대리 객체"""
+
+    def __init__(self, service: str, region: str = DEFAULT_REGION):
+        self._service = service
+        self._region = region
+
+    @property
+    def client(self):
+        return get_client(self._service, self._region)
+
+    def __getattr__(self, name):
+        # _service/_region 등 인스턴스 속성은 여기까지 오지 않음
+        return getattr(self.client, name)
+
+    def __repr__(self):
+        state = "생성됨" if (self._service, self._region) in _CLIENTS else "미생성"
+        return f"<LazyClient {self._service}@{self._region} ({state})>"
+
+def lazy_client(service: str, region: Optional[str] = None) -> LazyClient:
+    return LazyClient(service, region or DEFAULT_REGION)
@@ -0,0 +1,57 @@
+"""
+Bedrock Claude 응답 스트리밍
+invoke_model_with_response_stream 이벤트를 읽어 텍스트 조각이 올 때마다 on_delta(text)를 호출하고,
+끝나면 invoke_model 응답과 같은 모양의 payload를 만들어 돌려준다.
+(chatbot.py, recommend-bot-python/recommendbot.py 공용)
+"""
+
+import json
+from typing import Callable, Dict, Optional, Tuple
+
+def invoke_claude_stream(client, model_id: str, body: Dict,
+                         on_delta: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict]:
+    """
+    스트리밍 호출 → (전체 텍스트, payload)
+    payload: {"id", "content": [{"type": "text", "text"}], "stop_reason", "usage", "metrics"}
+    """
+    resp = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+        body=json.dumps(body).encode("utf-8"),
+    )
+
+    parts = []
+    payload: Dict = {"id": None, "content": [], "stop_reason": None, "usage": {}, "metrics": None}
+    for event in resp["body"]:
+        chunk = event.get("chunk")
+        if chunk is None:
+            # 스트림 도중 오류 (modelStreamErrorException, throttlingException 등)
+            for name, err in event.items():
+                message = err.get("message", err) if isinstance(err, dict) else err
+                raise RuntimeError(f"Bedrock 스트림 오류 {name}: {message}")
+            continue
+
+        data = json.loads(chunk["bytes"])
+        kind = data.get("type")
+        if kind == "message_start":
+            message = data.get("message") or {}
+            payload["id"] = message.get("id")
+            payload["usage"].update(message.get("usage") or {})
+        elif kind == "content_block_delta":
+            delta = data.get("delta") or {}
+            if delta.get("type") == "text_delta":
+                text = delta.get("text", "")
+                if text:
+                    parts.append(text)
+                    if on_delta is not None:
+                        on_delta(text)
+        elif kind == "message_delta":
+            payload["stop_reason"] = (data.get("delta") or {}).get("stop_reason")
+            payload["usage"].update(data.get("usage") or {})
+        elif kind == "message_stop":
+            payload["metrics"] = data.get("amazon-bedrock-invocationMetrics")
+
+    text = "".join(parts)
+    payload["content"] = [{"type": "text", "text": text}]
+    return text.strip(), payload
@@ -0,0 +1,362 @@
+"""
+벤치마크용 로컬 AWS 대역
+- FilesystemS3: <root>/<bucket>/<key> 파일을 S3 객체처럼 제공 (LIST/HEAD/GET/PUT, Range, If-None-Match, 페이지네이터)
+- StubBedrock: invoke_model / invoke_model_with_response_stream 응답을 흉내 (라우터 프롬프트엔 도메인 JSON, 그 외엔 고정 답변)
+- install(): boto3.client를 바꿔치기 → chatbot/recommendbot import 전에 호출해야 모듈 전역 클라이언트까지 대역이 됨
+
+호출 수/바이트는 calls에 집계되고, request_trace 추적이 켜져 있으면 단계별 집계에도 반영된다.
+"""
+
+import io
+import os
+import json
+import time
+import bisect
+import hashlib
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+import request_trace
+
+class NoSuchKey(ClientError):
+    pass
+
+class _Exceptions:
+    NoSuchKey = NoSuchKey
+    ClientError = ClientError
+
+def _client_error(code: str, message: str, operation: str, status: int = 400) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+class _Body(io.BytesIO):
+    """botocore StreamingBody 대용 (read()만 쓰임)"""
+
+class _CallCounter:
+    def __init__(self, service: str, latency_ms: float = 0.0):
+        self.service = service
+        self.latency_ms = latency_ms
+        self.calls: Counter = Counter()
+        self.bytes: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, operation: str, bytes_in: int = 0, bytes_out: int = 0, sleep: bool = True):
+        with self._lock:
+            self.calls[operation] += 1
+            self.bytes[f"{operation}.in"] += bytes_in
+            self.bytes[f"{operation}.out"] += bytes_out
+        trace = request_trace.current_trace()
+        if trace is not None:
+            trace.record_call(self.service, operation, bytes_in, bytes_out)
+        if self.latency_ms and sleep:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.calls)
+
+class FilesystemS3(_CallCounter):
+    """디렉터리 트리를 버킷처럼 쓰는 S3 대역 (키 목록은 메모리에 정렬 보관)"""
+
+    def __init__(self, root: str, latency_ms: float = 0.0):
+        super().__init__("s3", latency_ms)
+        self.root = root
+        self.exceptions = _Exceptions()
+        self._keys: Dict[str, List[str]] = {}
+        self._etags: Dict[str, str] = {}  # LIST/GET ETag 일치용 (md5, PUT 때 무효화)
+        self._keys_lock = threading.Lock()
+
+    # ----- 내부 -----
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _bucket_keys(self, bucket: str) -> List[str]:
+        with self._keys_lock:
+            keys = self._keys.get(bucket)
+            if keys is None:
+                base = os.path.join(self.root, bucket)
+                keys = []
+                for dirpath, _, files in os.walk(base):
+                    rel = os.path.relpath(dirpath, base)
+                    for name in files:
+                        if name.endswith(".tmp"):
+                            continue
+                        keys.append(name if rel == "." else f"{rel.replace(os.sep, '/')}/{name}")
+                keys.sort()
+                self._keys[bucket] = keys
+            return keys
+
+    def _read(self, bucket: str, key: str, operation: str) -> bytes:
+        try:
+            with open(self._path(bucket, key), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise NoSuchKey({"Error": {"Code": "NoSuchKey", "Message": key}, "ResponseMetadata": {"HTTPStatusCode": 404}}, operation)
+
+    @staticmethod
+    def _etag(data: bytes) -> str:
+        return '"%s"' % hashlib.md5(data).hexdigest()
+
+    def _key_etag(self, bucket: str, key: str) -> str:
+        cache_key = f"{bucket}/{key}"
+        etag = self._etags.get(cache_key)
+        if etag is None:
+            with open(self._path(bucket, key), "rb") as f:
+                etag = self._etag(f.read())
+            self._etags[cache_key] = etag
+        return etag
+
+    # ----- S3 API -----
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", Delimiter: str = None, StartAfter: str = None,
+                        MaxKeys: int = 1000, ContinuationToken: str = None, **kwargs) -> Dict:
+        keys = self._bucket_keys(Bucket)
+        after = ContinuationToken or StartAfter
+        lo = bisect.bisect_right(keys, after) if after and after >= Prefix else bisect.bisect_left(keys, Prefix)
+
+        contents, prefixes, seen_prefixes = [], [], set()
+        i = lo
+        truncated = False
+        while i < len(keys) and keys[i].startswith(Prefix):
+            key = keys[i]
+            if len(contents) + len(prefixes) >= MaxKeys:
+                truncated = True
+                break
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                if common not in seen_prefixes:
+                    seen_prefixes.add(common)
+                    prefixes.append({"Prefix": common})
+                # 같은 공통 prefix 아래 키는 건너뜀
+                i = bisect.bisect_left(keys, common + "\uffff")
+                continue
+            st = os.stat(self._path(Bucket, key))
+            contents.append({
+                "Key": key,
+                "Size": st.st_size,
+                "LastModified": datetime.fromtimestamp(st.st_mtime),
+                "ETag": self._key_etag(Bucket, key),
+            })
+            i += 1
+
+        resp = {"KeyCount": len(contents) + len(prefixes), "IsTruncated": truncated, "Prefix": Prefix, "MaxKeys": MaxKeys}
+        if contents:
+            resp["Contents"] = contents
+        if prefixes:
+            resp["CommonPrefixes"] = prefixes
+        if truncated:
+            resp["NextContinuationToken"] = contents[-1]["Key"] if contents else prefixes[-1]["Prefix"]
+        self._count("ListObjectsV2", bytes_in=200 + 150 * resp["KeyCount"])
+        return resp
+
+    def get_paginator(self, operation_name: str):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(operation_name)
+        return _ListPaginator(self)
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        data = self._read(Bucket, Key, "HeadObject")
+        self._count("HeadObject")
+        return {"ContentLength": len(data), "ETag": self._etag(data)}
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None, IfNoneMatch: str = None, **kwargs) -> Dict:
+        data = self._read(Bucket, Key, "GetObject")
+        etag = self._etag(data)
+        if IfNoneMatch and IfNoneMatch == etag:
+            self._count("GetObject")
+            raise _client_error("304", "Not Modified", "GetObject", 304)
+        total = len(data)
+        resp = {"ETag": etag}
+        if Range:
+            spec = Range.split("=", 1)[1]
+            start_s, end_s = spec.split("-", 1)
+            if start_s == "":
+                start, end = max(0, total - int(end_s)), total - 1
+            else:
+                start = int(start_s)
+                end = min(total - 1, int(end_s)) if end_s else total - 1
+            if start >= total:
+                self._count("GetObject")
+                raise _client_error("InvalidRange", "The requested range is not satisfiable", "GetObject", 416)
+            data = data[start:end + 1]
+            resp["ContentRange"] = f"bytes {start}-{end}/{total}"
+        resp["Body"] = _Body(data)
+        resp["ContentLength"] = len(data)
+        self._count("GetObject", bytes_in=len(data))
+        return resp
+
+    def put_object(self, Bucket: str, Key: str, Body=b"", **kwargs) -> Dict:
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(Body)
+        self._etags.pop(f"{Bucket}/{Key}", None)
+        keys = self._bucket_keys(Bucket)
+        with self._keys_lock:
+            i = bisect.bisect_left(keys, Key)
+            if i >= len(keys) or keys[i] != Key:
+                keys.insert(i, Key)
+        self._count("PutObject", bytes_out=len(Body))
+        return {"ETag": self._etag(Body)}
+
+    def delete_objects(self, Bucket: str, Delete: Dict, **kwargs) -> Dict:
+        deleted = []
+        keys = self._bucket_keys(Bucket)
+        for obj in Delete.get("Objects", []):
+            key = obj["Key"]
+            try:
+                os.remove(self._path(Bucket, key))
+            except FileNotFoundError:
+                pass
+            self._etags.pop(f"{Bucket}/{key}", None)
+            with self._keys_lock:
+                i = bisect.bisect_left(keys, key)
+                if i < len(keys) and keys[i] == key:
+                    del keys[i]
+            deleted.append({"Key": key})
+        self._count("DeleteObjects")
+        return {} if Delete.get("Quiet") else {"Deleted": deleted}
+
+class _ListPaginator:
+    def __init__(self, client: FilesystemS3):
+        self.client = client
+
+    def paginate(self, PaginationConfig: Dict = None, **kwargs):
+        config = PaginationConfig or {}
+        max_items = config.get("MaxItems")
+        page_size = config.get("PageSize", 1000)
+        seen = 0
+        token = None
+        while True:
+            params = dict(kwargs, MaxKeys=page_size)
+            if token:
+                params["ContinuationToken"] = token
+            page = self.client.list_objects_v2(**params)
+            if max_items is not None and "Contents" in page:
+                page["Contents"] = page["Contents"][:max(0, max_items - seen)]
+            seen += len(page.get("Contents", []))
+            yield page
+            if not page.get("IsTruncated") or (max_items is not None and seen >= max_items):
+                return
+            token = page["NextContinuationToken"]
+
+# ===== Bedrock =====
+_SENSOR_WORDS = ("온도", "습도", "공기질", "가스", "이산화탄소", "더운", "추운", "co2", "ppm", "temp", "hum")
+
+class StubBedrock(_CallCounter):
+    """Claude 응답 대역"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        super().__init__("bedrock-runtime", latency_ms)
+        self._cached_prefixes = set()
+
+    def _usage(self, payload: Dict, raw: bytes) -> Dict:
+        """프롬프트 캐시 흉내: cache_control이 붙은 system 블록까지를 접두어로 보고 두 번째부터 캐시 읽기"""
+        system = payload.get("system")
+        blocks = system if isinstance(system, list) else []
+        prefix, cached = "", 0
+        for block in blocks:
+            prefix += block.get("text", "")
+            if block.get("cache_control"):
+                cached = len(prefix.encode("utf-8")) // 4
+        usage = {"input_tokens": len(raw) // 4 - cached, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        if cached:
+            hit = prefix in self._cached_prefixes
+            self._cached_prefixes.add(prefix)
+            usage["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = cached
+        return usage
+
+    @staticmethod
+    def _prompt_text(payload: Dict) -> str:
+        parts = []
+        for msg in payload.get("messages", []):
+            content = msg.get("content")
+            if isinstance(content, str):
+                parts.append(content)
+            elif isinstance(content, list):
+                parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+        return "\n".join(parts)
+
+    def _answer(self, prompt: str) -> str:
+        if "You are a router" in prompt:
+            query = prompt.rsplit("query:", 1)[-1].lower()
+            if any(w in query for w in _SENSOR_WORDS):
+                return json.dumps({"domain": "sensor_data", "confidence": 0.9})
+            return json.dumps({"domain": "general", "confidence": 0.9})
+        return "벤치마크용 고정 답변입니다. 요청하신 내용을 요약했습니다."
+
+    def invoke_model(self, modelId: str = None, body=None, **kwargs) -> Dict:
+        raw = body.encode("utf-8") if isinstance(body, str) else (body or b"{}")
+        payload = json.loads(raw)
+        text = self._answer(self._prompt_text(payload))
+        out = json.dumps({
+            "id": "msg_bench",
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {**self._usage(payload, raw), "output_tokens": len(text) // 2},
+        }, ensure_ascii=False).encode("utf-8")
+        self._count("InvokeModel", bytes_in=len(out), bytes_out=len(raw))
+        return {"body": _Body(out), "contentType": "application/json"}
+
+    def invoke_model_with_response_stream(self, modelId: str = None, body=None, **kwargs) -> Dict:
+        """Anthropic 스트림 이벤트 순서 그대로, 지연의 1/4 뒤 첫 조각 → 나머지를 조각 사이에 나눠 전송"""
+        raw = body.encode("utf-8") if isinstance(body, str) else (body or b"{}")
+        payload = json.loads(raw)
+        text = self._answer(self._prompt_text(payload))
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+        events = [{"type": "message_start", "message": {"id": "msg_bench", "role": "assistant",
+                                                        "usage": {**self._usage(payload, raw), "output_tokens": 0}}},
+                  {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": p}} for p in pieces]
+        events += [{"type": "content_block_stop", "index": 0},
+                   {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": len(text) // 2}},
+                   {"type": "message_stop", "amazon-bedrock-invocationMetrics": {"inputTokenCount": len(raw) // 4,
+                                                                               "outputTokenCount": len(text) // 2}}]
+        self._count("InvokeModelWithResponseStream", bytes_in=len(text.encode("utf-8")), bytes_out=len(raw), sleep=False)
+
+        latency = self.latency_ms / 1000.0
+
+        def _events():
+            if latency:
+                time.sleep(latency * 0.25)
+            for ev in events:
+                if latency and ev["type"] == "content_block_delta":
+                    time.sleep(latency * 0.75 / len(pieces))
+                yield {"chunk": {"bytes": json.dumps(ev, ensure_ascii=False).encode("utf-8")}}
+
+        return {"body": _events(), "contentType": "application/json"}
+
+# ===== boto3 바꿔치기 =====
+_INSTALLED: Optional[Dict] = None
+
+def install(data_root: str, s3_latency_ms: float = 0.0, llm_latency_ms: float = 0.0) -> Dict:
+    """boto3.client가 대역을 돌려주도록 교체, {"s3": FilesystemS3, "bedrock": StubBedrock} 반환"""
+    global _INSTALLED
+    import boto3
+
+    fakes = {"s3": FilesystemS3(data_root, s3_latency_ms), "bedrock": StubBedrock(llm_latency_ms)}
+
+    def _client(service_name, *args, **kwargs):
+        if service_name == "s3":
+            return fakes["s3"]
+        if service_name == "bedrock-runtime":
+            return fakes["bedrock"]
+        raise RuntimeError(f"벤치마크 대역이 없는 서비스: {service_name}")
+
+    boto3.client = _client
+    try:
+        import aws_clients
+        aws_clients.reset()  # 이미 만들어진 공용 클라이언트가 있으면 대역으로 다시 생성되게
+    except ImportError:
+        pass
+    _INSTALLED = fakes
+    return fakes
@@ -0,0 +1,251 @@
+"""
+오프라인 챗봇 벤치마크
+합성 데이터(파일시스템 S3 대역) + Bedrock 대역으로 질의 코퍼스를 돌리고
+질의 유형별 지연 시간 백분위수와 S3/Bedrock 호출 수를 보고한다.
+
+  cd aws2-api/python-scripts
+  python benchmarks/run_benchmark.py                       # 기본: 30일 데이터, 3회 반복
+  python benchmarks/run_benchmark.py --repeat 5 --s3-latency-ms 20 --json-out bench.json
+  python benchmarks/run_benchmark.py --classes daily_avg,extrema
+  python benchmarks/run_benchmark.py --stream --llm-latency-ms 800   # 스트리밍 첫 조각 지연(ttft) 측정
+
+첫 반복(cold)은 빈 로컬 캐시에서 시작하고, 이후 반복(warm)은 같은 프로세스/캐시를 재사용한다.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+RECOMMEND_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "recommend-bot-python")
+for _p in (SCRIPTS_DIR, BENCH_DIR):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+import synth_data
+import fake_aws
+
+S3_OPS = ("ListObjectsV2", "HeadObject", "GetObject", "PutObject", "DeleteObjects")
+
+def percentile(values: List[float], p: float) -> float:
+    """nearest-rank 백분위수"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+def ensure_data(root: str, days: int, raw_interval: int, regen: bool, max_age_hours: float) -> Dict:
+    """합성 데이터가 없거나 오래됐으면 다시 생성 (상대 시간 질의가 데이터 끝 기준으로 맞도록)"""
+    marker = synth_data.load_marker(root)
+    stale = True
+    if marker and not regen and marker.get("days") == days and marker.get("raw_interval_sec") == raw_interval:
+        end = datetime.fromisoformat(marker["end"])
+        stale = synth_data.datetime.now(synth_data.KST).replace(tzinfo=None) - end > timedelta(hours=max_age_hours)
+    if not stale:
+        return marker
+    if os.path.exists(os.path.join(root, synth_data.BUCKET)):
+        import shutil
+        shutil.rmtree(os.path.join(root, synth_data.BUCKET))
+    print(f"합성 데이터 생성 중: {root} ({days}일, 원시 {raw_interval}초 간격)...", file=sys.stderr)
+    t0 = time.perf_counter()
+    info = synth_data.generate(root, days=days, raw_interval_sec=raw_interval)
+    print(f"  완료 {time.perf_counter() - t0:.1f}s: {info['counts']}", file=sys.stderr)
+    return info
+
+def load_corpus(path: str, data_end: datetime, classes=None) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)["queries"]
+    d1, d2 = data_end - timedelta(days=1), data_end - timedelta(days=2)
+    fields = {
+        "m1": d1.month, "d1": d1.day, "y1": d1.year, "mm1": f"{d1.month:02d}", "dd1": f"{d1.day:02d}",
+        "m2": d2.month, "d2": d2.day,
+    }
+    out = []
+    for item in corpus:
+        if classes and item["class"] not in classes:
+            continue
+        out.append(dict(item, query=item["query"].format(**fields)))
+    return out
+
+def run(args) -> Dict:
+    info = ensure_data(args.data_dir, args.days, args.raw_interval, args.regen, args.max_age_hours)
+    data_end = datetime.fromisoformat(info["end"])
+
+    # 로컬 캐시는 chatbot import 전에 지정 (기본: 실행마다 새 임시 디렉터리 = cold 시작)
+    os.environ["AIRWATCH_CACHE_DIR"] = args.cache_dir or tempfile.mkdtemp(prefix="airwatch-bench-cache-")
+    fakes = fake_aws.install(args.data_dir, s3_latency_ms=args.s3_latency_ms, llm_latency_ms=args.llm_latency_ms)
+
+    with contextlib.redirect_stdout(sys.stderr if args.verbose else open(os.devnull, "w")):
+        import api_wrapper
+        import chatbot  # noqa: F401
+        sys.path.insert(0, RECOMMEND_DIR)
+        import recommendbot
+
+    corpus = load_corpus(args.corpus, data_end, set(args.classes.split(",")) if args.classes else None)
+    records = []
+    run_id = f"{datetime.now():%H%M%S}-{os.getpid()}"  # 이전 실행의 대화 로그(chatlog)와 섞이지 않도록
+    sink = sys.stderr if args.verbose else open(os.devnull, "w")
+
+    for iteration in range(args.repeat):
+        for i, item in enumerate(corpus):
+            s3_before = fakes["s3"].snapshot()
+            llm_before = fakes["bedrock"].snapshot()
+            session_id = f"bench-{run_id}-{iteration}-{item.get('session', i)}"
+            t0 = time.perf_counter()
+            route, stages, error, answer_cache, prompt_cache = None, {}, None, None, None
+            trace_calls = None
+            first_token = []
+
+            def _on_delta(_text):
+                if not first_token:
+                    first_token.append(time.perf_counter())
+
+            def _on_frame(frame):
+                if frame.get("type") == "delta":
+                    _on_delta(frame.get("text"))
+
+            with contextlib.redirect_stdout(sink):
+                try:
+                    if item["target"] == "recommend":
+                        recommendbot.answer_query(item["query"], on_delta=_on_delta if args.stream else None)
+                        route = "recommend"
+                    else:
+                        if args.stream:
+                            result = api_wrapper.stream_chatbot_query(item["query"], session_id, trace=True, write_frame=_on_frame)
+                        else:
+                            result = api_wrapper.process_chatbot_query(item["query"], session_id, trace=True)
+                        route = result.get("route")
+                        stages = (result.get("trace") or {}).get("stages", {})
+                        if result.get("trace"):
+                            trace_calls = result["trace"].get("calls", {}).get("s3", {})
+                        answer_cache = result.get("answer_cache")
+                        prompt_cache = result.get("prompt_cache")
+                        error = result.get("error")
+                except Exception as e:
+                    route, error = "exception", str(e)
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            s3_after = fakes["s3"].snapshot()
+            llm_after = fakes["bedrock"].snapshot()
+            records.append({
+                "iteration": iteration,
+                "class": item["class"],
+                "query": item["query"],
+                "route": route,
+                "error": error,
+                "answer_cache": answer_cache,
+                "prompt_cache": prompt_cache,
+                "latency_ms": round(elapsed_ms, 2),
+                "ttft_ms": round((first_token[0] - t0) * 1000.0, 2) if first_token else None,
+                # 요청 추적이 있으면 그 집계 사용 (대역 카운터 차이에는 백그라운드 스레드의 LIST/PUT도 섞임)
+                "s3": ({op: trace_calls.get(op, {}).get("count", 0) for op in S3_OPS} if trace_calls is not None
+                       else {op: s3_after.get(op, 0) - s3_before.get(op, 0) for op in S3_OPS}),
+                "bedrock": sum(llm_after.values()) - sum(llm_before.values()),
+                "stages": stages,
+            })
+    return {"data": info, "records": records, "config": {k: v for k, v in vars(args).items()}}
+
+def _prompt_cache_summary(items: List[Dict]) -> Dict:
+    """답변 LLM 호출의 프롬프트 캐시 적중 수와 질의당 평균 토큰 (캐시 읽기/쓰기/나머지 입력)"""
+    usages = [r["prompt_cache"] for r in items if r.get("prompt_cache")]
+    n = len(usages) or 1
+    return {
+        "prompt_cache_calls": len(usages),
+        "prompt_cache_hits": sum(1 for u in usages if u["status"] == "hit"),
+        "cache_read_tokens": sum(u["cache_read_input_tokens"] for u in usages) / n,
+        "cache_write_tokens": sum(u["cache_creation_input_tokens"] for u in usages) / n,
+        "uncached_input_tokens": sum(u["input_tokens"] for u in usages) / n,
+    }
+
+def summarize(records: List[Dict]) -> List[Dict]:
+    by_class = defaultdict(list)
+    for r in records:
+        by_class[r["class"]].append(r)
+    rows = []
+    for cls, items in by_class.items():
+        lat = [r["latency_ms"] for r in items]
+        ttft = [r["ttft_ms"] for r in items if r.get("ttft_ms") is not None]
+        cold = [r for r in items if r["iteration"] == 0]
+        warm = [r for r in items if r["iteration"] > 0]
+        def mean_s3(rs, op=None):
+            if not rs:
+                return 0.0
+            return sum((r["s3"][op] if op else sum(r["s3"].values())) for r in rs) / len(rs)
+        rows.append({
+            "class": cls,
+            "n": len(items),
+            "p50_ms": percentile(lat, 50),
+            "p90_ms": percentile(lat, 90),
+            "p99_ms": percentile(lat, 99),
+            "max_ms": max(lat),
+            "ttft_p50_ms": percentile(ttft, 50) if ttft else None,
+            **{op: mean_s3(items, op) for op in S3_OPS},
+            "cold_s3": mean_s3(cold),
+            "warm_s3": mean_s3(warm),
+            "bedrock": sum(r["bedrock"] for r in items) / len(items),
+            "errors": sum(1 for r in items if r["error"] or r["route"] in ("error", "exception")),
+            **_prompt_cache_summary(items),
+        })
+    return sorted(rows, key=lambda r: r["class"])
+
+def print_table(rows: List[Dict]):
+    header = f"{'class':<10} {'n':>3} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} | {'LIST':>6} {'HEAD':>6} {'GET':>7} {'PUT':>5} | {'cold':>7} {'warm':>7} | {'LLM':>4} {'err':>3}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['class']:<10} {r['n']:>3} {r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} | "
+              f"{r['ListObjectsV2']:>6.1f} {r['HeadObject']:>6.1f} {r['GetObject']:>7.1f} {r['PutObject']:>5.1f} | "
+              f"{r['cold_s3']:>7.1f} {r['warm_s3']:>7.1f} | {r['bedrock']:>4.1f} {r['errors']:>3}")
+    print("(지연: ms, S3/LLM: 질의당 평균 호출 수, cold/warm: 첫 반복/이후 반복의 질의당 S3 요청 수)")
+    if any(r.get("prompt_cache_calls") for r in rows):
+        print()
+        print(f"{'class':<10} {'hit/calls':>10} {'read':>7} {'write':>7} {'input':>7}")
+        for r in rows:
+            if r.get("prompt_cache_calls"):
+                print(f"{r['class']:<10} {r['prompt_cache_hits']:>4}/{r['prompt_cache_calls']:<5} "
+                      f"{r['cache_read_tokens']:>7.0f} {r['cache_write_tokens']:>7.0f} {r['uncached_input_tokens']:>7.0f}")
+        print("(프롬프트 캐시: 답변 호출 중 캐시 적중 수, 호출당 평균 입력 토큰 - 캐시 읽기/쓰기/나머지)")
+    if any(r.get("ttft_p50_ms") is not None for r in rows):
+        print()
+        print(f"{'class':<10} {'ttft p50':>9} {'total p50':>10}")
+        for r in rows:
+            if r.get("ttft_p50_ms") is not None:
+                print(f"{r['class']:<10} {r['ttft_p50_ms']:>9.1f} {r['p50_ms']:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="오프라인 챗봇 벤치마크")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "airwatch-bench-data"))
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--raw-interval", type=int, default=60, help="합성 원시 데이터 간격(초)")
+    parser.add_argument("--regen", action="store_true", help="합성 데이터 강제 재생성")
+    parser.add_argument("--max-age-hours", type=float, default=12.0, help="데이터 끝 시각이 이보다 오래되면 재생성")
+    parser.add_argument("--cache-dir", help="로컬 캐시 디렉터리 (기본: 실행마다 새 임시 디렉터리)")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "queries.json"))
+    parser.add_argument("--classes", help="쉼표로 구분한 질의 유형만 실행")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--s3-latency-ms", type=float, default=0.0, help="S3 요청당 인위적 지연")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Bedrock 호출당 인위적 지연")
+    parser.add_argument("--stream", action="store_true", help="스트리밍 경로로 실행하고 첫 조각까지 지연(ttft) 기록")
+    parser.add_argument("--json-out", help="요약 + 질의별 기록을 JSON으로 저장")
+    parser.add_argument("--verbose", action="store_true", help="챗봇 출력을 stderr로 표시")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    rows = summarize(result["records"])
+    print_table(rows)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"summary": rows, **result}, f, ensure_ascii=False, indent=2, default=str)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
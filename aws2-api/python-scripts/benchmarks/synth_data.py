@@ -0,0 +1,122 @@
+"""
+벤치마크용 합성 센서 데이터 생성
+실제 버킷 키 구조 그대로 <root>/aws2-airwatch-data/ 아래에 파일을 만든다.
+
+  minavg/YYYY/MM/DD/HH/YYYYMMDDHHMM_minavg.json      {"timestamp", "mintemp", "minhum", "mingas"}
+  mintrend/YYYY/MM/DD/HH/YYYYMMDDHHMM_mintrend.json  {"timestamp", "data": {...minavg 필드}}
+  houravg/YYYY/MM/DD/HH/YYYYMMDDHH_houravg.json      {"timestamp", "hourtemp", "hourhum", "hourgas"}
+  hourtrend/YYYY/MM/DD/HH/YYYYMMDDHH_hourtrend.json  {"timestamp", "averages", "hourly_ranges", "trends"}
+  sensor/date_data/YYYYMMDD/YYYYMMDDHHMMSS_rawdata.json  {"timestamp", "temperature", "humidity", "gas"}
+
+  python benchmarks/synth_data.py --root /tmp/airwatch-bench --days 30
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+BUCKET = "aws2-airwatch-data"
+KST = timezone(timedelta(hours=9))
+MARKER = "_synth.json"
+
+def reading(dt: datetime, rng: random.Random) -> Dict[str, float]:
+    """하루 주기 + 잡음이 있는 온도/습도/가스 값"""
+    day_phase = 2 * math.pi * ((dt.hour * 60 + dt.minute) / 1440.0 - 9 / 24.0)
+    week_phase = 2 * math.pi * (dt.timetuple().tm_yday % 7) / 7.0
+    temp = 24.0 + 3.0 * math.sin(day_phase) + 0.8 * math.sin(week_phase) + rng.gauss(0, 0.3)
+    hum = 55.0 - 8.0 * math.sin(day_phase) + rng.gauss(0, 1.0)
+    gas = 650.0 + 180.0 * max(0.0, math.sin(day_phase + 0.5)) + rng.gauss(0, 25.0)
+    return {"temperature": round(temp, 2), "humidity": round(hum, 2), "gas": round(gas, 2)}
+
+def _write(root: str, key: str, payload):
+    path = os.path.join(root, BUCKET, *key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+def generate(root: str, end: datetime = None, days: int = 30, raw_interval_sec: int = 60, seed: int = 42) -> Dict:
+    """
+    end(KST naive, 기본: 현재 분) 이전 days일치 데이터 생성
+    반환: 생성 정보 (marker 파일에도 기록)
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.now(KST).replace(tzinfo=None)).replace(second=0, microsecond=0)
+    start = (end - timedelta(days=days)).replace(minute=0)
+    counts = {"minavg": 0, "mintrend": 0, "houravg": 0, "hourtrend": 0, "rawdata": 0}
+
+    # 원시 데이터 (raw_interval_sec 간격)
+    raw_dt = start
+    while raw_dt <= end:
+        v = reading(raw_dt, rng)
+        _write(root, f"sensor/date_data/{raw_dt:%Y%m%d}/{raw_dt:%Y%m%d%H%M%S}_rawdata.json",
+               {"timestamp": raw_dt.isoformat(), **v})
+        counts["rawdata"] += 1
+        raw_dt += timedelta(seconds=raw_interval_sec)
+
+    hour = start
+    while hour <= end:
+        hour_values = []
+        for minute in range(60):
+            dt = hour + timedelta(minutes=minute)
+            if dt > end:
+                break
+            v = reading(dt, rng)
+            hour_values.append(v)
+            minavg = {"timestamp": dt.isoformat(), "mintemp": v["temperature"], "minhum": v["humidity"], "mingas": v["gas"]}
+            _write(root, f"minavg/{dt:%Y/%m/%d/%H}/{dt:%Y%m%d%H%M}_minavg.json", minavg)
+            _write(root, f"mintrend/{dt:%Y/%m/%d/%H}/{dt:%Y%m%d%H%M}_mintrend.json",
+                   {"timestamp": dt.isoformat(), "data": minavg})
+            counts["minavg"] += 1
+            counts["mintrend"] += 1
+
+        if hour_values and hour + timedelta(hours=1) <= end:
+            avg = {m: round(sum(v[m] for v in hour_values) / len(hour_values), 2) for m in ("temperature", "humidity", "gas")}
+            _write(root, f"houravg/{hour:%Y/%m/%d/%H}/{hour:%Y%m%d%H}_houravg.json", {
+                "timestamp": hour.isoformat(),
+                "hourtemp": avg["temperature"], "hourhum": avg["humidity"], "hourgas": avg["gas"],
+            })
+            _write(root, f"hourtrend/{hour:%Y/%m/%d/%H}/{hour:%Y%m%d%H}_hourtrend.json", {
+                "timestamp": hour.isoformat(),
+                "averages": avg,
+                "hourly_ranges": {
+                    m: {"min": min(v[m] for v in hour_values), "max": max(v[m] for v in hour_values)}
+                    for m in ("temperature", "humidity", "gas")
+                },
+                "trends": {m: round(hour_values[-1][m] - hour_values[0][m], 2) for m in ("temperature", "humidity", "gas")},
+            })
+            counts["houravg"] += 1
+            counts["hourtrend"] += 1
+        hour += timedelta(hours=1)
+
+    info = {"start": start.isoformat(), "end": end.isoformat(), "days": days,
+            "raw_interval_sec": raw_interval_sec, "seed": seed, "counts": counts}
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, MARKER), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    return info
+
+def load_marker(root: str):
+    path = os.path.join(root, MARKER)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="벤치마크용 합성 센서 데이터 생성")
+    parser.add_argument("--root", required=True, help="데이터 루트 디렉터리 (버킷 폴더가 그 아래 생성됨)")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--raw-interval", type=int, default=60, help="원시 데이터 간격(초)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    info = generate(args.root, days=args.days, raw_interval_sec=args.raw_interval, seed=args.seed)
+    print(json.dumps(info, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,15 +2,39 @@ import re
 import time
 import json
 import uuid
-import boto3
 import traceback
 import os
+import math
 from datetime import datetime as datetime_cls
 from datetime import datetime, timedelta, timezone
 from functools import lru_cache
 import concurrent.futures as _f
 from typing import Optional, List, Dict, Tuple
 import sys
+import queue
+import tempfile
+import threading
+
+from sensor_index import SensorKeyIndex
+from key_seek import KeySeeker
+from sensor_cache import SensorObjectCache, seal_clock, MINUTE_SEAL_GRACE, HOUR_SEAL_GRACE
+from daily_rollup import DailyRollupStore, HOUR_DATA_NAMES
+from daily_extrema import DailyExtremaStore, ReadBudgetExceeded
+from bedrock_stream import invoke_claude_stream
+from answer_cache import AnswerCache
+from session_journal import SessionJournal
+from write_behind import WriteBehindQueue
+from intent_classifier import IntentClassifier, DEFAULT_MODEL_PATH as DEFAULT_INTENT_MODEL_PATH
+from range_engine import RangeSeries, build_series, summarize as summarize_series, format_summary
+from minute_store import MinuteStore
+from history_window import HistoryWindow
+from latest_reading import minavg_key
+from tail_reader import last_json_record
+from minute_bitmap import PresenceBitmaps, format_gaps
+from retrieval_planner import RetrievalPlanner, RetrievalPlan
+from topk_scan import stream_top_k
+import request_trace
+import aws_clients
 
 # ===== 설정 =====
 REGION = "ap-northeast-2"
@@ -26,15 +50,45 @@ _RANGE_HINTS = ("구간", "최근", "처음", "첫", "마지막", "최종")
 
 # S3 채팅로그 저장
 CHATLOG_PREFIX = "chatlog/"  # S3 키 prefix
+CHATLOG_JOURNAL_PREFIX = "chatlog_journal/"  # 세션 저널 레코드 prefix (턴마다 추가)
+SESSION_COMPACT_EVERY = 20  # 저널 레코드가 이만큼 쌓이면 그 턴은 레코드 대신 스냅샷을 쓰고 접힌 레코드 정리
 
 # RAG/검색
 TOP_K = 8
 LIMIT_CONTEXT_CHARS = 100000
 MAX_FILES_TO_SCAN = 100000
 MAX_WORKERS = 10
+SCAN_MAX_IN_FLIGHT = MAX_WORKERS * 2  # 일반 문서 스캔의 동시 다운로드 상한 (후보 키 전체를 한꺼번에 제출하지 않음)
+AWS_MAX_POOL_CONNECTIONS = MAX_WORKERS * 3 + 2  # 검색/조회/극값 실행기가 동시에 돌 수 있음 + 쓰기 지연 큐/인덱스 빌드
 MAX_FILE_SIZE = 1024 * 1024  # 1MB
 RELEVANCE_THRESHOLD = 1  # 더 관대한 임계값으로 조정
 
+# 로컬 캐시 디렉터리 (키 인덱스 스냅샷 등)
+LOCAL_CACHE_DIR = os.environ.get("AIRWATCH_CACHE_DIR", os.path.join(tempfile.gettempdir(), "airwatch-cache"))
+SENSOR_INDEX_REFRESH_SEC = 60  # 키 인덱스 증분 갱신 주기
+PRESENCE_BITMAP_PATH = os.path.join(LOCAL_CACHE_DIR, "presence_bitmap.json")  # 날짜별 minavg/houravg 존재 비트맵
+SENSOR_CACHE_MEMORY_MB = 64     # 센서 객체 메모리 LRU 상한
+SENSOR_CACHE_DISK_MB = 512      # 센서 객체 디스크 캐시 상한
+SENSOR_CACHE_OPEN_TTL_SEC = 30  # 아직 열린 현재 분/시 객체 TTL
+TRACE_DIR = os.environ.get("AIRWATCH_TRACE_DIR", os.path.join(LOCAL_CACHE_DIR, "traces"))  # 요청 추적 파일
+ENABLE_ANSWER_CACHE = os.environ.get("AIRWATCH_ANSWER_CACHE", "1").lower() not in ("0", "false", "no")
+ANSWER_CACHE_DISK_MB = 64                      # 답변 캐시 디스크 상한
+ANSWER_CACHE_SEALED_TTL_SEC = 7 * 24 * 3600    # 지난(봉인된) 구간 답변 TTL
+ANSWER_CACHE_OPEN_TTL_SEC = 300                # 아직 열린 구간 답변 TTL (컨텍스트 digest 일치 시에만 사용)
+ENABLE_WRITE_BEHIND = os.environ.get("AIRWATCH_WRITE_BEHIND", "1").lower() not in ("0", "false", "no")  # 채팅 로그/세션 PUT을 백그라운드로 (오래 사는 워커 모드용, api_wrapper 단발 모드는 끔)
+WRITE_BEHIND_SPOOL_PATH = os.path.join(LOCAL_CACHE_DIR, "s3_write_spool.jsonl")  # 종료 시 못 보낸 쓰기 보관 (다음 시작 시 재전송)
+INTENT_MODEL_PATH = os.environ.get("AIRWATCH_INTENT_MODEL", DEFAULT_INTENT_MODEL_PATH)  # 로컬 라우팅 모델 (intent_classifier.py train)
+LOCAL_ROUTER_MIN_CONFIDENCE = float(os.environ.get("AIRWATCH_LOCAL_ROUTER_MIN_CONF", "0.85"))  # 이보다 낮으면 Bedrock 라우터 사용
+RANGE_MINUTE_MAX_HOURS = 6  # 구간 집계: 이보다 긴 구간은 분 평균 대신 시간 평균(houravg)으로
+RANGE_MAX_DAYS = 31         # 구간 집계 최대 길이 (넘으면 기존 경로)
+RANGE_STORE_MAX_HOURS = 48  # 분 컬럼 저장소에 있는 날짜면 이 길이까지는 분 단위로 집계
+MINUTE_STORE_DIR = os.path.join(LOCAL_CACHE_DIR, "minute_store")  # minavg 일별 컬럼 파일 (minute_store.py compact)
+MINUTE_STORE_REMOTE_PREFIX = f"{S3_PREFIX}minute_store/"  # 데이터 버킷에 업로드된 컬럼 파일 위치
+ENABLE_PROMPT_CACHE = os.environ.get("AIRWATCH_PROMPT_CACHE", "1").lower() not in ("0", "false", "no")  # 고정 지침(system)에 Bedrock 프롬프트 캐시 표시
+MINUTE_STORE_FETCH_REMOTE = os.environ.get("AIRWATCH_MINUTE_STORE_REMOTE", "0").lower() in ("1", "true", "yes")  # 로컬에 없으면 업로드본 사용
+RETRIEVAL_BUDGET_LIST = int(os.environ.get("AIRWATCH_BUDGET_LIST", "40"))   # 요청당 예상 S3 LIST 상한 (넘으면 검색 계획을 더 싼 대안으로)
+RETRIEVAL_BUDGET_GET = int(os.environ.get("AIRWATCH_BUDGET_GET", "800"))    # 요청당 예상 S3 GET 상한
+
 # 필드 동의어/라벨
 FIELD_SYNONYMS = {
     "온도": "temperature", "temp": "temperature", "temperature": "temperature",
@@ -48,9 +102,266 @@ FIELD_NAME_KOR = {"temperature": "온도", "humidity": "습도", "gas": "이산
 INFERENCE_PROFILE_ARN = "arn:aws:bedrock:ap-northeast-2:070561229682:inference-profile/apac.anthropic.claude-sonnet-4-20250514-v1:0"
 
 # ===== 클라이언트 =====
-s3 = boto3.client("s3", region_name=REGION)           # 데이터 접근용
-s3_logs = boto3.client("s3", region_name=REGION)      # 로그 저장용 (동일 리전)
-bedrock_rt = boto3.client("bedrock-runtime", region_name=REGION)
+request_trace.install_boto3_hooks()  # 요청 추적용 S3/Bedrock 호출 집계 훅 (추적 요청에서만 동작)
+# 공용 레지스트리의 지연 클라이언트: 첫 호출 때 생성, 풀 크기는 워커 수에 맞춤, adaptive 재시도
+aws_clients.configure(max_pool_connections=AWS_MAX_POOL_CONNECTIONS)
+s3 = aws_clients.lazy_client("s3", REGION)           # 데이터 접근용
+s3_logs = s3                                          # 로그 저장용 (동일 리전 → 같은 클라이언트/커넥션 풀)
+bedrock_rt = aws_clients.lazy_client("bedrock-runtime", REGION)
+
+# ===== 센서 키 인덱스 (시간순 키 목록, 지연 생성) =====
+_SENSOR_INDEX: Optional[SensorKeyIndex] = None
+
+def get_sensor_index() -> SensorKeyIndex:
+    global _SENSOR_INDEX
+    if _SENSOR_INDEX is None:
+        _SENSOR_INDEX = SensorKeyIndex(
+            s3, S3_BUCKET_DATA, prefix=S3_PREFIX,
+            snapshot_path=os.path.join(LOCAL_CACHE_DIR, "sensor_key_index.json"),
+            refresh_interval=SENSOR_INDEX_REFRESH_SEC,
+        )
+    return _SENSOR_INDEX
+
+# ===== 키 이웃 탐색 (인덱스가 아직 없을 때 StartAfter/폴더 단계 LIST 몇 번으로 조회) =====
+_KEY_SEEKER: Optional[KeySeeker] = None
+_INDEX_WARMING = set()  # 백그라운드 빌드가 대기 중/진행 중이거나 끝난 패밀리 (실패하면 제거 → 다음 요청이 다시 시도)
+_INDEX_WARMING_LOCK = threading.Lock()
+_INDEX_BUILD_QUEUE: "queue.Queue[str]" = queue.Queue()
+_INDEX_BUILDER: Optional[threading.Thread] = None
+
+def get_key_seeker() -> KeySeeker:
+    global _KEY_SEEKER
+    if _KEY_SEEKER is None:
+        _KEY_SEEKER = KeySeeker(s3, S3_BUCKET_DATA)
+    return _KEY_SEEKER
+
+# ===== 데이터 존재 비트맵 (날짜별 분/시 존재 여부, 키 인덱스에서 갱신, 지연 생성) =====
+_PRESENCE_BITMAPS: Optional[PresenceBitmaps] = None
+
+def get_presence_bitmaps() -> PresenceBitmaps:
+    global _PRESENCE_BITMAPS
+    if _PRESENCE_BITMAPS is None:
+        _PRESENCE_BITMAPS = PresenceBitmaps(get_sensor_index(), PRESENCE_BITMAP_PATH, prefix=S3_PREFIX)
+    return _PRESENCE_BITMAPS
+
+def _family_neighbors(family: str, target_time: datetime, max_hours: int = None):
+    """
+    패밀리에서 target_time의 (floor, ceil) 이웃
+    키 인덱스가 이미 있으면(빌드됨/스냅샷) 메모리 bisect,
+    없으면 저장된 존재 비트맵, 그것도 모르는 구간이면 전체 LIST 대신 키 탐색
+    """
+    index = get_sensor_index()
+    bitmaps = get_presence_bitmaps()
+    if index.is_warm(family):
+        hit = index.neighbors(family, target_time)
+        bitmaps.refresh(family)
+        return hit
+    _warm_index_in_background(family)
+    hit = bitmaps.neighbors(family, target_time)
+    if hit is not None:
+        return hit
+    # 시 폴더 거리로 max_hours를 자르므로 여유 1시간
+    max_distance = timedelta(hours=max_hours + 1) if max_hours is not None else None
+    return get_key_seeker().neighbors(f"{S3_PREFIX}{family}/", target_time, max_distance)
+
+def _warm_index_in_background(family: str):
+    """
+    이번 요청은 키 탐색으로 처리하고, 이후 요청을 위해 인덱스는 백그라운드에서 빌드
+    전용 데몬 스레드 하나가 패밀리를 차례로 빌드 (요청 경로의 조회 실행기를 차지하지 않고,
+    단발 프로세스가 전체 LIST가 끝날 때까지 종료를 기다리지도 않음)
+    """
+    global _INDEX_BUILDER
+    with _INDEX_WARMING_LOCK:
+        if family in _INDEX_WARMING:
+            return
+        _INDEX_WARMING.add(family)
+        if _INDEX_BUILDER is None or not _INDEX_BUILDER.is_alive():
+            _INDEX_BUILDER = threading.Thread(target=_index_builder_loop, name="sensor-index-builder", daemon=True)
+            _INDEX_BUILDER.start()
+    _INDEX_BUILD_QUEUE.put(family)
+
+def _index_builder_loop():
+    while True:
+        family = _INDEX_BUILD_QUEUE.get()
+        try:
+            get_sensor_index().refresh(family)
+            get_presence_bitmaps().refresh(family)
+        except Exception as e:
+            print(f"[경고] 키 인덱스 백그라운드 빌드 실패 ({family}): {e}")
+            with _INDEX_WARMING_LOCK:
+                _INDEX_WARMING.discard(family)
+
+# ===== 센서 객체 캐시 (메모리 LRU + 디스크, 지연 생성) =====
+_SENSOR_CACHE: Optional[SensorObjectCache] = None
+
+def get_object_cache() -> SensorObjectCache:
+    global _SENSOR_CACHE
+    if _SENSOR_CACHE is None:
+        _SENSOR_CACHE = SensorObjectCache(
+            s3, S3_BUCKET_DATA, prefix=S3_PREFIX,
+            cache_dir=os.path.join(LOCAL_CACHE_DIR, "objects"),
+            max_memory_bytes=SENSOR_CACHE_MEMORY_MB * 1024 * 1024,
+            max_disk_bytes=SENSOR_CACHE_DISK_MB * 1024 * 1024,
+            open_ttl=SENSOR_CACHE_OPEN_TTL_SEC,
+        )
+    return _SENSOR_CACHE
+
+# ===== 분 컬럼 저장소 (압축된 날짜의 minavg를 mmap 슬라이스로, 지연 생성) =====
+_MINUTE_STORE: Optional[MinuteStore] = None
+
+def get_minute_store() -> MinuteStore:
+    global _MINUTE_STORE
+    if _MINUTE_STORE is None:
+        _MINUTE_STORE = MinuteStore(MINUTE_STORE_DIR, s3, S3_BUCKET_DATA, remote_prefix=MINUTE_STORE_REMOTE_PREFIX,
+                                    fetch_remote=MINUTE_STORE_FETCH_REMOTE)
+    return _MINUTE_STORE
+
+# ===== 일간 롤업 (날짜별 avg/min/max/count + 시간별 값, 지연 생성) =====
+_DAILY_ROLLUPS: Optional[DailyRollupStore] = None
+
+def get_daily_rollups() -> DailyRollupStore:
+    global _DAILY_ROLLUPS
+    if _DAILY_ROLLUPS is None:
+        _DAILY_ROLLUPS = DailyRollupStore(
+            get_sensor_index(), get_object_cache(),
+            store_dir=os.path.join(LOCAL_CACHE_DIR, "daily_rollup"),
+            seeker=get_key_seeker(), prefix=S3_PREFIX,
+            on_cold=_warm_index_in_background,
+        )
+    return _DAILY_ROLLUPS
+
+# ===== 일별 극값 요약 (최고/최저 값과 시각, 지연 생성) =====
+_DAILY_EXTREMA: Optional[DailyExtremaStore] = None
+
+def get_daily_extrema() -> DailyExtremaStore:
+    global _DAILY_EXTREMA
+    if _DAILY_EXTREMA is None:
+        _DAILY_EXTREMA = DailyExtremaStore(
+            s3, S3_BUCKET_DATA,
+            store_dir=os.path.join(LOCAL_CACHE_DIR, "daily_extrema"),
+            max_workers=MAX_WORKERS,
+        )
+    return _DAILY_EXTREMA
+
+# ===== 검색 계획기 (질의 → 예산 안의 검색 계획, 로컬 상태만 확인, 지연 생성) =====
+_RETRIEVAL_PLANNER: Optional[RetrievalPlanner] = None
+
+def get_retrieval_planner() -> RetrievalPlanner:
+    global _RETRIEVAL_PLANNER
+    if _RETRIEVAL_PLANNER is None:
+        _RETRIEVAL_PLANNER = RetrievalPlanner(
+            {"list": RETRIEVAL_BUDGET_LIST, "get": RETRIEVAL_BUDGET_GET},
+            probes={
+                "index_warm": lambda family: get_sensor_index().is_warm(family),
+                "store_has_day": lambda day: get_minute_store().has_day(day),
+                "extrema_cached": lambda day: get_daily_extrema().has_complete(day),
+                "rollup_cached": lambda day: get_daily_rollups().has_complete(day),
+                "raw_objects_per_day": lambda: get_daily_extrema().objects_per_day(),
+                "raw_objects_folded": lambda day: get_daily_extrema().folded_objects(day),
+            },
+            minute_max_hours=RANGE_MINUTE_MAX_HOURS, store_max_hours=RANGE_STORE_MAX_HOURS,
+            max_range_days=RANGE_MAX_DAYS, scan_max_files=MAX_FILES_TO_SCAN,
+        )
+    return _RETRIEVAL_PLANNER
+
+def plan_retrieval(analysis: "QueryAnalysis") -> RetrievalPlan:
+    """retrieve_documents_from_s3가 따를 검색 계획 (S3 조회 없음, explain 응답에도 사용)"""
+    return get_retrieval_planner().plan(analysis, day=analysis.query_day)
+
+# ===== 답변 캐시 (해석된 구간 기준, 지연 생성) =====
+_ANSWER_CACHE: Optional[AnswerCache] = None
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    global _ANSWER_CACHE
+    if not ENABLE_ANSWER_CACHE:
+        return None
+    if _ANSWER_CACHE is None:
+        _ANSWER_CACHE = AnswerCache(
+            os.path.join(LOCAL_CACHE_DIR, "answers"),
+            max_disk_bytes=ANSWER_CACHE_DISK_MB * 1024 * 1024,
+            sealed_ttl=ANSWER_CACHE_SEALED_TTL_SEC,
+            open_ttl=ANSWER_CACHE_OPEN_TTL_SEC,
+        )
+    return _ANSWER_CACHE
+
+# ===== 로컬 라우팅 분류기 (모델 파일이 없으면 None → Bedrock 라우터만 사용) =====
+_INTENT_CLASSIFIER = None  # None: 아직 로드 전, False: 모델 없음
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    global _INTENT_CLASSIFIER
+    if _INTENT_CLASSIFIER is None:
+        _INTENT_CLASSIFIER = IntentClassifier.load(INTENT_MODEL_PATH) or False
+    return _INTENT_CLASSIFIER or None
+
+# ===== S3 쓰기 지연 큐 (채팅 로그/세션 저장을 응답 경로 밖으로, 지연 생성) =====
+_WRITE_BEHIND: Optional[WriteBehindQueue] = None
+
+def get_write_behind() -> Optional[WriteBehindQueue]:
+    global _WRITE_BEHIND
+    if not ENABLE_WRITE_BEHIND:
+        return None
+    if _WRITE_BEHIND is None:
+        _WRITE_BEHIND = WriteBehindQueue(s3_logs, WRITE_BEHIND_SPOOL_PATH)
+    return _WRITE_BEHIND
+
+# ===== 세션 저널 (턴별 추가 기록 + 주기적 스냅샷, 지연 생성) =====
+_SESSION_JOURNAL: Optional[SessionJournal] = None
+
+def get_session_journal() -> SessionJournal:
+    global _SESSION_JOURNAL
+    if _SESSION_JOURNAL is None:
+        _SESSION_JOURNAL = SessionJournal(
+            s3, CHATLOG_BUCKET,
+            snapshot_prefix=CHATLOG_PREFIX,
+            journal_prefix=CHATLOG_JOURNAL_PREFIX,
+            compact_every=SESSION_COMPACT_EVERY,
+            max_history=MAX_HISTORY_TURNS,
+            writer=get_write_behind(),
+        )
+    return _SESSION_JOURNAL
+
+def _daily_rollup_summary(year: int, month: int, day: int) -> Optional[Dict]:
+    """일간 롤업을 기존 calculate_*_all_sensors 응답 형식으로 변환"""
+    try:
+        rollup = get_daily_rollups().get(datetime_cls(year, month, day).date())
+    except Exception:
+        return None
+    if not rollup:
+        return None
+
+    result = {
+        'date': f"{year}년 {month}월 {day}일",
+        'hour_data': rollup['hours']
+    }
+    for metric, name in (("temperature", "temp"), ("humidity", "humidity"), ("gas", "gas")):
+        stats = rollup['fields'].get(metric)
+        if stats:
+            result[f'{name}_average'] = round(stats['avg'], 2)
+            result[f'{name}_min'] = round(stats['min'], 2)
+            result[f'{name}_max'] = round(stats['max'], 2)
+            result[f'{name}_count'] = stats['count']
+    return result
+
+def _closest_indexed_key(target_time: datetime, families, max_hours: int = 72):
+    """
+    키 인덱스(없으면 키 탐색)에서 대상 시간과 가장 가까운 키 찾기
+    기존 시간 폴더 탐색 순서를 그대로 따름: 시간 폴더 거리 → 과거 우선 → families 순서 → 실제 시각 차이
+    반환: (key, key_dt, hours_diff) 또는 None
+    """
+    target_hour = target_time.replace(minute=0, second=0, microsecond=0)
+    best, best_order = None, None
+    for rank, family in enumerate(families):
+        for side, hit in enumerate(_family_neighbors(family, target_time, max_hours)):
+            if not hit:
+                continue
+            key_dt, key = hit
+            hours_diff = int(abs((key_dt.replace(minute=0) - target_hour).total_seconds()) // 3600)
+            if hours_diff > max_hours:
+                continue
+            order = (hours_diff, side if hours_diff else 0, rank, abs((key_dt - target_time).total_seconds()))
+            if best_order is None or order < best_order:
+                best, best_order = (key, key_dt, hours_diff), order
+    return best
 
 # ===== 시간대 보정 (내부 비교는 'KST naive') =====
 KST = timezone(timedelta(hours=9))
@@ -70,11 +381,9 @@ def get_session_s3_key(session_id: str) -> str:
     """세션 ID에 해당하는 S3 키 반환"""
     return f"{CHATLOG_PREFIX}{session_id}.json"
 
-def save_session_history(session_id: str, history: List[Dict], turn_id: int, last_sensor_ctx: Dict = None, followup_timestamp = None, followup_context: Dict = None):
-    """세션 히스토리를 S3에 저장"""
+def save_session_history(session_id: str, history: List[Dict], turn_id: int, last_sensor_ctx: Dict = None, followup_timestamp = None, followup_context: Dict = None, turn: Dict = None):
+    """세션 상태를 S3 저널에 기록 (turn: 이번에 추가된 대화, 없으면 컨텍스트만 기록)"""
     try:
-        s3_key = get_session_s3_key(session_id)
-        
         # followup_timestamp가 datetime 객체이면 ISO 문자열로 변환
         if followup_timestamp and hasattr(followup_timestamp, 'isoformat'):
             followup_timestamp = followup_timestamp.isoformat()
@@ -86,39 +395,25 @@ def save_session_history(session_id: str, history: List[Dict], turn_id: int, las
             "last_sensor_ctx": last_sensor_ctx or {},
             "followup_timestamp": followup_timestamp,
             "followup_context": followup_context or {},
-            "last_saved": datetime.now(KST).isoformat()
         }
-        
-        json_content = json.dumps(session_data, ensure_ascii=False, indent=2, default=str)
-        s3.put_object(
-            Bucket=CHATLOG_BUCKET,
-            Key=s3_key,
-            Body=json_content.encode('utf-8'),
-            ContentType='application/json'
-        )
-        #print(f"[히스토리] 세션 {session_id} S3 저장됨: {len(history)}개 대화")
-        return True
+        return get_session_journal().append(session_id, session_data, turn=turn)
     except Exception as e:
         print(f"[오류] 세션 S3 저장 실패: {e}")
         return False
 
 def load_session_history(session_id: str) -> Tuple[List[Dict], int, Dict, str, Dict]:
-    """세션 히스토리를 S3에서 로드"""
+    """세션 히스토리를 S3에서 로드 (스냅샷 + 저널 꼬리)"""
     try:
-        s3_key = get_session_s3_key(session_id)
-        
-        try:
-            response = s3.get_object(Bucket=CHATLOG_BUCKET, Key=s3_key)
-            session_data = json.loads(response['Body'].read().decode('utf-8'))
-        except s3.exceptions.NoSuchKey:
+        session_data = get_session_journal().load(session_id)
+        if session_data is None:
             print(f"[히스토리] 세션 {session_id}: 새 세션 시작 (S3)")
             return [], 0, {}, None, {}
             
         history = session_data.get("history", [])
         turn_id = session_data.get("turn_id", 0)
-        last_sensor_ctx = session_data.get("last_sensor_ctx", {})
+        last_sensor_ctx = session_data.get("last_sensor_ctx") or {}
         followup_timestamp = session_data.get("followup_timestamp")
-        followup_context = session_data.get("followup_context", {})
+        followup_context = session_data.get("followup_context") or {}
         
         # followup_timestamp가 문자열이면 datetime으로 변환
         if followup_timestamp and isinstance(followup_timestamp, str):
@@ -398,72 +693,24 @@ def calculate_daily_average_temperature(query: str):
     month, day = int(date_match.group(1)), int(date_match.group(2))
     date_prefix = f"{year:04d}{month:02d}{day:02d}"
     
-    # S3에서 해당 날짜의 houravg 데이터 검색
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    temperature_values = []
-    hour_data = []
-    
+    # 일간 롤업 한 건으로 계산 (houravg 24개 재조회 없음)
     try:
-        search_prefix = f"{S3_PREFIX}houravg/{year:04d}/{month:02d}/{day:02d}/"
-        pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 100})
-        
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if key.lower().endswith(".json"):
-                    try:
-                        obj_data = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-                        data = json.loads(obj_data['Body'].read().decode('utf-8'))
-                        
-                        # houravg 데이터에서 온도 값 추출 (다양한 필드명 시도)
-                        temp_value = None
-                        
-                        # 가능한 온도 필드명들
-                        temp_fields = ['hourtemp', 'temperature', 'temp', 'avg_temp', 'hourly_temp']
-                        for field in temp_fields:
-                            if field in data and data[field] is not None:
-                                temp_value = data[field]
-                                break
-                        
-                        # averages 구조 내부도 확인
-                        if temp_value is None and 'averages' in data:
-                            avg_data = data['averages']
-                            for field in ['temperature', 'temp', 'hourtemp']:
-                                if field in avg_data and avg_data[field] is not None:
-                                    temp_value = avg_data[field]
-                                    break
-                        
-                        if temp_value is not None:
-                            temperature_values.append(temp_value)
-                            hour_info = {
-                                'hour': int(key.split('/')[-1].split('_')[0][-2:]),  # 시간 추출
-                                'temp': temp_value,
-                                'key': key
-                            }
-                            hour_data.append(hour_info)
-                    except Exception:
-                        continue
+        rollup = get_daily_rollups().get(datetime_cls(year, month, day).date())
     except Exception:
         return None
-    
-    if not temperature_values:
+    if not rollup or 'temperature' not in rollup['fields']:
         return None
-    
-    # 평균 계산
-    daily_avg = sum(temperature_values) / len(temperature_values)
-    min_temp = min(temperature_values)
-    max_temp = max(temperature_values)
-    
-    
+
+    stats = rollup['fields']['temperature']
+    hour_data = [{'hour': h['hour'], 'temp': h['temp'], 'key': h['key']} for h in rollup['hours'] if 'temp' in h]
+
     return {
         'date': f"{year}년 {month}월 {day}일",
-        'average': round(daily_avg, 2),
-        'min': round(min_temp, 2),
-        'max': round(max_temp, 2),
-        'data_count': len(temperature_values),
-        'hour_data': sorted(hour_data, key=lambda x: x['hour'])
+        'average': round(stats['avg'], 2),
+        'min': round(stats['min'], 2),
+        'max': round(stats['max'], 2),
+        'data_count': stats['count'],
+        'hour_data': hour_data
     }
 
 def calculate_today_average_all_sensors():
@@ -472,164 +719,69 @@ def calculate_today_average_all_sensors():
     now = datetime_cls.now()
     year, month, day = now.year, now.month, now.day
     
-    # S3에서 오늘 날짜의 houravg 데이터 검색
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    temperature_values = []
-    humidity_values = []
-    gas_values = []
-    hour_data = []
-    
+    return _daily_rollup_summary(year, month, day)
+
+def _query_day(query: str):
+    """질의의 대상 날짜 (X월 Y일 / 오늘 / 어제 / 그제 / 엊그제 / 내일 / 모레, 없으면 None)"""
+    date_match = re.search(r"(\d{1,2})\s*월\s*(\d{1,2})\s*일", query)
+    if date_match:
+        try:
+            return datetime_cls(datetime_cls.now().year, int(date_match.group(1)), int(date_match.group(2))).date()
+        except ValueError:
+            return None
+    today = datetime_cls.now().date()
+    for word, days in (("오늘", 0), ("어제", -1), ("그제", -2), ("엊그제", -3), ("내일", 1), ("모레", 2)):
+        if word in query:
+            return today + timedelta(days=days)
+    return None
+
+def _extremum_from(source: str, day, metric: str, direction: str, max_reads: int = None) -> Optional[Dict]:
+    """
+    극값 조회 {"value", "timestamp", "resolution"} (검색 계획의 extrema_source)
+    raw: 원시 데이터 요약 (초 단위 시각), minute_store: 분 컬럼 저장소, hourly: 일간 롤업의 시간 평균
+    max_reads: raw에서 새로 GET할 원시 객체 상한 (넘으면 GET 없이 hourly로)
+    """
+    pick = max if direction == "max" else min
+    base = datetime_cls(day.year, day.month, day.day)
+    if source == "minute_store":
+        stored = get_minute_store().get_day(day, fetch_remote=False)
+        if stored is None:
+            return None
+        col = stored.column(metric)
+        slots = [i for i in range(len(col)) if stored.is_valid(i) and not math.isnan(col[i])]
+        if not slots:
+            return None
+        best = pick(slots, key=lambda i: col[i])
+        return {"value": round(col[best], 2), "timestamp": (base + timedelta(minutes=best)).isoformat(), "resolution": "minute"}
+    if source == "hourly":
+        name = HOUR_DATA_NAMES[metric]
+        hours = [h for h in ((get_daily_rollups().get(day) or {}).get("hours") or []) if h.get(name) is not None]
+        if not hours:
+            return None
+        best = pick(hours, key=lambda h: h[name])
+        return {"value": best[name], "timestamp": (base + timedelta(hours=best["hour"])).isoformat(), "resolution": "hour"}
     try:
-        search_prefix = f"{S3_PREFIX}houravg/{year:04d}/{month:02d}/{day:02d}/"
-        pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 100})
-        
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if key.lower().endswith(".json"):
-                    try:
-                        obj_data = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-                        data = json.loads(obj_data['Body'].read().decode('utf-8'))
-                        
-                        # 온도 값 추출
-                        temp_value = None
-                        temp_fields = ['hourtemp', 'temperature', 'temp', 'avg_temp']
-                        for field in temp_fields:
-                            if field in data and data[field] is not None:
-                                temp_value = data[field]
-                                break
-                        
-                        # 습도 값 추출
-                        humidity_value = None
-                        humidity_fields = ['hourhum', 'humidity', 'hum', 'avg_humidity']
-                        for field in humidity_fields:
-                            if field in data and data[field] is not None:
-                                humidity_value = data[field]
-                                break
-                        
-                        # 공기질(가스) 값 추출
-                        gas_value = None
-                        gas_fields = ['hourgas', 'gas', 'co2', 'avg_gas']
-                        for field in gas_fields:
-                            if field in data and data[field] is not None:
-                                gas_value = data[field]
-                                break
-                        
-                        # averages 구조 내부도 확인
-                        if 'averages' in data:
-                            avg_data = data['averages']
-                            if temp_value is None:
-                                for field in ['temperature', 'temp', 'hourtemp']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        temp_value = avg_data[field]
-                                        break
-                            if humidity_value is None:
-                                for field in ['humidity', 'hum', 'hourhum']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        humidity_value = avg_data[field]
-                                        break
-                            if gas_value is None:
-                                for field in ['gas', 'co2', 'hourgas']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        gas_value = avg_data[field]
-                                        break
-                        
-                        # 데이터가 하나라도 있으면 저장
-                        if temp_value is not None or humidity_value is not None or gas_value is not None:
-                            hour_info = {
-                                'hour': int(key.split('/')[-1].split('_')[0][-2:]),  # 시간 추출
-                                'key': key
-                            }
-                            
-                            if temp_value is not None:
-                                temperature_values.append(temp_value)
-                                hour_info['temp'] = temp_value
-                            if humidity_value is not None:
-                                humidity_values.append(humidity_value)
-                                hour_info['humidity'] = humidity_value  
-                            if gas_value is not None:
-                                gas_values.append(gas_value)
-                                hour_info['gas'] = gas_value
-                                
-                            hour_data.append(hour_info)
-                    except Exception:
-                        continue
-    except Exception:
-        return None
-    
-    # 최소한 하나의 센서 데이터는 있어야 함
-    if not temperature_values and not humidity_values and not gas_values:
-        return None
-    
-    # 평균 계산
-    result = {
-        'date': f"{year}년 {month}월 {day}일",
-        'hour_data': sorted(hour_data, key=lambda x: x['hour'])
-    }
-    
-    if temperature_values:
-        temp_avg = sum(temperature_values) / len(temperature_values)
-        result['temp_average'] = round(temp_avg, 2)
-        result['temp_min'] = round(min(temperature_values), 2)
-        result['temp_max'] = round(max(temperature_values), 2)
-        result['temp_count'] = len(temperature_values)
-    
-    if humidity_values:
-        humidity_avg = sum(humidity_values) / len(humidity_values)
-        result['humidity_average'] = round(humidity_avg, 2)
-        result['humidity_min'] = round(min(humidity_values), 2)
-        result['humidity_max'] = round(max(humidity_values), 2)
-        result['humidity_count'] = len(humidity_values)
-    
-    if gas_values:
-        gas_avg = sum(gas_values) / len(gas_values)
-        result['gas_average'] = round(gas_avg, 2)
-        result['gas_min'] = round(min(gas_values), 2)
-        result['gas_max'] = round(max(gas_values), 2)
-        result['gas_count'] = len(gas_values)
-    
-    return result
+        extremum = get_daily_extrema().extremum(day, metric, direction, max_new_objects=max_reads)
+    except ReadBudgetExceeded as e:
+        print(f"[경고] 극값 원시 데이터 조회 예산 초과, 시간 평균으로 대체: {e}")
+        return _extremum_from("hourly", day, metric, direction)
+    return dict(extremum, resolution="raw") if extremum else None
 
-def find_extrema_time_in_date(query: str):
-    """특정 날짜에서 센서 데이터의 최고/최저 시간을 찾는 함수"""
+def find_extrema_time_in_date(query: str, source: str = "raw", max_reads: int = None):
+    """
+    특정 날짜에서 센서 데이터의 최고/최저 시간을 찾는 함수
+    source: 극값 출처 (raw / minute_store / hourly, 검색 계획이 예산에 맞춰 결정)
+    max_reads: raw 출처의 원시 객체 GET 상한 (검색 계획의 extrema_max_reads)
+    """
     
     # print(f"[DEBUG-FIND-EXTREMA] 함수 호출됨: {query}")
     
-    # 날짜 추출 (calculate_daily_average_all_sensors와 동일한 로직)
-    date_match = re.search(r"(\d{1,2})\s*월\s*(\d{1,2})\s*일", query)
-    if date_match:
-        year = datetime_cls.now().year
-        month, day = int(date_match.group(1)), int(date_match.group(2))
-        # print(f"[DEBUG-FIND-EXTREMA] 절대날짜 추출: {year}-{month:02d}-{day:02d}")
-    elif "오늘" in query:
-        now = datetime_cls.now()
-        year, month, day = now.year, now.month, now.day
-        # print(f"[DEBUG-FIND-EXTREMA] 오늘 추출: {year}-{month:02d}-{day:02d}")
-    elif "어제" in query:
-        yesterday = datetime_cls.now() - timedelta(days=1)
-        year, month, day = yesterday.year, yesterday.month, yesterday.day
-        # print(f"[DEBUG-FIND-EXTREMA] 어제 추출: {year}-{month:02d}-{day:02d}")
-    elif "그제" in query:
-        day_before_yesterday = datetime_cls.now() - timedelta(days=2)
-        year, month, day = day_before_yesterday.year, day_before_yesterday.month, day_before_yesterday.day
-        # print(f"[DEBUG-FIND-EXTREMA] 그제 추출: {year}-{month:02d}-{day:02d}")
-    elif "엊그제" in query:
-        three_days_ago = datetime_cls.now() - timedelta(days=3)
-        year, month, day = three_days_ago.year, three_days_ago.month, three_days_ago.day
-        # print(f"[DEBUG-FIND-EXTREMA] 엊그제 추출: {year}-{month:02d}-{day:02d}")
-    elif "내일" in query:
-        tomorrow = datetime_cls.now() + timedelta(days=1)
-        year, month, day = tomorrow.year, tomorrow.month, tomorrow.day
-        # print(f"[DEBUG-FIND-EXTREMA] 내일 추출: {year}-{month:02d}-{day:02d}")
-    elif "모레" in query:
-        day_after_tomorrow = datetime_cls.now() + timedelta(days=2)
-        year, month, day = day_after_tomorrow.year, day_after_tomorrow.month, day_after_tomorrow.day
-        # print(f"[DEBUG-FIND-EXTREMA] 모레 추출: {year}-{month:02d}-{day:02d}")
-    else:
+    # 날짜 추출
+    query_day = _query_day(query)
+    if query_day is None:
         # print(f"[DEBUG-FIND-EXTREMA] 날짜 추출 실패, None 반환")
         return None
+    month, day = query_day.month, query_day.day
     
     # 메트릭과 방향(최고/최저) 결정
     if re.search(r"가장.*더운|가장.*따뜻한|최고.*온도|가장.*높은.*온도|온도.*가장.*높은|가장.*온도.*가.*높은|가장.*온도가.*높은", query):
@@ -678,60 +830,26 @@ def find_extrema_time_in_date(query: str):
     
     # print(f"[DEBUG-FIND-EXTREMA] 메트릭: {metric}, 방향: {direction}, 이름: {metric_name}, 단위: {unit}")
     
-    # S3에서 해당 날짜의 모든 센서 데이터 검색
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    date_str = f"{year:04d}{month:02d}{day:02d}"
-    prefix = f"sensor/date_data/{date_str}/"
-    
-    # print(f"[DEBUG-FIND-EXTREMA] S3 검색 시작: prefix={prefix}")
-    
-    all_values = []
+    # 일별 극값 요약에서 조회 (오늘은 새 원시 객체만 증분 반영)
+    # print(f"[DEBUG-FIND-EXTREMA] 극값 요약 조회: {query_day}")
     
     try:
-        for page in paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=prefix):
-            for obj in page.get('Contents', []):
-                try:
-                    response = s3.get_object(Bucket=S3_BUCKET_DATA, Key=obj['Key'])
-                    content = response['Body'].read().decode('utf-8')
-                    data = json.loads(content)
-                    
-                    # 데이터에서 해당 메트릭의 값 추출
-                    if metric == "temperature" and "temperature" in data:
-                        timestamp = data.get("timestamp", "")
-                        value = float(data["temperature"])
-                        all_values.append({"timestamp": timestamp, "value": value})
-                    elif metric == "humidity" and "humidity" in data:
-                        timestamp = data.get("timestamp", "")
-                        value = float(data["humidity"])
-                        all_values.append({"timestamp": timestamp, "value": value})
-                    elif metric == "gas" and "gas" in data:
-                        timestamp = data.get("timestamp", "")
-                        value = float(data["gas"])
-                        all_values.append({"timestamp": timestamp, "value": value})
-                        
-                except Exception:
-                    continue
+        extrema_data = _extremum_from(source, query_day, metric, direction, max_reads=max_reads)
         
-        # print(f"[DEBUG-FIND-EXTREMA] 수집된 데이터 개수: {len(all_values)}")
-        
-        if not all_values:
+        if not extrema_data:
             # print(f"[DEBUG-FIND-EXTREMA] 데이터가 없어서 None 반환")
             return None
         
         # 최고/최저값 찾기
         if direction == "max":
-            extrema_data = max(all_values, key=lambda x: x["value"])
             direction_text = "최고" if metric == "temperature" else "가장 높은" if metric == "humidity" else "가장 높은"
         else:
-            extrema_data = min(all_values, key=lambda x: x["value"])
             direction_text = "최저" if metric == "temperature" else "가장 낮은" if metric == "humidity" else "가장 낮은"
         
         # 시간 정보 파싱
         try:
             timestamp = datetime_cls.fromisoformat(extrema_data["timestamp"])
-            time_str = timestamp.strftime("%H시 %M분")
+            time_str = timestamp.strftime("%H시대" if extrema_data.get("resolution") == "hour" else "%H시 %M분")
             date_str_readable = f"{month}월 {day}일"
         except:
             time_str = "시간 정보 없음"
@@ -742,6 +860,8 @@ def find_extrema_time_in_date(query: str):
         # 결과 구성
         description = f"{date_str_readable} {direction_text} {metric_name} 시간 분석"
         context = f"{date_str_readable} {time_str}에 {direction_text} {metric_name} {value}{unit}를 기록했습니다."
+        if extrema_data.get("resolution") == "hour":
+            context += " (시간 평균 기준)"
         
         return {
             "date": date_str_readable,
@@ -767,32 +887,15 @@ def calculate_daily_average_all_sensors(query: str):
         year = datetime_cls.now().year
         month, day = int(date_match.group(1)), int(date_match.group(2))
     elif "오늘" in query:
-        # "오늘" 키워드인 경우 실제 houravg 데이터가 있는 가장 최근 날짜 찾기
-        s3_temp = boto3.client("s3", region_name=REGION)
-        paginator_temp = s3_temp.get_paginator("list_objects_v2")
-        
-        # 현재부터 과거로 최대 30일까지 검색
+        # "오늘" 키워드인 경우 실제 houravg 데이터가 있는 가장 최근 날짜 찾기 (키 인덱스, 최대 30일 전까지)
         found_date = None
-        for days_back in range(30):
-            check_date = datetime_cls.now() - timedelta(days=days_back)
-            check_year, check_month, check_day = check_date.year, check_date.month, check_date.day
-            
-            # 해당 날짜의 houravg 데이터 존재 여부 확인
-            search_prefix = f"{S3_PREFIX}houravg/{check_year:04d}/{check_month:02d}/{check_day:02d}/"
-            try:
-                pages = paginator_temp.paginate(
-                    Bucket=S3_BUCKET_DATA, 
-                    Prefix=search_prefix, 
-                    PaginationConfig={'MaxItems': 1}
-                )
-                for page in pages:
-                    if page.get("Contents"):
-                        found_date = (check_year, check_month, check_day)
-                        break
-                if found_date:
-                    break
-            except:
-                continue
+        try:
+            today = datetime_cls.now().date()
+            latest = get_daily_rollups().latest_day(today)
+            if latest and (today - latest).days < 30:
+                found_date = (latest.year, latest.month, latest.day)
+        except Exception:
+            pass
         
         if found_date:
             year, month, day = found_date
@@ -825,126 +928,7 @@ def calculate_daily_average_all_sensors(query: str):
     else:
         return None
     
-    # S3에서 해당 날짜의 houravg 데이터 검색
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    temperature_values = []
-    humidity_values = []
-    gas_values = []
-    hour_data = []
-    
-    try:
-        search_prefix = f"{S3_PREFIX}houravg/{year:04d}/{month:02d}/{day:02d}/"
-        pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 100})
-        
-        for page in pages:
-            for obj in page.get("Contents", []):
-                key = obj["Key"]
-                if key.lower().endswith(".json"):
-                    try:
-                        obj_data = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-                        data = json.loads(obj_data['Body'].read().decode('utf-8'))
-                        
-                        # 온도 값 추출
-                        temp_value = None
-                        temp_fields = ['hourtemp', 'temperature', 'temp', 'avg_temp']
-                        for field in temp_fields:
-                            if field in data and data[field] is not None:
-                                temp_value = data[field]
-                                break
-                        
-                        # 습도 값 추출
-                        humidity_value = None
-                        humidity_fields = ['hourhum', 'humidity', 'hum', 'avg_humidity']
-                        for field in humidity_fields:
-                            if field in data and data[field] is not None:
-                                humidity_value = data[field]
-                                break
-                        
-                        # 공기질(가스) 값 추출
-                        gas_value = None
-                        gas_fields = ['hourgas', 'gas', 'co2', 'avg_gas']
-                        for field in gas_fields:
-                            if field in data and data[field] is not None:
-                                gas_value = data[field]
-                                break
-                        
-                        # averages 구조 내부도 확인
-                        if 'averages' in data:
-                            avg_data = data['averages']
-                            if temp_value is None:
-                                for field in ['temperature', 'temp', 'hourtemp']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        temp_value = avg_data[field]
-                                        break
-                            if humidity_value is None:
-                                for field in ['humidity', 'hum', 'hourhum']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        humidity_value = avg_data[field]
-                                        break
-                            if gas_value is None:
-                                for field in ['gas', 'co2', 'hourgas']:
-                                    if field in avg_data and avg_data[field] is not None:
-                                        gas_value = avg_data[field]
-                                        break
-                        
-                        # 데이터가 하나라도 있으면 저장
-                        if temp_value is not None or humidity_value is not None or gas_value is not None:
-                            hour_info = {
-                                'hour': int(key.split('/')[-1].split('_')[0][-2:]),  # 시간 추출
-                                'key': key
-                            }
-                            
-                            if temp_value is not None:
-                                temperature_values.append(temp_value)
-                                hour_info['temp'] = temp_value
-                            if humidity_value is not None:
-                                humidity_values.append(humidity_value)
-                                hour_info['humidity'] = humidity_value  
-                            if gas_value is not None:
-                                gas_values.append(gas_value)
-                                hour_info['gas'] = gas_value
-                                
-                            hour_data.append(hour_info)
-                    except Exception:
-                        continue
-    except Exception:
-        return None
-    
-    # 최소한 하나의 센서 데이터는 있어야 함
-    if not temperature_values and not humidity_values and not gas_values:
-        return None
-    
-    # 평균 계산
-    result = {
-        'date': f"{year}년 {month}월 {day}일",
-        'hour_data': sorted(hour_data, key=lambda x: x['hour'])
-    }
-    
-    if temperature_values:
-        temp_avg = sum(temperature_values) / len(temperature_values)
-        result['temp_average'] = round(temp_avg, 2)
-        result['temp_min'] = round(min(temperature_values), 2)
-        result['temp_max'] = round(max(temperature_values), 2)
-        result['temp_count'] = len(temperature_values)
-    
-    if humidity_values:
-        humidity_avg = sum(humidity_values) / len(humidity_values)
-        result['humidity_average'] = round(humidity_avg, 2)
-        result['humidity_min'] = round(min(humidity_values), 2)
-        result['humidity_max'] = round(max(humidity_values), 2)
-        result['humidity_count'] = len(humidity_values)
-    
-    if gas_values:
-        gas_avg = sum(gas_values) / len(gas_values)
-        result['gas_average'] = round(gas_avg, 2)
-        result['gas_min'] = round(min(gas_values), 2)
-        result['gas_max'] = round(max(gas_values), 2)
-        result['gas_count'] = len(gas_values)
-    
-    
-    return result
+    return _daily_rollup_summary(year, month, day)
 
 def parse_dt(dt_str: str):
     try:
@@ -1162,6 +1146,88 @@ def get_minute_to_minute_range(query: str):
             return start_dt, end_dt
     return None, None
 
+_RANGE_SPLIT_RE = re.compile(r"부터|~")
+_CLOCK_RE = re.compile(r"(?:(오전|오후)\s*)?(\d{1,2})\s*시(?!간)(?:\s*(\d{1,2})\s*분)?|(\d{1,2})\s*:\s*(\d{2})")
+_MINUTE_ONLY_RE = re.compile(r"(\d{1,2})\s*분")
+_DURATION_RE = re.compile(r"(\d+)\s*(분|시간)\s*(?:동안|간)")
+_DATE_LITERAL_RE = re.compile(r"(?:(\d{4})\s*년\s*)?(\d{1,2})\s*월\s*(\d{1,2})\s*일")
+
+def _parse_clock(text: str, pm_hint: bool = False):
+    """텍스트의 첫 시각 → (hour, minute) / 없으면 None (pm_hint: 오전/오후 표기가 없을 때 오후로 간주)"""
+    m = _CLOCK_RE.search(text)
+    if not m:
+        return None
+    if m.group(4) is not None:
+        hour, minute = int(m.group(4)), int(m.group(5))
+    else:
+        hour, minute = int(m.group(2)), int(m.group(3) or 0)
+        ampm = m.group(1)
+        if (ampm == "오후" or (ampm is None and pm_hint)) and hour < 12:
+            hour += 12
+        elif ampm == "오전" and hour == 12:
+            hour = 0
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return hour, minute
+
+def get_range_window_from_query(query: str) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    구간 질의 → (start, end) 분 단위, 양 끝 포함 / 구간이 아니면 (None, None)
+      "10월 17일 13시 10분부터 13시 40분까지" → 13:10 ~ 13:40
+      "10월 17일 14시 10분부터 50분까지"      → 14:10 ~ 14:50 (끝의 날짜/시는 시작에서 물려받음)
+      "10월 17일 14시부터 30분 동안"          → 14:00 ~ 14:29
+      "10월 16일 22시부터 2시까지"            → 16일 22:00 ~ 17일 02:00
+    """
+    m = _RANGE_SPLIT_RE.search(query)
+    if not m:
+        return None, None
+    left, right = query[:m.start()], query[m.end():]
+    base = None
+    for ds in extract_datetime_strings(left):
+        base = parse_dt(ds)
+        if base:
+            break
+    if base is None:
+        return None, None
+    clock = _parse_clock(left)
+    start = base.replace(hour=clock[0], minute=clock[1]) if clock else base
+    start = start.replace(second=0, microsecond=0)
+
+    has_until = "까지" in right or m.group(0) == "~"
+    if not has_until:
+        dur = _DURATION_RE.search(right)
+        if not dur:
+            return None, None
+        amount = int(dur.group(1))
+        span = timedelta(minutes=amount) if dur.group(2) == "분" else timedelta(hours=amount)
+        if amount <= 0:
+            return None, None
+        return start, start + span - timedelta(minutes=1)
+
+    core = right.split("까지", 1)[0]
+    date_m = _DATE_LITERAL_RE.search(core)
+    end_day = start
+    if date_m:
+        try:
+            end_day = start.replace(year=int(date_m.group(1) or start.year),
+                                    month=int(date_m.group(2)), day=int(date_m.group(3)))
+        except ValueError:
+            return None, None
+        core = core[date_m.end():]
+    clock = _parse_clock(core, pm_hint="오후" in left and "오전" not in core)
+    if clock:
+        end = end_day.replace(hour=clock[0], minute=clock[1])
+    else:
+        minute_m = _MINUTE_ONLY_RE.search(core)
+        if not minute_m or date_m or int(minute_m.group(1)) > 59:
+            return None, None
+        end = end_day.replace(minute=int(minute_m.group(1)))
+    if end <= start and not date_m:
+        end += timedelta(days=1)  # "22시부터 2시까지"
+    if end <= start:
+        return None, None
+    return start, end
+
 # ===== 파일명에서 시간 추출 =====
 def parse_time_from_key(key: str):
     """
@@ -1202,10 +1268,175 @@ def parse_time_from_key(key: str):
 
     return None, None
 
+# ===== 질의 분석 (요청당 1회) =====
+_DAILY_SENSOR_KEYWORDS = ("온도", "습도", "공기질", "이산화탄소", "CO2", "gas", "강의실", "실내", "실온", "방안", "교실", "사무실")
+_RELATIVE_DAY_WORDS = ("어제", "그제", "엊그제", "내일", "모레")
+
+# 최고/최저 시간 질의 ("어제 가장 더운 시간", "습도가 가장 낮은 시간" 등)
+_EXTREMA_PATTERNS = [re.compile(p) for p in (
+    r"가장.*더운.*시간", r"가장.*따뜻한.*시간", r"최고.*온도.*시간",
+    r"가장.*차가운.*시간", r"가장.*시원한.*시간", r"최저.*온도.*시간", 
+    r"가장.*높은.*습도.*시간", r"최고.*습도.*시간", r"습도.*가장.*높은.*시간", r"가장.*습도.*가.*높은.*시간",
+    r"가장.*낮은.*습도.*시간", r"최저.*습도.*시간", r"습도.*가장.*낮은.*시간", r"가장.*습도.*가.*낮은.*시간",
+    r"가장.*높은.*공기질.*시간", r"최고.*공기질.*시간", r"공기질.*가장.*나쁜.*시간", r"공기질.*가장.*높은.*시간", r"가장.*공기질.*가.*높은.*시간", r"가장.*공기질.*가.*나쁜.*시간",
+    r"가장.*낮은.*공기질.*시간", r"최저.*공기질.*시간", r"공기질.*가장.*좋은.*시간", r"공기질.*가장.*낮은.*시간", r"가장.*공기질.*가.*낮은.*시간", r"가장.*공기질.*가.*좋은.*시간",
+    r"가장.*높은.*이산화탄소.*시간", r"최고.*이산화탄소.*시간", r"이산화탄소.*가장.*높은.*시간", r"가장.*이산화탄소.*가.*높은.*시간",
+    r"가장.*낮은.*이산화탄소.*시간", r"최저.*이산화탄소.*시간", r"이산화탄소.*가장.*낮은.*시간", r"가장.*이산화탄소.*가.*낮은.*시간",
+    r"최고.*온도", r"최저.*온도", r"최고.*습도", r"최저.*습도"
+)]
+
+class QueryAnalysis:
+    """
+    한 질의를 한 번만 파싱한 결과
+    요청 시작 시 analyze_query()로 만들어 라우팅/검색/스코어링에 그대로 넘긴다.
+    (문서 수천 개를 스코어링해도 한국어 날짜 파서는 한 번만 실행됨)
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.fields = detect_fields_in_query(query)
+        self.query_tokens = normalize_query_tokens(query)
+
+        # 절대 시각
+        self.dt_strings = extract_datetime_strings(query)
+        self.dt_strings_lower = [ds.lower() for ds in self.dt_strings]
+        self.datetimes = [dt for dt in (parse_dt(ds) for ds in self.dt_strings) if dt]
+        self.target_dt = self.datetimes[0] if self.datetimes else None
+
+        # 상대 시각 / 범위 / 단위
+        self.offset_value, self.offset_unit = extract_time_offset(query)
+        self.time_range = extract_time_range_from_query(query)
+        self.range_start, self.range_end = get_range_window_from_query(query)
+        self.minute = minute_requested(query)
+        self.granularity = requested_granularity(query)
+
+        # 최근 / 후속 질문
+        self.is_recent = is_recent_query(query)
+        self.has_followup_hint = any(h in query for h in _FOLLOWUP_HINTS)
+
+        # 일간 평균 의도: ("평균" + "일" + 센서) 또는 ("오늘" + 센서) 또는 (X월 Y일 + 센서) 또는 (상대 날짜 + 센서)
+        has_sensor_keywords = any(k in query for k in _DAILY_SENSOR_KEYWORDS)
+        has_date_literal = bool(re.search(r"\d{1,2}\s*월\s*\d{1,2}\s*일", query))
+        has_relative_day = any(w in query for w in _RELATIVE_DAY_WORDS)
+        self.has_daily_keywords = (("평균" in query and "일" in query and has_sensor_keywords) or
+                                   ("오늘" in query and has_sensor_keywords) or
+                                   (has_date_literal and has_sensor_keywords) or
+                                   (has_relative_day and has_sensor_keywords))
+        self.has_average_keywords = ("평균" in query and ("온도" in query or "습도" in query or "공기질" in query or "temperature" in query or "humidity" in query or "gas" in query))
+        # 특정 시간이 언급된 경우 일간 평균이 아님
+        self.has_specific_time = bool(re.search(r"\d{1,2}\s*시|\d{1,2}\s*:\s*\d{1,2}|오전|오후", query))
+        self.is_daily_avg = self.has_daily_keywords and not self.has_specific_time
+
+        # 최고/최저 시간 의도 (날짜 언급 필요)
+        has_date_reference = "오늘" in query or has_relative_day or has_date_literal
+        self.is_extrema = has_date_reference and any(p.search(query) for p in _EXTREMA_PATTERNS)
+        self.query_day = _query_day(query) if has_date_reference else None
+
+def analyze_query(query: str) -> QueryAnalysis:
+    return QueryAnalysis(query)
+
+# 질문 구분용 집계/답변 종류 ("14시 온도 알려줘" → value, "14시 온도면 에어컨 켜야 해?" → advice)
+_AGGREGATE_KEYWORDS = (
+    ("advice", ("해야", "야 해", "야 할", "할까", "될까", "괜찮", "적정", "추천", "쾌적")),
+    ("max", ("최고", "최대", "가장 높", "제일 높")),
+    ("min", ("최저", "최소", "가장 낮", "제일 낮")),
+    ("trend", ("추세", "추이", "변화")),
+    ("avg", ("평균",)),
+)
+
+def _question_signature(analysis: QueryAnalysis) -> Dict:
+    """
+    같은 구간이라도 묻는 내용이 다르면 다른 답변 → 질의 분석 결과만으로 만든 정규화 서명
+    (의도 플래그 + 센서 필드 + 집계 종류 + 단위, 표현만 바꾼 같은 질문은 같은 서명)
+    """
+    a = analysis
+    intent = [name for name, on in (("daily_avg", a.is_daily_avg), ("average", a.has_average_keywords),
+                                     ("minute", a.minute), ("followup", a.has_followup_hint)) if on]
+    aggregate = [name for name, words in _AGGREGATE_KEYWORDS if any(w in a.query for w in words)] or ["value"]
+    return {"intent": intent, "fields": sorted(a.fields), "aggregate": aggregate, "granularity": a.granularity}
+
+def resolve_answer_window(analysis: QueryAnalysis) -> Optional[Dict]:
+    """
+    답변 캐시 키: 데이터 구간 + 질문 구분자 ("question")
+    구간이 같아도 질문이 다르면 다른 키 (봉인 구간 바로 응답이 다른 질문의 답을 돌려주지 않도록)
+    """
+    window = _resolve_data_window(analysis)
+    if window is not None:
+        window["question"] = _question_signature(analysis)
+    return window
+
+def _resolve_data_window(analysis: QueryAnalysis) -> Optional[Dict]:
+    """
+    답변 캐시용 데이터 구간 (retrieve_documents_from_s3 분기 순서를 따름)
+    반환: {"kind", "fields", ... , "sealed"} / 캐시하지 않는 질의(최근/현재, 상대 시각, 극값, "오늘" 등)는 None
+    """
+    a = analysis
+    if a.is_extrema or a.is_recent:
+        return None
+    fields = sorted(a.fields) or ["*"]
+    now = seal_clock()
+    
+    if a.is_daily_avg:
+        # calculate_daily_average_all_sensors와 같은 날짜 해석 (지난 날짜만)
+        date_match = re.search(r"(\d{1,2})\s*월\s*(\d{1,2})\s*일", a.query)
+        try:
+            if date_match:
+                day = datetime_cls(datetime_cls.now().year, int(date_match.group(1)), int(date_match.group(2)))
+            elif "어제" in a.query:
+                day = datetime_cls.now() - timedelta(days=1)
+            elif "그제" in a.query:
+                day = datetime_cls.now() - timedelta(days=2)
+            else:
+                return None
+        except ValueError:
+            return None
+        start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=1)
+        return {"kind": "day", "start": start.isoformat(), "end": end.isoformat(), "fields": fields,
+                "sealed": end + HOUR_SEAL_GRACE <= now}
+    
+    if a.offset_value:
+        return None
+    
+    gran = a.granularity
+    if a.range_start:
+        # summarize_range와 같은 해상도로 봉인 여부 판단
+        if _range_resolution(a.range_start, a.range_end) == "minute":
+            end, grace = a.range_end + timedelta(minutes=1), MINUTE_SEAL_GRACE
+        else:
+            end, grace = a.range_end.replace(minute=0) + timedelta(hours=1), HOUR_SEAL_GRACE
+        return {"kind": "range", "start": a.range_start.isoformat(timespec="minutes"),
+                "end": a.range_end.isoformat(timespec="minutes"), "fields": fields, "sealed": end + grace <= now}
+    
+    if a.time_range:
+        hours = [dt for dt in (parse_dt(h) for h in a.time_range) if dt]
+        if not hours:
+            return None
+        start, end = min(hours), max(hours) + timedelta(hours=1)
+        return {"kind": "hour_range", "granularity": gran, "start": start.isoformat(), "end": end.isoformat(),
+                "fields": fields, "sealed": end + HOUR_SEAL_GRACE <= now}
+    
+    if a.datetimes:
+        points = sorted(set(a.datetimes))
+        if gran == "minute":
+            last_end, grace = points[-1] + timedelta(minutes=1), MINUTE_SEAL_GRACE
+        else:
+            last_end, grace = points[-1].replace(minute=0) + timedelta(hours=1), HOUR_SEAL_GRACE
+        return {"kind": "points", "granularity": gran, "points": [p.isoformat(timespec="minutes") for p in points],
+                "fields": fields, "sealed": last_end + grace <= now}
+    return None
+
+def _analysis_for(query: str, analysis: Optional[QueryAnalysis]) -> QueryAnalysis:
+    """넘겨받은 분석이 같은 질의에 대한 것이면 재사용, 아니면 새로 분석"""
+    if analysis is not None and analysis.query == query:
+        return analysis
+    return QueryAnalysis(query)
+
 # ===== 스코어링 =====
-def score_doc(query: str, text: str, key: str = "") -> int:
+def score_doc(query: str, text: str, key: str = "", analysis: Optional[QueryAnalysis] = None) -> int:
+    a = _analysis_for(query, analysis)
     text_l = text.lower()
-    q_tokens = normalize_query_tokens(query)
+    q_tokens = a.query_tokens
     score = 0
     
     # 기본 파일 타입 점수 (평균 데이터만 사용)
@@ -1223,38 +1454,15 @@ def score_doc(query: str, text: str, key: str = "") -> int:
         if k in text_l:
             score += 1
 
-    dt_strs = extract_datetime_strings(query)
-    for ds in dt_strs:
-        if ds.lower() in text_l:
+    for ds in a.dt_strings_lower:
+        if ds in text_l:
             score += 5
 
     # 파일명-시각 매칭 가산점 (대폭 증가)
-    target_dt = None
-    for ds in dt_strs:
-        dd = parse_dt(ds)
-        if dd:
-            target_dt = dd
-            break
-    if key and target_dt:
-        key_dt, gran_key = parse_time_from_key(key)
-        if key_dt:
-            gran_query = requested_granularity(query)
-            
-            # 정확한 시각 매칭만 점수 부여 (부정확한 매칭 제거)
-            if gran_key == "minute" and (key_dt.year,key_dt.month,key_dt.day,key_dt.hour,key_dt.minute) == \
-               (target_dt.year,target_dt.month,target_dt.day,target_dt.hour,target_dt.minute):
-                score += 200  # 분 정확 매칭 시 대폭 가산
-            elif gran_key == "hour" and (key_dt.year,key_dt.month,key_dt.day,key_dt.hour) == \
-                 (target_dt.year,target_dt.month,target_dt.day,target_dt.hour):
-                # 분 쿼리에 대해서는 시간 데이터만 fallback으로 허용
-                if gran_query == "minute":
-                    score += 50  # 분 쿼리의 시간 fallback
-                elif gran_query == "hour":
-                    score += 200  # 시간 질의와 시간 파일 정확 매칭
-            # 같은 날짜라도 시간이 다르면 점수를 주지 않음 (부정확한 매칭 방지)
+    score += _key_time_bonus(key, a)
 
     # 평균 데이터만 사용하는 간단한 스코어링
-    requested_gran = requested_granularity(query)
+    requested_gran = a.granularity
     
     if requested_gran == "minute":
         # 분 단위 요청: minavg 최우선
@@ -1285,6 +1493,52 @@ def score_doc(query: str, text: str, key: str = "") -> int:
 
     return score
 
+def _key_time_bonus(key: str, a: QueryAnalysis) -> int:
+    """파일명 시각이 질의 시각과 정확히 맞을 때의 가산점 (키만으로 계산)"""
+    target_dt = a.target_dt
+    if not key or not target_dt:
+        return 0
+    key_dt, gran_key = parse_time_from_key(key)
+    if not key_dt:
+        return 0
+    gran_query = a.granularity
+    
+    # 정확한 시각 매칭만 점수 부여 (부정확한 매칭 제거)
+    if gran_key == "minute" and (key_dt.year,key_dt.month,key_dt.day,key_dt.hour,key_dt.minute) == \
+       (target_dt.year,target_dt.month,target_dt.day,target_dt.hour,target_dt.minute):
+        return 200  # 분 정확 매칭 시 대폭 가산
+    if gran_key == "hour" and (key_dt.year,key_dt.month,key_dt.day,key_dt.hour) == \
+         (target_dt.year,target_dt.month,target_dt.day,target_dt.hour):
+        # 분 쿼리에 대해서는 시간 데이터만 fallback으로 허용
+        if gran_query == "minute":
+            return 50  # 분 쿼리의 시간 fallback
+        if gran_query == "hour":
+            return 200  # 시간 질의와 시간 파일 정확 매칭
+    # 같은 날짜라도 시간이 다르면 점수를 주지 않음 (부정확한 매칭 방지)
+    return 0
+
+def _score_bound(key: str, a: QueryAnalysis, size: Optional[int] = None) -> Optional[int]:
+    """
+    다운로드 전 키와 LIST 객체 크기만으로 계산한 download_and_score_file 점수 상한 (상위 k개 스캔의 조기 종료용)
+    본문 의존 가산점은 최댓값으로, 질의 토큰 등장 횟수는 본문 길이로 제한 (글자 수 ≤ 바이트 수 → size // 토큰 길이)
+    크기를 모르거나 아직 열린 구간(내용이 LIST 이후 바뀔 수 있음)이면 None → 조기 종료 대상에서 제외
+    """
+    tokens = [qt for qt in a.query_tokens if len(qt) >= 2]
+    if tokens and (size is None or not get_object_cache().is_sealed(key)):
+        return None
+    key_l = key.lower()
+    bound = _key_time_bonus(key, a)
+    if "minavg" in key_l or "mintrend" in key_l:
+        bound += 8
+    elif "hourtrend" in key_l or "houravg" in key_l:
+        bound += 6
+    bound += sum(size // len(qt) for qt in tokens)
+    bound += 5                        # 필드 이름 5개
+    bound += 5 * len(a.dt_strings_lower)
+    bound += {"minute": 30, "hour": 35}.get(a.granularity, 20)   # 단위별 averages 가산점 최댓값
+    bound += 5                        # 스키마 가산점 최댓값 (raw_list)
+    return bound
+
 # ===== JSON 스키마 감지 =====
 def detect_schema(obj):
     """
@@ -1322,16 +1576,12 @@ def detect_schema(obj):
     return None
 
 # ===== S3 다운로드/스코어 (스키마 포함) =====
-def download_and_score_file(key: str, query: str):
+def download_and_score_file(key: str, query: str, analysis: Optional[QueryAnalysis] = None):
     try:
-        head_resp = s3.head_object(Bucket=S3_BUCKET_DATA, Key=key)
-        file_size = head_resp.get('ContentLength', 0)
-        if file_size > MAX_FILE_SIZE:
-            obj = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key, Range=f"bytes=0-{MAX_FILE_SIZE-1}")
-        else:
-            obj = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-        data = obj["Body"].read()
-        txt = data.decode("utf-8", errors="ignore")
+        # 앞 MAX_FILE_SIZE 바이트만 Range로 받음 (HEAD 없이 Content-Range로 전체 크기 확인)
+        cached = get_object_cache().fetch(key, max_bytes=MAX_FILE_SIZE)
+        file_size = cached.size
+        txt = cached.text
         if not txt.strip(): 
             return None
 
@@ -1343,26 +1593,11 @@ def download_and_score_file(key: str, query: str):
             schema = detect_schema(j)
         except Exception:
             try:
-                pass
-                # 실패하면 JSON이 여러 줄로 되어 있을 수 있으므로 라인별로 파싱
-                lines = txt.strip().split('\n')
-                if len(lines) == 1:
-                    # 한 줄이면 단일 객체
-                    j = json.loads(lines[0])
-                    schema = detect_schema(j)
-                else:
-                    # 여러 줄이면 JSON Lines 형태일 가능성
-                    json_objects = []
-                    for line in lines:
-                        line = line.strip()
-                        if line:
-                            json_objects.append(json.loads(line))
-                    if json_objects:
-                        if len(json_objects) == 1:
-                            j = json_objects[0]
-                        else:
-                            j = json_objects  # 리스트로 처리
-                        schema = detect_schema(j)
+                # 실패하면 JSON Lines일 수 있으므로 뒤에서부터 마지막 유효 줄 하나만 파싱 (스키마 판별용)
+                j = last_json_record(txt, accept=None)
+                if j is None:
+                    raise ValueError("no json line")
+                schema = detect_schema(j)
             except Exception:
                 # 마지막으로 기존 방식 시도
                 try:
@@ -1375,7 +1610,7 @@ def download_and_score_file(key: str, query: str):
                 except Exception:
                     pass
 
-        sc = score_doc(query, txt, key=key)
+        sc = score_doc(query, txt, key=key, analysis=analysis)
         
         # 간단한 스키마 점수 (RAG 모드용)
         if schema == "raw_list": sc += 5
@@ -1387,7 +1622,8 @@ def download_and_score_file(key: str, query: str):
         return None
 
 # ===== 빠른 증거 스니핑 =====
-def quick_sensor_evidence(query: str, max_probe: int = 6) -> dict:
+def quick_sensor_evidence(query: str, max_probe: int = 6, analysis: Optional[QueryAnalysis] = None) -> dict:
+    analysis = _analysis_for(query, analysis)
     paginator = s3.get_paginator("list_objects_v2")
     pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=S3_PREFIX)
 
@@ -1407,7 +1643,8 @@ def quick_sensor_evidence(query: str, max_probe: int = 6) -> dict:
 
     scored = []
     with _f.ThreadPoolExecutor(max_workers=min(6, MAX_WORKERS)) as ex:
-        futs = {ex.submit(download_and_score_file, k, query): k for k in keys[:max_probe]}
+        score = request_trace.bind(download_and_score_file)
+        futs = {ex.submit(score, k, query, analysis): k for k in keys[:max_probe]}
         for f in _f.as_completed(futs):
             r = f.result()
             if r:
@@ -1443,7 +1680,43 @@ def _build_intent_prompt(query: str) -> str:
         "json:"
     )
 
-def _invoke_claude(messages, max_tokens=512, temperature=0.0, top_p=0.9, system=None):
+def _system_blocks(system):
+    """system 문자열 → 텍스트 블록 (프롬프트 캐시가 켜져 있으면 cache_control 표시, 블록 목록은 그대로)"""
+    if not isinstance(system, str):
+        return system
+    block = {"type": "text", "text": system}
+    if ENABLE_PROMPT_CACHE:
+        block["cache_control"] = {"type": "ephemeral"}
+    return [block]
+
+# 프롬프트 캐시 누적 통계 (system을 넘긴 호출만)
+PROMPT_CACHE_STATS = {"calls": 0, "hits": 0, "writes": 0, "input_tokens": 0,
+                      "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+def record_prompt_cache_usage(payload: dict) -> Optional[Dict]:
+    """
+    응답 usage에서 캐시 읽기/쓰기 토큰 수 추출 → {"status": "hit"|"write"|"miss", 토큰 수...}
+    usage가 없으면 None
+    """
+    usage = (payload or {}).get("usage") or {}
+    if not usage:
+        return None
+    read = int(usage.get("cache_read_input_tokens") or 0)
+    written = int(usage.get("cache_creation_input_tokens") or 0)
+    out = {
+        "status": "hit" if read else ("write" if written else "miss"),
+        "input_tokens": int(usage.get("input_tokens") or 0),
+        "cache_read_input_tokens": read,
+        "cache_creation_input_tokens": written,
+    }
+    PROMPT_CACHE_STATS["calls"] += 1
+    PROMPT_CACHE_STATS["hits"] += 1 if read else 0
+    PROMPT_CACHE_STATS["writes"] += 1 if written else 0
+    for k in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+        PROMPT_CACHE_STATS[k] += out[k]
+    return out
+
+def _claude_body(messages, max_tokens, temperature, top_p, system=None) -> dict:
     body = {
         "anthropic_version": "bedrock-2023-05-31",
         "messages": messages,
@@ -1452,7 +1725,11 @@ def _invoke_claude(messages, max_tokens=512, temperature=0.0, top_p=0.9, system=
         "top_p": top_p,
     }
     if system:
-        body["system"] = system
+        body["system"] = _system_blocks(system)
+    return body
+
+def _invoke_claude(messages, max_tokens=512, temperature=0.0, top_p=0.9, system=None):
+    body = _claude_body(messages, max_tokens, temperature, top_p, system)
 
     resp = bedrock_rt.invoke_model(
         modelId=INFERENCE_PROFILE_ARN,
@@ -1466,6 +1743,35 @@ def _invoke_claude(messages, max_tokens=512, temperature=0.0, top_p=0.9, system=
         for p in (payload.get("content") or [])
         if isinstance(p, dict) and p.get("type") == "text"
     ).strip()
+    if system:
+        payload["prompt_cache"] = record_prompt_cache_usage(payload)
+    return text, payload
+
+def _invoke_claude_stream(messages, max_tokens=512, temperature=0.0, top_p=0.9, system=None, on_delta=None):
+    """
+    _invoke_claude의 스트리밍 버전: 답변 조각마다 on_delta(text) 호출, 반환 형식은 동일 (text, payload)
+    스트림 API 호출이 조각 하나 받기 전에 실패하면 일반 호출로 대체하고 전체 답변을 한 조각으로 넘김
+    """
+    body = _claude_body(messages, max_tokens, temperature, top_p, system)
+    received = []
+
+    def _on_delta(text):
+        received.append(text)
+        if on_delta is not None:
+            on_delta(text)
+
+    try:
+        text, payload = invoke_claude_stream(bedrock_rt, INFERENCE_PROFILE_ARN, body, on_delta=_on_delta)
+        if system:
+            payload["prompt_cache"] = record_prompt_cache_usage(payload)
+        return text, payload
+    except Exception as e:
+        if received:
+            raise
+        print(f"[경고] 스트리밍 호출 실패, 일반 호출로 대체: {e}")
+    text, payload = _invoke_claude(messages, max_tokens, temperature, top_p, system)
+    if text and on_delta is not None:
+        on_delta(text)
     return text, payload
 
 @lru_cache(maxsize=256)
@@ -1485,16 +1791,16 @@ def classify_query_with_llm(query: str) -> dict:
     except Exception:
         return {"domain": "general", "confidence": 0.0}
 
-def _deterministic_sensor_signal(query: str) -> bool:
-    fields = detect_fields_in_query(query)
-    if not fields:
+def _deterministic_sensor_signal(query: str, analysis: Optional[QueryAnalysis] = None) -> bool:
+    a = _analysis_for(query, analysis)
+    if not a.fields:
         return False
-    has_time_literal = bool(extract_datetime_strings(query))
+    has_time_literal = bool(a.dt_strings)
     has_ko_time_tokens = any(tok in query for tok in _TIME_HINTS)
     has_range = any(tok in query for tok in _RANGE_HINTS)
     return has_time_literal or has_ko_time_tokens or has_range
 
-def decide_route(query: str) -> str:
+def decide_route(query: str, analysis: Optional[QueryAnalysis] = None) -> str:
     # UTF-8 문제 해결을 위한 간단한 센서 감지 (장소 키워드 포함)
     sensor_keywords = ["온도", "습도", "CO2", "이산화탄소", "공기질", "센서", "강의실", "실내", "실온", "방안", "교실", "사무실"]
     time_keywords = ["시", "분", "일", "월", "년", "전", "후", "오전", "오후", "현재", "지금", "최근", "오늘", "어제"]
@@ -1505,16 +1811,24 @@ def decide_route(query: str) -> str:
     if has_sensor and has_time:
         return "sensor"
     
-    if _deterministic_sensor_signal(query):
+    analysis = _analysis_for(query, analysis)
+    if _deterministic_sensor_signal(query, analysis):
         return "sensor"
 
+    # 로컬 분류기가 충분히 확신하면 Bedrock 라우터 호출 생략
+    local = get_intent_classifier()
+    if local is not None:
+        cls = local.classify(query)
+        if cls["confidence"] >= LOCAL_ROUTER_MIN_CONFIDENCE:
+            return "sensor" if cls["domain"] == "sensor_data" else "general"
+
     cls = classify_query_with_llm(query)
     dom, conf = cls["domain"], cls["confidence"]
 
     if dom == "sensor_data" and conf >= 0.6:
         return "sensor"
     if 0.4 <= conf < 0.6:
-        ev = quick_sensor_evidence(query)
+        ev = quick_sensor_evidence(query, analysis=analysis)
         if ev["has_schema"] and ev["best_score"] >= RELEVANCE_THRESHOLD:
             return "sensor"
         return "general"
@@ -1572,155 +1886,21 @@ def find_latest_sensor_data_from_s3(query: str) -> dict:
         return find_closest_sensor_data(now)
     
     
-    # 최근 데이터 검색을 위해 현재부터 과거로 역순 검색
-    latest_files = []
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    # 오프셋이 있는 경우 (3시간 전, 30분 전) 더 정밀하게 검색
-    if offset_value and offset_unit:
-        # 대상 시간 주변을 검색 (해당 시간 + 다음 시간까지)
-        search_hours = [target_time, target_time + timedelta(hours=1)]
-        
-        for search_time in search_hours:
-            year = search_time.strftime('%Y')
-            month = search_time.strftime('%m') 
-            day = search_time.strftime('%d')
-            hour = search_time.strftime('%H')
-            
-            # minavg 우선 (분 단위 정확도)
-            for prefix_path in ["minavg/"]:
-                try:
-                    search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/{hour}/"
-                    
-                    pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 200})
-                    all_files_in_hour = []
-                    for page in pages:
-                        for obj in page.get("Contents", []):
-                            k = obj["Key"]
-                            if k.lower().endswith(".json"):
-                                all_files_in_hour.append({
-                                    'key': k,
-                                    'last_modified': obj['LastModified'],
-                                    'path_time': search_time
-                                })
-                    
-                    if all_files_in_hour:
-                        latest_files.extend(all_files_in_hour)
-                        
-                except Exception as e:
-                    pass
-        
-        # 오프셋 검색에서 파일을 찾았으면 더 정밀한 선택 로직 적용
-        if latest_files:
-            # 가장 가까운 시간의 파일 선택
-            target_timestamp = int(target_time.strftime('%Y%m%d%H%M'))
-            best_file = None
-            min_time_diff = float('inf')
-            
-            for file_info in latest_files:
-                filename = file_info['key'].split('/')[-1]
-                if '_' in filename:
-                    file_timestamp_str = filename.split('_')[0]
-                    if len(file_timestamp_str) >= 12:
-                        try:
-                            file_timestamp = int(file_timestamp_str)
-                            time_diff = abs(file_timestamp - target_timestamp)
-                            if time_diff < min_time_diff:
-                                min_time_diff = time_diff
-                                best_file = file_info
-                        except:
-                            continue
-            
-            if best_file:
-                latest_files = [best_file]  # 최적 파일만 선택
-    
-    # 오프셋 검색에서도 파일을 찾지 못했다면, 더 넓은 범위에서 가장 가까운 시간부터 검색
-    if not latest_files:
-        # 대상 시간 기준으로 가장 가까운 시간부터 순차적으로 검색 (0, ±1, ±2, ±3...)
-        for hours_diff in range(0, 73):  # 0~72시간(3일) 차이까지
-            search_offsets = []
-            if hours_diff == 0:
-                search_offsets = [0]
-            else:
-                search_offsets = [-hours_diff, hours_diff]  # -3시간, +3시간 동시에 검색
-                
-            for hours_offset in search_offsets:
-                search_time = target_time + timedelta(hours=hours_offset)
-                year = search_time.strftime('%Y')
-                month = search_time.strftime('%m') 
-                day = search_time.strftime('%d')
-                hour = search_time.strftime('%H')
-                
-                # minavg, houravg 순으로 검색
-                for prefix_path in ["minavg/", "houravg/"]:
-                    try:
-                        search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/{hour}/"
-                        pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 200})
-                        
-                        for page in pages:
-                            for obj in page.get("Contents", []):
-                                k = obj["Key"]
-                                if k.lower().endswith(".json"):
-                                    latest_files.append({
-                                        'key': k,
-                                        'last_modified': obj['LastModified'],
-                                        'path_time': search_time
-                                    })
-                        
-                        # 첫 번째로 파일을 찾으면 중단 (가장 가까운 시간)
-                        if latest_files:
-                            break
-                            
-                    except Exception as e:
-                        pass
-                
-                # 파일을 찾았으면 더 이상 검색하지 않음
-                if latest_files:
-                    break
-            
-            # 파일을 찾았으면 더 이상 검색하지 않음  
-            if latest_files:
-                break
-        
-    # 가장 가까운 시간의 파일 선택 (오프셋 기반 또는 확장 검색)
-    if latest_files:
-        if offset_value and offset_unit:
-            # 오프셋이 있는 경우: 대상 시간에서 가장 가까운 파일 선택
-            target_timestamp = int(target_time.strftime('%Y%m%d%H%M'))
-            best_file = None
-            min_time_diff = float('inf')
-            
-            for file_info in latest_files:
-                filename = file_info['key'].split('/')[-1]
-                if '_' in filename:
-                    file_timestamp_str = filename.split('_')[0]
-                    if len(file_timestamp_str) >= 12:
-                        try:
-                            file_timestamp = int(file_timestamp_str)
-                            time_diff = abs(file_timestamp - target_timestamp)
-                            if time_diff < min_time_diff:
-                                min_time_diff = time_diff
-                                best_file = file_info
-                        except:
-                            continue
-            
-            if best_file:
-                latest_files = [best_file]
-            else:
-                # 파일명의 타임스탬프 부분으로 정렬 (최신 우선)
-                latest_files.sort(key=lambda x: x['key'].split('/')[-1], reverse=True)
-        else:
-            # 일반적인 경우: 가장 최근 파일
-            latest_files.sort(key=lambda x: x['key'].split('/')[-1], reverse=True)
-        latest_key = latest_files[0]['key']
-        
+    # 키 인덱스에서 대상 시간과 가장 가까운 파일 선택 (분 데이터 우선, 없으면 시간 평균)
+    try:
+        hit = _closest_indexed_key(target_time, ("minavg", "houravg"))
+    except Exception as e:
+        print(f"[오류] 키 인덱스 조회 실패: {e}")
+        hit = None
+
+    if hit:
+        latest_key, key_dt, _hours_diff = hit
         try:
-            obj = s3.get_object(Bucket=S3_BUCKET_DATA, Key=latest_key)
-            data = json.loads(obj['Body'].read().decode('utf-8'))
+            data = json.loads(get_object_cache().get_text(latest_key))
             return {
                 'key': latest_key,
                 'data': data,
-                'timestamp': latest_files[0]['path_time'].strftime('%Y-%m-%d %H:%M:%S')
+                'timestamp': key_dt.strftime('%Y-%m-%d %H:%M:%S')
             }
         except Exception as e:
             pass
@@ -1730,145 +1910,111 @@ def find_latest_sensor_data_from_s3(query: str) -> dict:
 def find_closest_available_data(target_dt: datetime):
     """대상 시간과 가장 가까운 시간의 데이터를 찾아 반환"""
     try:
-        s3 = boto3.client('s3', region_name=REGION)
-        paginator = s3.get_paginator("list_objects_v2")
+        # 키 인덱스에서 ±12시간 이내 가장 가까운 minavg/houravg 키 선택
+        hit = _closest_indexed_key(target_dt, ("minavg", "houravg"), max_hours=12)
+        if not hit:
+            return None
+        key, key_dt, time_diff = hit
         
-        # 검색할 시간 범위 (현재 시간 기준 ±72시간)
-        search_hours = 72
-        candidates = []
+        # 데이터 다운로드 및 처리
+        content = get_object_cache().get_text(key)
+        data = json.loads(content)
         
-        # ±72시간 범위에서 가능한 모든 시간 후보 생성
-        for hour_diff in range(-search_hours, search_hours + 1):
-            candidate_dt = target_dt + timedelta(hours=hour_diff)
-            candidates.append((candidate_dt, abs(hour_diff)))
+        # 데이터 포맷 확인
+        is_houravg = 'hourtemp' in data or 'houravg' in key
+        is_minavg = 'minavg' in key or 'mintrend' in key
         
-        # 시간 차이 순으로 정렬 (가장 가까운 시간부터)
-        candidates.sort(key=lambda x: x[1])
+        if is_minavg:
+            content_text = f"분별 측정 센서 데이터:\n"
+            if 'mintemp' in data:
+                content_text += f"온도: {data['mintemp']}도\n"
+            if 'minhum' in data:
+                content_text += f"습도: {data['minhum']}%\n"
+            if 'mingas' in data:
+                content_text += f"이산화탄소: {data['mingas']}ppm\n"
+        elif is_houravg:
+            content_text = f"시간별 평균 센서 데이터:\n"
+            if 'hourtemp' in data:
+                content_text += f"평균 온도: {data['hourtemp']}도\n"
+            if 'hourhum' in data:
+                content_text += f"평균 습도: {data['hourhum']}%\n"
+            if 'hourgas' in data:
+                content_text += f"평균 이산화탄소: {data['hourgas']}ppm\n"
+        else:
+            content_text = json.dumps(data, ensure_ascii=False, indent=2)
         
-        # 각 후보 시간에서 데이터 검색
-        for candidate_dt, time_diff in candidates[:24]:  # 최대 24시간까지만 검색
-            year = candidate_dt.strftime('%Y')
-            month = candidate_dt.strftime('%m') 
-            day = candidate_dt.strftime('%d')
-            hour = candidate_dt.strftime('%H')
-            
-            # minavg, houravg 순으로 검색
-            for prefix_path in ["minavg/", "houravg/"]:
-                try:
-                    # 시간별 폴더에서 검색
-                    search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/{hour}/"
-                    pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 50})
-                    
-                    for page in pages:
-                        for obj in page.get("Contents", []):
-                            key = obj["Key"]
-                            if key.lower().endswith(".json"):
-                                try:
-                                    # 데이터 다운로드 및 처리
-                                    response = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-                                    content = response['Body'].read().decode('utf-8')
-                                    data = json.loads(content)
-                                    
-                                    # 데이터 포맷 확인
-                                    is_houravg = 'hourtemp' in data or 'houravg' in key
-                                    is_minavg = 'minavg' in key or 'mintrend' in key
-                                    
-                                    if is_minavg:
-                                        content_text = f"분별 측정 센서 데이터:\n"
-                                        if 'mintemp' in data:
-                                            content_text += f"온도: {data['mintemp']}도\n"
-                                        if 'minhum' in data:
-                                            content_text += f"습도: {data['minhum']}%\n"
-                                        if 'mingas' in data:
-                                            content_text += f"이산화탄소: {data['mingas']}ppm\n"
-                                    elif is_houravg:
-                                        content_text = f"시간별 평균 센서 데이터:\n"
-                                        if 'hourtemp' in data:
-                                            content_text += f"평균 온도: {data['hourtemp']}도\n"
-                                        if 'hourhum' in data:
-                                            content_text += f"평균 습도: {data['hourhum']}%\n"
-                                        if 'hourgas' in data:
-                                            content_text += f"평균 이산화탄소: {data['hourgas']}ppm\n"
-                                    else:
-                                        content_text = json.dumps(data, ensure_ascii=False, indent=2)
-                                    
-                                    # 시간 정보 추가
-                                    timestamp_str = data.get('timestamp', '')
-                                    if timestamp_str:
-                                        try:
-                                            dt = datetime_cls.fromisoformat(timestamp_str.replace('T', ' '))
-                                            korean_time = f"{dt.year}년 {dt.month}월 {dt.day}일 {dt.hour}시"
-                                        except:
-                                            korean_time = timestamp_str
-                                    else:
-                                        korean_time = f"{candidate_dt.year}년 {candidate_dt.month}월 {candidate_dt.day}일 {candidate_dt.hour}시 (추정)"
-                                    
-                                    top_doc = {
-                                        'score': 100 - time_diff,  # 가까울수록 높은 점수
-                                        'schema': 'houravg' if is_houravg else 'minavg',
-                                        'content': content_text,
-                                        'id': key,
-                                        'tag': 'D1'
-                                    }
-                                    
-                                    context = f"[D1] {korean_time} 측정 데이터 (가장 가까운 시간, {time_diff}시간 차이) (s3://{S3_BUCKET_DATA}/{key})\n{content_text}\n"
-                                    
-                                    return {
-                                        'docs': [top_doc],
-                                        'context': context,
-                                        'time_diff': time_diff,
-                                        'key': key
-                                    }
-                                    
-                                except Exception as e:
-                                    continue
-                                    
-                except Exception as e:
-                    continue
+        # 시간 정보 추가
+        timestamp_str = data.get('timestamp', '')
+        if timestamp_str:
+            try:
+                dt = datetime_cls.fromisoformat(timestamp_str.replace('T', ' '))
+                korean_time = f"{dt.year}년 {dt.month}월 {dt.day}일 {dt.hour}시"
+            except:
+                korean_time = timestamp_str
+        else:
+            korean_time = f"{key_dt.year}년 {key_dt.month}월 {key_dt.day}일 {key_dt.hour}시 (추정)"
         
-        return None
+        top_doc = {
+            'score': 100 - time_diff,  # 가까울수록 높은 점수
+            'schema': 'houravg' if is_houravg else 'minavg',
+            'content': content_text,
+            'id': key,
+            'tag': 'D1'
+        }
+        
+        context = f"[D1] {korean_time} 측정 데이터 (가장 가까운 시간, {time_diff}시간 차이) (s3://{S3_BUCKET_DATA}/{key})\n{content_text}\n"
+        
+        return {
+            'docs': [top_doc],
+            'context': context,
+            'time_diff': time_diff,
+            'key': key
+        }
         
     except Exception as e:
         return None
 
 def find_minavg_data(target_time: datetime) -> dict:
     """특정 시간의 minavg 데이터 찾기"""
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
+    target_time = target_time.replace(second=0, microsecond=0)
+    index = get_sensor_index()
     
-    year = target_time.strftime('%Y')
-    month = target_time.strftime('%m')
-    day = target_time.strftime('%d')
-    hour = target_time.strftime('%H')
-    minute = target_time.strftime('%M')
+    # 압축된 날짜면 컬럼 파일의 해당 분 슬롯 (GET/JSON 파싱 없음)
+    try:
+        row = get_minute_store().lookup(target_time) if MinuteStore.is_sealed(target_time.date()) else None
+    except Exception as e:
+        print(f"[경고] 분 컬럼 저장소 조회 실패: {e}")
+        row = None
+    if row:
+        data = {'timestamp': target_time.isoformat()}
+        for name, value in zip(("mintemp", "minhum", "mingas"), row):
+            if value == value:  # NaN 제외
+                data[name] = round(value, 4)
+        return {
+            'key': minavg_key(target_time, f"{S3_PREFIX}minavg/"),
+            'data': data,
+            'timestamp': target_time.strftime('%Y-%m-%d %H:%M:%S')
+        }
     
     # minavg 파일 경로 패턴: minavg/2025/08/14/13/202508141305_minavg.json
-    target_pattern = f"{year}{month}{day}{hour}{minute}"
-    
-    
-    for prefix_path in ["minavg/", "mintrend/"]:
+    for family in ("minavg", "mintrend"):
+        if not index.is_warm(family) and get_presence_bitmaps().is_missing(family, target_time):
+            continue  # 비트맵상 없는 분 → LIST 없이 건너뜀
         try:
-            # 정확한 시간 폴더에서 검색
-            search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/{hour}/"
-            
-            pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 100})
-            
-            for page in pages:
-                for obj in page.get("Contents", []):
-                    key = obj["Key"]
-                    filename = key.split('/')[-1]
-                    
-                    if filename.lower().endswith(".json") and target_pattern in filename:
-                        try:
-                            obj_data = s3.get_object(Bucket=S3_BUCKET_DATA, Key=key)
-                            data = json.loads(obj_data['Body'].read().decode('utf-8'))
-                            return {
-                                'key': key,
-                                'data': data,
-                                'timestamp': target_time.strftime('%Y-%m-%d %H:%M:%S')
-                            }
-                        except Exception as e:
-                            continue
+            # 인덱스가 있으면 메모리 조회, 없으면 해당 시각 이상 첫 키 1개만 LIST (StartAfter, MaxKeys=1)
+            if index.is_warm(family):
+                key = index.get(family, target_time)
+            else:
+                hit = get_key_seeker().ceil(f"{S3_PREFIX}{family}/", target_time, not_after=target_time)
+                key = hit[1] if hit else None
+            if not key:
+                continue
+            data = json.loads(get_object_cache().get_text(key))
+            return {
+                'key': key,
+                'data': data,
+                'timestamp': target_time.strftime('%Y-%m-%d %H:%M:%S')
+            }
         except Exception as e:
             continue
     
@@ -1876,126 +2022,164 @@ def find_minavg_data(target_time: datetime) -> dict:
     return find_closest_sensor_data(target_time)
 
 def find_closest_sensor_data(target_time: datetime) -> dict:
-    """대상 시간에서 가장 가까운 센서 데이터 찾기 (개선된 버전)"""
-    s3 = boto3.client("s3", region_name=REGION)
-    paginator = s3.get_paginator("list_objects_v2")
-    
-    closest_files = []    
+    """대상 시간에서 가장 가까운 센서 데이터 찾기 (키 인덱스 기반, ±72시간)"""
+    # 시간 폴더 거리가 같으면 houravg, minavg 순 (시간 평균 우선)
+    try:
+        hit = _closest_indexed_key(target_time, ("houravg", "minavg"))
+    except Exception as e:
+        print(f"[오류] 키 인덱스 조회 실패: {e}")
+        return None
     
-    # 대상 시간 기준으로 가장 가까운 시간부터 순차적으로 검색 (0, ±1, ±2, ±3...)
-    for hours_diff in range(0, 73):  # 0~72시간(3일) 차이까지
-        search_offsets = []
-        if hours_diff == 0:
-            search_offsets = [0]
-        else:
-            search_offsets = [-hours_diff, hours_diff]  # -3시간, +3시간 동시에 검색
-            
-        for hours_offset in search_offsets:
-            search_time = target_time + timedelta(hours=hours_offset)
-            year = search_time.strftime('%Y')
-            month = search_time.strftime('%m') 
-            day = search_time.strftime('%d')
-            hour = search_time.strftime('%H')
+    if hit:
+        best_key, actual_time, _hours_diff = hit
+        try:
+            data = json.loads(get_object_cache().get_text(best_key))
             
-            # houravg, minavg 순으로 검색 (시간 평균 우선)
-            for prefix_path in ["houravg/", "minavg/"]:
-                try:
-                    search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/{hour}/"
-                    pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 200})
-                    
-                    for page in pages:
-                        for obj in page.get("Contents", []):
-                            k = obj["Key"]
-                            if k.lower().endswith(".json"):
-                                closest_files.append({
-                                    'key': k,
-                                    'last_modified': obj['LastModified'],
-                                    'path_time': search_time,
-                                    'hours_diff': abs(hours_offset)
-                                })
-                    
-                    # 첫 번째로 파일을 찾으면 중단 (가장 가까운 시간)
-                    if closest_files:
-                        break
-                        
-                except Exception as e:
-                    pass
+            # 실제 데이터 시간과 요청 시간의 차이 계산
+            time_diff_hours = abs((actual_time - target_time).total_seconds() / 3600)
             
-            # 파일을 찾았으면 더 이상 검색하지 않음
-            if closest_files:
-                break
-        
-        # 파일을 찾았으면 더 이상 검색하지 않음  
-        if closest_files:
-            break
-    
-    # 가장 가까운 시간의 파일 선택
-    if closest_files:
-        # 대상 시간에서 가장 가까운 파일 선택
-        target_timestamp = int(target_time.strftime('%Y%m%d%H%M'))
-        best_file = None
-        min_time_diff = float('inf')
-        
-        for file_info in closest_files:
-            filename = file_info['key'].split('/')[-1]
-            if '_' in filename:
-                file_timestamp_str = filename.split('_')[0]
-                if len(file_timestamp_str) >= 12:
-                    try:
-                        file_timestamp = int(file_timestamp_str)
-                        time_diff = abs(file_timestamp - target_timestamp)
-                        if time_diff < min_time_diff:
-                            min_time_diff = time_diff
-                            best_file = file_info
-                    except:
-                        continue
-        
-        if best_file:
-            try:
-                obj = s3.get_object(Bucket=S3_BUCKET_DATA, Key=best_file['key'])
-                data = json.loads(obj['Body'].read().decode('utf-8'))
-                
-                # 실제 데이터 시간과 요청 시간의 차이 계산
-                actual_time = best_file['path_time']
-                time_diff_hours = abs((actual_time - target_time).total_seconds() / 3600)
-                
-                
-                return {
-                    'key': best_file['key'],
-                    'data': data,
-                    'timestamp': best_file['path_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'requested_time': target_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'time_diff_hours': round(time_diff_hours, 1),
-                    'is_exact_match': time_diff_hours < 0.1
-                }
-            except Exception as e:
-                pass
+            return {
+                'key': best_key,
+                'data': data,
+                'timestamp': actual_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'requested_time': target_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'time_diff_hours': round(time_diff_hours, 1),
+                'is_exact_match': time_diff_hours < 0.1
+            }
+        except Exception as e:
+            pass
     
     return None
 
-def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHARS, max_files: int = MAX_FILES_TO_SCAN, top_k: int = TOP_K, session=None):
+# ===== 복수 시점 조회 (공유 스레드풀에서 병렬 처리) =====
+_LOOKUP_EXECUTOR: Optional[_f.ThreadPoolExecutor] = None
+
+def get_lookup_executor() -> _f.ThreadPoolExecutor:
+    global _LOOKUP_EXECUTOR
+    if _LOOKUP_EXECUTOR is None:
+        _LOOKUP_EXECUTOR = _f.ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="sensor-lookup")
+    return _LOOKUP_EXECUTOR
+
+def _traced_lookup_map(fn, *iterables):
+    """조회 실행기 map (요청 추적이 켜져 있으면 작업 호출도 같은 추적에 집계)"""
+    return get_lookup_executor().map(request_trace.bind(fn), *iterables)
+
+def find_sensor_data_batch(target_dts: List[datetime], gran: str) -> List[Optional[dict]]:
+    """
+    여러 시점의 센서 데이터를 동시에 조회 (동시 실행 수는 MAX_WORKERS로 제한)
+    반환 순서는 target_dts와 같고, 찾지 못했거나 실패한 시점은 None
+    """
+    lookup = find_closest_sensor_data if gran == "hour" else find_minavg_data
+    if len(target_dts) <= 1:
+        return [lookup(dt) for dt in target_dts]
+    
+    executor = get_lookup_executor()
+    lookup = request_trace.bind(lookup)
+    futures = [executor.submit(lookup, dt) for dt in target_dts]
+    results = []
+    for dt, fut in zip(target_dts, futures):
+        try:
+            results.append(fut.result())
+        except Exception as e:
+            print(f"[오류] 센서 데이터 조회 실패 ({dt}): {e}")
+            results.append(None)
+    return results
+
+# ===== 구간 집계 (분/시간 평균 시계열 → 통계 요약 블록) =====
+def _range_resolution(start: datetime, end: datetime) -> str:
+    return "minute" if end - start <= timedelta(hours=RANGE_MINUTE_MAX_HOURS) else "hour"
+
+def _family_between(family: str, start: datetime, end: datetime) -> List[Tuple[datetime, str]]:
+    """패밀리에서 [start, end] 구간 키 (인덱스가 있으면 bisect, 없으면 StartAfter LIST)"""
+    index = get_sensor_index()
+    if index.is_warm(family):
+        return index.between(family, start, end)
+    _warm_index_in_background(family)
+    return get_key_seeker().between(f"{S3_PREFIX}{family}/", start, end)
+
+def _gap_line(summary: Dict) -> str:
+    """구간 집계에 빠진 측정이 있으면 존재 비트맵 기준 빈 구간 한 줄 (S3 조회 없음)"""
+    if summary["coverage"] >= 1.0:
+        return ""
+    family = "minavg" if summary["resolution"] == "minute" else "houravg"
+    try:
+        gaps = get_presence_bitmaps().gaps(family, summary["start"], summary["end"])
+    except Exception as e:
+        print(f"[경고] 존재 비트맵 조회 실패: {e}")
+        return ""
+    return f"측정 없는 구간: {format_gaps(gaps, family)}\n" if gaps else ""
+
+def _gap_note(target_dt: datetime) -> str:
+    """대상 분에 minavg가 없다고 확정되면 앞뒤 측정 사이의 빈 구간 안내 (없으면 빈 문자열)"""
+    try:
+        fp = get_presence_bitmaps().family("minavg")
+        if not fp or not fp.knows(target_dt) or fp.has(target_dt):
+            return ""
+        before, after = fp.floor(target_dt), fp.ceil(target_dt)
+    except Exception:
+        return ""
+    first = before + fp.step if before else target_dt
+    last = after - fp.step if after else target_dt
+    return f"데이터 없는 구간: {format_gaps([(first, last)])}\n"
+
+def summarize_range(start: datetime, end: datetime, fields=None, resolution: str = None) -> Optional[Dict]:
+    """
+    [start, end] 구간 집계 → {"summary", "family", "text"} (데이터가 없으면 None)
+    압축된 날짜면 분 컬럼 저장소 (RANGE_STORE_MAX_HOURS까지)
+    그 외엔 분 평균(minavg → mintrend), 구간이 RANGE_MINUTE_MAX_HOURS보다 길면 시간 평균(houravg → hourtrend)
+    resolution(store / minute / hour)을 주면 검색 계획대로 (hour면 저장소/분 평균을 건너뜀)
+    빠진 측정이 있으면 빈 구간을 한 줄 덧붙임
+    """
+    if end - start > timedelta(days=RANGE_MAX_DAYS):
+        return None
+    if resolution in (None, "store") and end - start <= timedelta(hours=RANGE_STORE_MAX_HOURS):
+        try:
+            stored = get_minute_store().series(start, end)
+            summary = summarize_series(RangeSeries(start, end, "minute", *stored)) if stored else None
+        except Exception as e:
+            print(f"[경고] 분 컬럼 저장소 집계 실패: {e}")
+            summary = None
+        if summary:
+            return {"summary": summary, "family": "minute_store",
+                    "text": format_summary(summary, fields, tag="R1", source=" [minavg]") + _gap_line(summary)}
+    if resolution not in ("minute", "hour"):
+        resolution = _range_resolution(start, end)
+    if resolution == "minute":
+        families = ("minavg", "mintrend")
+    else:
+        families = ("houravg", "hourtrend")
+        start = start.replace(minute=0)
+    cache = get_object_cache()
+    for family in families:
+        try:
+            points = _family_between(family, start, end)
+            if not points:
+                continue
+            series = build_series(start, end, resolution, points, cache.get_text, _traced_lookup_map)
+            summary = summarize_series(series)
+        except Exception as e:
+            print(f"[오류] 구간 집계 실패 ({family}): {e}")
+            continue
+        if summary:
+            return {"summary": summary, "family": family,
+                    "text": format_summary(summary, fields, tag="R1", source=f" [{family}]") + _gap_line(summary)}
+    return None
+
+def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHARS, max_files: int = MAX_FILES_TO_SCAN, top_k: int = TOP_K, session=None, analysis: Optional[QueryAnalysis] = None, plan: Optional[RetrievalPlan] = None):
     # 통합된 검색 로직: 요청된 시간에서 가장 가까운 데이터 찾기
+    # plan이 있으면 예산에 맞춘 선택(극값 출처, 구간 해상도/길이, 시점 수, 스캔 파일 수)을 따름
     
     # 원본 질의 저장 (전처리되기 전)
     original_query = query
+    analysis = _analysis_for(query, analysis)
+    plan_options = plan.options if plan else {}
+    max_files = min(max_files, plan_options.get("scan_limit", max_files))
     
-    # 먼저 원본 질의로 일간 평균인지 확인 (우선순위 높음)
-    # 일간 평균 질의: ("평균" + "일" + 센서) 또는 ("오늘" + "평균" + 센서)
-    # 센서 관련 키워드 확장 (장소 키워드 포함)
-    sensor_keywords = ["온도", "습도", "공기질", "이산화탄소", "CO2", "gas", "강의실", "실내", "실온", "방안", "교실", "사무실"]
-    has_sensor_keywords = any(keyword in original_query for keyword in sensor_keywords)
-    
-    has_daily_keywords = (("평균" in original_query and "일" in original_query and has_sensor_keywords) or
-                         ("오늘" in original_query and "평균" in original_query and has_sensor_keywords) or
-                         ("오늘" in original_query and has_sensor_keywords) or
-                         (bool(re.search(r"\d{1,2}\s*월\s*\d{1,2}\s*일", original_query)) and has_sensor_keywords) or
-                         (("어제" in original_query or "그제" in original_query or "엊그제" in original_query or "내일" in original_query or "모레" in original_query) and has_sensor_keywords))
-    has_average_keywords = ("평균" in query and ("온도" in query or "습도" in query or "공기질" in query or "temperature" in query or "humidity" in query or "gas" in query))
-    
-    # 원본 질의에서 특정 시간이 언급된 경우 일간 평균이 아님
-    has_specific_time = bool(re.search(r"\d{1,2}\s*시|\d{1,2}\s*:\s*\d{1,2}|오전|오후", original_query))
-    
-    is_daily_avg_query = (has_daily_keywords and not has_specific_time)
+    # 먼저 원본 질의로 일간 평균인지 확인 (우선순위 높음, 판정은 QueryAnalysis)
+    has_daily_keywords = analysis.has_daily_keywords
+    has_average_keywords = analysis.has_average_keywords
+    has_specific_time = analysis.has_specific_time
+    is_daily_avg_query = analysis.is_daily_avg
     
     # 일간 평균 질의면 바로 처리
     # DEBUG: 조건 확인 로그
@@ -2005,31 +2189,14 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     print(f"[DEBUG] has_daily_keywords: {has_daily_keywords}")
     print(f"[DEBUG] has_specific_time: {has_specific_time}")
     
-    # 최고/최저 시간 질의 감지 ("어제 가장 더운 시간", "습도가 가장 낮은 시간" 등)
-    extrema_patterns = [
-        r"가장.*더운.*시간", r"가장.*따뜻한.*시간", r"최고.*온도.*시간",
-        r"가장.*차가운.*시간", r"가장.*시원한.*시간", r"최저.*온도.*시간", 
-        r"가장.*높은.*습도.*시간", r"최고.*습도.*시간", r"습도.*가장.*높은.*시간", r"가장.*습도.*가.*높은.*시간",
-        r"가장.*낮은.*습도.*시간", r"최저.*습도.*시간", r"습도.*가장.*낮은.*시간", r"가장.*습도.*가.*낮은.*시간",
-        r"가장.*높은.*공기질.*시간", r"최고.*공기질.*시간", r"공기질.*가장.*나쁜.*시간", r"공기질.*가장.*높은.*시간", r"가장.*공기질.*가.*높은.*시간", r"가장.*공기질.*가.*나쁜.*시간",
-        r"가장.*낮은.*공기질.*시간", r"최저.*공기질.*시간", r"공기질.*가장.*좋은.*시간", r"공기질.*가장.*낮은.*시간", r"가장.*공기질.*가.*낮은.*시간", r"가장.*공기질.*가.*좋은.*시간",
-        r"가장.*높은.*이산화탄소.*시간", r"최고.*이산화탄소.*시간", r"이산화탄소.*가장.*높은.*시간", r"가장.*이산화탄소.*가.*높은.*시간",
-        r"가장.*낮은.*이산화탄소.*시간", r"최저.*이산화탄소.*시간", r"이산화탄소.*가장.*낮은.*시간", r"가장.*이산화탄소.*가.*낮은.*시간",
-        r"최고.*온도", r"최저.*온도", r"최고.*습도", r"최저.*습도"
-    ]
-    has_extrema_keywords = any(re.search(pattern, original_query) for pattern in extrema_patterns)
-    
-    # 날짜 키워드 (오늘, 어제, 특정 날짜)
-    has_date_reference = ("오늘" in original_query or "어제" in original_query or "그제" in original_query or 
-                         "엊그제" in original_query or "내일" in original_query or "모레" in original_query or
-                         bool(re.search(r"\d{1,2}\s*월\s*\d{1,2}\s*일", original_query)))
-    
-    is_extrema_query = (has_extrema_keywords and has_date_reference)
+    # 최고/최저 시간 질의 감지 ("어제 가장 더운 시간", "습도가 가장 낮은 시간" 등 + 날짜 언급)
+    is_extrema_query = analysis.is_extrema
     
     if is_extrema_query:
         # 최고/최저 시간 질의 처리
         # print(f"[DEBUG-EXTREMA] 극값 질의 감지됨: {original_query}")
-        extrema_result = find_extrema_time_in_date(original_query)
+        extrema_result = find_extrema_time_in_date(original_query, source=plan_options.get("extrema_source", "raw"),
+                                                   max_reads=plan_options.get("extrema_max_reads"))
         # print(f"[DEBUG-EXTREMA] 극값 결과: {extrema_result}")
         if extrema_result:
             context = f"[D1] {extrema_result['description']}\n{extrema_result['context']}\n"
@@ -2111,7 +2278,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     
     # 1) 시간 정보 추출
     #print(f"[DEBUG-MAIN] query: {query}")
-    dt_strings = extract_datetime_strings(query)
+    dt_strings = list(analysis.dt_strings)
     #print(f"[DEBUG-MAIN] extract_datetime_strings 결과: {dt_strings}")
     #print(f"[DEBUG-MAIN] dt_strings 길이: {len(dt_strings)}")
     
@@ -2201,7 +2368,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     
     # 범위 쿼리 우선 확인 (일간 평균이 아닌 경우)
     if not is_daily_avg_query:
-        time_range = extract_time_range_from_query(query)
+        time_range = analysis.time_range
         if time_range:
             pass
             
@@ -2233,9 +2400,30 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
             dt_strings = time_range
     
     
-    offset_value, offset_unit = extract_time_offset(query)
+    offset_value, offset_unit = analysis.offset_value, analysis.offset_unit
     #print(f"[DEBUG-MAIN] offset_value: {offset_value}, offset_unit: {offset_unit}")
     
+    # 구간 질의: 시점별 문서를 나열하는 대신 구간 전체를 집계한 요약 블록 하나로 답변
+    if not is_daily_avg_query and not offset_value and analysis.range_start:
+        start_time = plan_options.get("range_start", analysis.range_start)
+        end_time = plan_options.get("range_end", analysis.range_end)
+        range_result = summarize_range(start_time, end_time, analysis.fields, resolution=plan_options.get("range_resolution"))
+        if range_result:
+            set_followup_context("time_range", {
+                "start_time": start_time,
+                "end_time": end_time,
+                "range_text": f"{start_time.strftime('%H시 %M분')}부터 {end_time.strftime('%H시 %M분')}까지"
+            }, session)
+            
+            range_doc = {
+                'score': 100,
+                'schema': 'range_summary',
+                'content': range_result['text'],
+                'id': f"range_{start_time:%Y%m%d%H%M}_{end_time:%Y%m%d%H%M}",
+                'tag': 'R1'
+            }
+            return [range_doc], range_result['text']
+    
     # 2) 대상 시간 계산
     target_dt = None
     
@@ -2281,7 +2469,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
         #print(f"[DEBUG-MAIN] 복수 시간 처리 경로")
         
         # 가장 구체적인 시간이 있으면 단일 시간으로 처리 (예: "13시 5분"의 경우)
-        gran = requested_granularity(query)
+        gran = analysis.granularity
         if gran == "minute":
             # 분 단위 질의의 경우 가장 구체적인 시간(분이 포함된) 하나만 사용
             specific_times = [dt for dt in dt_strings if ':05' in dt or ':0' in dt and dt != dt_strings[-1]]  # 00:00 제외
@@ -2348,24 +2536,21 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
             if dt:
                 target_dts.append(dt)
         
+        if len(target_dts) > plan_options.get("max_points", len(target_dts)):
+            print(f"[경고] 조회 예산 초과: 시점 {len(target_dts)}개 중 앞쪽 {plan_options['max_points']}개만 조회")
+            target_dts = target_dts[:plan_options["max_points"]]
+        
         if target_dts:
             # 각 시간에 대해 granularity 기반 검색
-            gran = requested_granularity(query)
+            gran = analysis.granularity
             
             all_docs = []
             context_parts = []
             
-            for i, target_dt in enumerate(target_dts):
-                pass
-                
-                # 각 시간에 대해 granularity별 검색
-                if gran == "hour":
-                    # houravg 검색 (기존 함수는 houravg 우선이므로 사용)
-                    closest_data = find_closest_sensor_data(target_dt)
-                else:
-                    # minavg 검색 - 직접 구현
-                    closest_data = find_minavg_data(target_dt)
-                
+            # 각 시간의 조회를 한 번에 병렬 실행 (hour: houravg 우선, 그 외: minavg → houravg fallback)
+            lookups = find_sensor_data_batch(target_dts, gran)
+            
+            for i, (target_dt, closest_data) in enumerate(zip(target_dts, lookups)):
                 if closest_data:
                     tag = f"D{i+1}"
                     data = closest_data['data']
@@ -2485,7 +2670,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
         target_dt = parse_dt(dt_strings[0])
         #print(f"[DEBUG-RETRIEVE] parse_dt 결과: {target_dt}")
         if target_dt:
-            gran = requested_granularity(query)
+            gran = analysis.granularity
             
             # granularity별 검색
             if gran == "hour":
@@ -2592,7 +2777,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     else:
         # 시간 정보 없음 → 최근 데이터
         # "현재"/"지금" 쿼리의 경우 일관된 최근 데이터 제공을 위해 find_closest_sensor_data 사용
-        if is_recent_query(query):
+        if analysis.is_recent:
             # KST 기준 현재 시간 생성 (일관성을 위해)
             kst_now = datetime_cls.now(KST).replace(tzinfo=None)
             closest_data = find_closest_sensor_data(kst_now)
@@ -2664,7 +2849,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     # (granularity 기반 검색을 먼저 시도하도록 주석 처리)
     
     # 4) 시간 기반 검색 실패 시 기존 방식으로 fallback
-    dt_strings = extract_datetime_strings(query)
+    dt_strings = list(analysis.dt_strings)
     target_dt = None
     date_prefixes = []
     
@@ -2693,10 +2878,11 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                 #print(f"[DEBUG-MAIN] 추출된 target_dt: {target_dt}, date_prefix: {date_prefix}")
                 break
     
-    gran = requested_granularity(query)
+    gran = analysis.granularity
     
     paginator = s3.get_paginator("list_objects_v2")
     priority_keys = []
+    key_sizes: Dict[str, Optional[int]] = {}  # LIST로 본 객체 크기 (스캔 점수 상한용)
     
     # 날짜가 명시된 경우 해당 날짜 폴더만 검색
     if date_prefixes:
@@ -2714,6 +2900,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                     for page in pages:
                         for obj in page.get("Contents", []):
                             k = obj["Key"]
+                            key_sizes[k] = obj.get("Size")
                             if k.lower().endswith(".json"):
                                 # 정확한 시간 매칭 우선
                                 if hour_prefix and hour_prefix in k:
@@ -2735,6 +2922,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                         for page in pages:
                             for obj in page.get("Contents", []):
                                 k = obj["Key"]
+                                key_sizes[k] = obj.get("Size")
                                 if k.lower().endswith(".json") and date_prefix in k:
                                     # 정확한 시간 매칭 우선
                                     if hour_prefix and hour_prefix in k:
@@ -2767,6 +2955,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                     for page in pages:
                         for obj in page.get("Contents", []):
                             k = obj["Key"]
+                            key_sizes[k] = obj.get("Size")
                             filename = k.split('/')[-1]  # 파일명만 추출
                             if filename.lower().endswith(".json"):
                                 # 정확한 분 매칭 우선
@@ -2791,6 +2980,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                         for page in pages:
                             for obj in page.get("Contents", []):
                                 k = obj["Key"]
+                                key_sizes[k] = obj.get("Size")
                                 filename = k.split('/')[-1]
                                 if filename.lower().endswith(".json") and target_datetime in filename:
                                     priority_keys.insert(0, k)
@@ -2819,6 +3009,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                         for page in pages:
                             for obj in page.get("Contents", []):
                                 k = obj["Key"]
+                                key_sizes[k] = obj.get("Size")
                                 if k.lower().endswith(".json"):
                                     target_hour_pattern = f"{date_prefix}{hour_prefix}"  # 202508111
                                     if target_hour_pattern in k:
@@ -2841,6 +3032,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                             for page in pages:
                                 for obj in page.get("Contents", []):
                                     k = obj["Key"]
+                                    key_sizes[k] = obj.get("Size")
                                     if k.lower().endswith(".json"):
                                         target_hour_pattern = f"{date_prefix}{hour_prefix}"  # 202508111
                                         if target_hour_pattern in k:
@@ -2866,6 +3058,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                     for page in pages:
                         for obj in page.get("Contents", []):
                             k = obj["Key"]
+                            key_sizes[k] = obj.get("Size")
                             if k.lower().endswith(".json"):
                                 priority_keys.append(k)
                             if len(priority_keys) >= 80:
@@ -2881,6 +3074,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                     for page in pages:
                         for obj in page.get("Contents", []):
                             k = obj["Key"]
+                            key_sizes[k] = obj.get("Size")
                             if k.lower().endswith(".json"):
                                 priority_keys.append(k)
                             if len(priority_keys) >= 80:
@@ -2898,6 +3092,7 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                     for page in pages:
                         for obj in page.get("Contents", []):
                             k = obj["Key"]
+                            key_sizes[k] = obj.get("Size")
                             if k.lower().endswith(".json"):
                                 priority_keys.append(k)
                             if len(priority_keys) >= 60:
@@ -2917,40 +3112,42 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
     if not all_keys and offset_value and offset_unit:
         print(f"[Fallback] 대상 날짜({target_dt.strftime('%Y-%m-%d') if target_dt else 'N/A'})에 데이터가 없어 주변 날짜에서 검색합니다.")
         
-        # 대상 시간 주변 ±3일 범위에서 검색
-        fallback_keys = []
-        for days_offset in range(-3, 4):  # -3일부터 +3일까지
-            if target_dt:
-                search_date = target_dt + timedelta(days=days_offset)
+        # 대상 시간 주변 ±3일 범위에서 검색 (존재 비트맵이 있으면 LIST 없이 키 선택)
+        fallback_keys = (get_presence_bitmaps().keys_near(target_dt, days=3, limit=20) if target_dt else None) or []
+        if not fallback_keys:
+            for days_offset in range(-3, 4):  # -3일부터 +3일까지
+                if target_dt:
+                    search_date = target_dt + timedelta(days=days_offset)
                 
-                # minavg와 houravg에서 해당 날짜 검색
-                for prefix_path in ["minavg/", "houravg/"]:
-                    try:
-                        year = search_date.strftime('%Y')
-                        month = search_date.strftime('%m')
-                        day = search_date.strftime('%d')
+                    # minavg와 houravg에서 해당 날짜 검색
+                    for prefix_path in ["minavg/", "houravg/"]:
+                        try:
+                            year = search_date.strftime('%Y')
+                            month = search_date.strftime('%m')
+                            day = search_date.strftime('%d')
                         
-                        search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/"
-                        pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 50})
+                            search_prefix = f"{S3_PREFIX}{prefix_path}{year}/{month}/{day}/"
+                            pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=search_prefix, PaginationConfig={'MaxItems': 50})
                         
-                        for page in pages:
-                            for obj in page.get("Contents", []):
-                                k = obj["Key"]
-                                if k.lower().endswith(".json"):
-                                    fallback_keys.append(k)
+                            for page in pages:
+                                for obj in page.get("Contents", []):
+                                    k = obj["Key"]
+                                    key_sizes[k] = obj.get("Size")
+                                    if k.lower().endswith(".json"):
+                                        fallback_keys.append(k)
+                                    if len(fallback_keys) >= 20:
+                                        break
                                 if len(fallback_keys) >= 20:
                                     break
-                            if len(fallback_keys) >= 20:
-                                break
                         
-                        if len(fallback_keys) >= 10:  # 충분한 데이터를 찾으면 중단
-                            break
+                            if len(fallback_keys) >= 10:  # 충분한 데이터를 찾으면 중단
+                                break
                             
-                    except Exception as e:
-                        pass
+                        except Exception as e:
+                            pass
                 
-                if len(fallback_keys) >= 10:
-                    break
+                    if len(fallback_keys) >= 10:
+                        break
         
         if fallback_keys:
             all_keys = fallback_keys[:max_files]
@@ -2969,7 +3166,8 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                 content = f"요청한 시간의 센서 데이터:\n"
             else:
                 content = f"요청한 시간({target_dt.strftime('%Y-%m-%d %H:%M')})에 정확한 데이터가 없어 가장 가까운 시간의 데이터를 제공합니다:\n"
-                content += f"실제 데이터 시간: {closest_data['timestamp']} (약 {time_diff_hours}시간 차이)\n\n"
+                content += f"실제 데이터 시간: {closest_data['timestamp']} (약 {time_diff_hours}시간 차이)\n"
+                content += _gap_note(target_dt) + "\n"
             
             data = closest_data.get('data', {})
             if 'temperature' in data:
@@ -3002,7 +3200,8 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                 content = f"요청한 시간의 센서 데이터:\n"
             else:
                 content = f"요청한 시간({target_dt.strftime('%Y-%m-%d %H:%M')})에 정확한 데이터가 없어 가장 가까운 시간의 데이터를 제공합니다:\n"
-                content += f"실제 데이터 시간: {closest_data['timestamp']} (약 {time_diff_hours}시간 차이)\n\n"
+                content += f"실제 데이터 시간: {closest_data['timestamp']} (약 {time_diff_hours}시간 차이)\n"
+                content += _gap_note(target_dt) + "\n"
             
             data = closest_data.get('data', {})
             if 'temperature' in data:
@@ -3030,16 +3229,16 @@ def retrieve_documents_from_s3(query: str, limit_chars: int = LIMIT_CONTEXT_CHAR
                 return closest_data['docs'], closest_data['context']
         return [], ""
 
-    scored = []
-    with _f.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_key = {executor.submit(download_and_score_file, key, query): key for key in all_keys}
-        for future in _f.as_completed(future_to_key):
-            result = future.result()
-            if result: scored.append(result)
-
-    if not scored: return [], ""
+    # 상위 top_k만 힙에 유지하며 스트리밍 스코어링 (동시 다운로드 제한, 키·LIST 크기 기반 점수 상한으로 조기 종료)
+    top, scan_stats = stream_top_k(
+        all_keys, request_trace.bind(lambda key: download_and_score_file(key, query, analysis)), top_k,
+        bound_fn=lambda key: _score_bound(key, analysis, key_sizes.get(key)),
+        max_in_flight=SCAN_MAX_IN_FLIGHT, max_workers=MAX_WORKERS,
+    )
+    if scan_stats["early_stop"]:
+        print(f"[DEBUG] 문서 스캔 조기 종료: 후보 {scan_stats['candidates']}개 중 {scan_stats['submitted']}개만 다운로드")
 
-    top = sorted(scored, key=lambda x: x["score"], reverse=True)[:top_k]
+    if not top: return [], ""
 
     # 컨텍스트(LLM 백업용)
     parts, context_length = [], 0
@@ -3080,6 +3279,8 @@ def _get_last_ctx(session=None):
         return LAST_SENSOR_CTX
 
 def find_minavg_doc_for_minute(target_dt: datetime, max_scan: int = MAX_FILES_TO_SCAN):
+    target_query = f"{target_dt}"
+    analysis = analyze_query(target_query)
     paginator = s3.get_paginator("list_objects_v2")
     pages = paginator.paginate(Bucket=S3_BUCKET_DATA, Prefix=S3_PREFIX)
     scanned = 0
@@ -3092,7 +3293,7 @@ def find_minavg_doc_for_minute(target_dt: datetime, max_scan: int = MAX_FILES_TO
             if gran == "minute" and key_dt and \
                (key_dt.year, key_dt.month, key_dt.day, key_dt.hour, key_dt.minute) == \
                (target_dt.year, target_dt.month, target_dt.day, target_dt.hour, target_dt.minute):
-                d = download_and_score_file(k, f"{target_dt}")
+                d = download_and_score_file(k, target_query, analysis)
                 if d and d.get("schema") == "minavg":
                     d["tag"] = d.get("tag","D?")
                     return d
@@ -3105,18 +3306,12 @@ def find_minavg_doc_for_minute(target_dt: datetime, max_scan: int = MAX_FILES_TO
 
 
 # ===== 정확 모드 =====
-def find_sensor_data_from_s3_logs(query: str) -> Optional[Dict]:
+def find_sensor_data_from_s3_logs(query: str, analysis: Optional[QueryAnalysis] = None) -> Optional[Dict]:
     """
     S3 로그 데이터에서 해당 시간의 센서 데이터를 찾는 함수
     """
     # 요청된 시간 추출
-    target_dt = None
-    dt_strings = extract_datetime_strings(query)
-    for ds in dt_strings:
-        dt = parse_dt(ds)
-        if dt:
-            target_dt = dt
-            break
+    target_dt = _analysis_for(query, analysis).target_dt
     
     if not target_dt:
         return None
@@ -3200,6 +3395,8 @@ def find_sensor_data_from_s3_logs(query: str) -> Optional[Dict]:
 CHATLOG_PREFIX = "chatlogs/"
 ENABLE_CHATLOG_SAVE = True
 MAX_HISTORY_TURNS = 50  # 전체 세션 기억하도록 증가
+HISTORY_VERBATIM_TURNS = 4    # 프롬프트에 원문으로 넣는 최근 턴 수 (그 이전은 한 줄 요약)
+HISTORY_TOKEN_BUDGET = 2000   # 프롬프트 히스토리 블록 추정 토큰 상한
 
 # 세션 관리 클래스
 class UserSession:
@@ -3234,6 +3431,9 @@ class UserSession:
         # recent_context 초기화 (바로 이전 질문 추적용)
         if not hasattr(self, 'recent_context'):
             self.recent_context = {}
+        
+        # 프롬프트 히스토리 창 (이전 대화 요약은 히스토리에서 다시 만들어지므로 저장하지 않음)
+        self.history_window = new_history_window()
             
         self.created_at = datetime.now(KST)
         self.last_activity = datetime.now(KST)
@@ -3246,22 +3446,24 @@ class UserSession:
         return self.turn_id
     
     def add_to_history(self, query: str, answer: str, route: str):
-        self.history.append({"query": query, "answer": answer, "route": route})
+        turn = {"query": query, "answer": answer, "route": route}
+        self.history.append(turn)
         # 히스토리 길이 제한
         if len(self.history) > MAX_HISTORY_TURNS:
             self.history = self.history[-MAX_HISTORY_TURNS:]
-        # 자동 저장
-        self.save_to_file()
+        # 자동 저장 (이번 턴만 저널에 추가)
+        self.save_to_file(turn)
     
-    def save_to_file(self):
-        """현재 세션을 파일에 저장"""
+    def save_to_file(self, turn: Dict = None):
+        """현재 세션을 저널에 기록 (turn이 없으면 컨텍스트 상태만)"""
         save_session_history(
             self.session_id, 
             self.history, 
             self.turn_id, 
             self.last_sensor_ctx, 
             self.followup_timestamp,
-            getattr(self, 'followup_context', {})
+            getattr(self, 'followup_context', {}),
+            turn=turn,
         )
     
     def clear_last_sensor_ctx(self):
@@ -3412,23 +3614,24 @@ def clear_followup_timestamp(session=None):
         global _FOLLOWUP_TIMESTAMP
         _FOLLOWUP_TIMESTAMP = None
 
-def expand_followup_query_with_last_window(query: str, session=None) -> str:
+def expand_followup_query_with_last_window(query: str, session=None, analysis: Optional[QueryAnalysis] = None) -> str:
     """후속 질문에 이전 질문의 정확한 시간 정보 추가 (개선된 시간 참조 구분)"""
     #print(f"[DEBUG-FOLLOWUP] 입력 쿼리: '{query}'")
+    analysis = _analysis_for(query, analysis)
     
     # 현재 질문에 이미 시간 정보가 있으면 후속질문이 아님
-    current_dt_strings = extract_datetime_strings(query)
+    current_dt_strings = analysis.dt_strings
     if current_dt_strings:
         #print(f"[DEBUG-FOLLOWUP] 시간 정보 있음, 확장 안함")
         return query
     
     # 상대적 시간 표현이 있으면 후속질문이 아님 (직접 처리)
-    offset_value, offset_unit = extract_time_offset(query)
+    offset_value, offset_unit = analysis.offset_value, analysis.offset_unit
     if offset_value and offset_unit:
         return query
     
     # 최근/현재 데이터 요청은 후속질문이 아님 (독립적인 새 질문)
-    if is_recent_query(query):
+    if analysis.is_recent:
         return query
     
     # 센서 관련 질문이면서 시간 정보가 없는 경우도 후속질문으로 처리 (장소 키워드 포함)
@@ -3549,16 +3752,17 @@ def expand_followup_query_with_last_window(query: str, session=None) -> str:
         return query
     return f"{query} (기준 구간: {s.strftime('%Y-%m-%d %H:%M:%S')}~{e.strftime('%Y-%m-%d %H:%M:%S')})"
 
-def _build_history_block(history: List[Dict]) -> str:
-    if not history:
-        return ""
-    lines = []
-    for h in history[-MAX_HISTORY_TURNS:]:
-        a = h.get("answer", "")
-        if len(a) > 1000:  # 히스토리 길이 제한 확장
-            a = a[:1000] + " …(이하 생략)"
-        lines.append(f"Q: {h.get('query','')}\nA: {a}")
-    return "\n\n[이전 대화(참고용)]\n" + "\n\n".join(lines) + "\n"
+def new_history_window() -> HistoryWindow:
+    return HistoryWindow(verbatim_turns=HISTORY_VERBATIM_TURNS, token_budget=HISTORY_TOKEN_BUDGET)
+
+def _build_history_block(history: List[Dict], window: Optional[HistoryWindow] = None) -> str:
+    """
+    최근 턴 원문 + 이전 대화 요약 (HISTORY_TOKEN_BUDGET 이내)
+    window: 세션의 히스토리 창 (요약을 증분으로 이어감), 없으면 이번 호출에서만 쓰는 창
+    """
+    if window is None:
+        window = new_history_window()
+    return window.build_block(history or [])
 
 def save_turn_to_s3(
     session_id: str,
@@ -3609,11 +3813,16 @@ def save_turn_to_s3(
                 return text
         
         cleaned_rec = clean_surrogate_chars(rec)
+        body = json.dumps(cleaned_rec, ensure_ascii=False).encode("utf-8")
         
+        writer = get_write_behind()
+        if writer is not None:
+            writer.put(CHATLOG_BUCKET, key, body, "application/json")
+            return key
         s3_logs.put_object(
             Bucket=CHATLOG_BUCKET,
             Key=key,
-            Body=json.dumps(cleaned_rec, ensure_ascii=False).encode("utf-8"),
+            Body=body,
             ContentType="application/json",
         )
         return key
@@ -3623,77 +3832,90 @@ def save_turn_to_s3(
         return None
 
 # ===== 프롬프트 =====
-def build_prompt(query: str, context: str, history: List[Dict] = None) -> str:
-    hist_block = _build_history_block(history or [])
+# 고정 지침은 system(Bedrock 프롬프트 캐시 대상), 매 턴 바뀌는 현재 시간/이전 대화/데이터/질문은 user 메시지
+SENSOR_SYSTEM_PROMPT = (
+    "당신은 친근하고 전문적인 스마트홈 어시스턴트야. 실시간 센서 데이터를 바탕으로 사용자에게 도움이 되는 정보를 제공해.\n\n"
+    
+    "사용자가 현재 시간을 물어보거나 '지금', '현재'라는 표현을 사용하면 반드시 사용자 메시지의 **현재 시간**을 사용해.\n"
+    "절대로 이전 대화나 센서 데이터의 시간과 혼동하지 마.\n\n"
+    
+    "**중요**: 사용자 메시지의 센서 데이터 섹션에 특정 날짜와 시간의 데이터가 제공되어 있다면, 그 데이터를 사용해서 답변해.\n"
+    "현재 시간과 센서 데이터의 시간을 절대 혼동하지 마.\n\n"
+    
+    "답변 가이드라인:\n"
+    "1. 반드시 사용자 메시지의 센서 데이터 섹션만을 참조해서 답변해. 다른 날짜나 시간의 데이터는 언급하지 마\n"
+    "2. 센서 데이터에 정확한 날짜와 시간이 표시되어 있으면 해당 데이터를 사용해\n"
+    "3. 물어보는 질의를 명확히 제시하고 현재 상황을 친근하게 설명해\n"
+    "4. 측정 시점을 정확히 언급해 (예: '8월 11일 14시 1분') - 24시간제로 표시\n"
+    "5. 상황에 따른 실용적인 조언을 해 (에어컨, 환기, 제습기 등)\n"
+    "6. 건강이나 편안함과 관련된 팁을 제공해\n"
+    "7. 온도 기준: 18도 미만(춥다), 18-22도(시원), 22-26도(적정), 26-30도(따뜻), 30도이상(더워), 대신 온도를 물어보면 대답해\n"
+    "8. 습도 기준: 30%미만(건조), 30-40%(쾌적), 40-60%(적정), 60-70%(습함), 70%이상(매우습함), 대신 습도를 물어보면 대답해\n"
+    "9. CO2 기준: 400ppm미만(매우깨끗), 400-600ppm(좋음), 600-1000ppm(보통), 1000-1500ppm(환기필요), 1500ppm이상(환기권장), 대신 공기질을 물어보면 대답해\n"
+    "10. 반드시 데이터 출처 태그([D1], [D2] 등)를 포함하지마\n"
+    "11. 이모티콘은 사용하지 마\n" 
+    "12. **, 강조하는 특수문자는 사용하지 마\n"
+    "13. 사용자가 질문한 센서 정보만 답변해 (온도만 물어보면 온도만, 습도만 물어보면 습도만, 공기질만 물어보면 이산화탄소만)\n"
+    "14. 공기질은 이산화탄소로 대답해\n"
+    "15. gas는 이산화탄소, CO2와 같으니 gas, CO2는 모두 이산화탄소로 대답해\n"
+    "16. 몇 시간 전에 데이터를 물어볼 때, 같은 시간, 같은 분이면 같은 데이터야. (예시: 5시 1분의 3시간 전은 2시 1분인데, 2시 1분 데이터가 있으니 같은거)\n"
+    "17. 이전, 방금, 금방의 내용이나 대화 기록을 물을 때는 사용자 메시지의 [이전 대화] 섹션을 참조해서 정확하게 대답해\n"
+    "18. [이전 대화]를 참조하는데, 물어본 질문에만 대답해\n"
+    "19. '현재 시간'이나 '지금'을 말할 때는 반드시 사용자 메시지의 **현재 시간**을 사용해. 이전 대화의 시간과 혼동하지 마\n"
+    "20. 센서 데이터 시간과 현재 시간을 명확히 구분해서 답변해\n"
+    "21. 몇 월인지 말하지 않을 때, 몇 월인지 물어보고, 현재 있는 데이터에 기반해서 말해\n"
+    "22. 몇 일만 적는다면 몇 월을 말씀하시는 걸까요? 라고 말해\n"
+    "23. 컨텍스트에 없는 내용은 추측하지 마"
+)
+
+GENERAL_SYSTEM_PROMPT = (
+    "너는 유능한 AI 어시스턴트야. 사용자의 질문에 대해 친절하고 정확하게 답변해줘.\n"
+    "필요한 만큼 충분히 설명하되, 명확하고 이해하기 쉽게 답변해줘.\n\n"
+    "답변 가이드라인:\n"
+    "1. 이전 대화나 질문 기록을 물어보면 사용자 메시지의 [이전 대화] 섹션을 정확히 참조해서 답변해\n"
+    "2. '내가 물어본 질문', '방금 뭐라고 했어' 등은 이전 대화에서 정확히 찾아서 답변해\n"
+    "3. 데이터에 없는 내용은 추측하지 말고 '모른다'고 답변해\n"
+    "4. **은 사용하지 마\n\n"
+    "사용자가 현재 시간을 물어보면 사용자 메시지의 현재 시간으로 답변해줘."
+)
+
+def build_prompt_parts(query: str, context: str, history: List[Dict] = None,
+                       history_window: Optional[HistoryWindow] = None) -> Tuple[str, str]:
+    """센서 답변 프롬프트 → (system, user 메시지)"""
+    hist_block = _build_history_block(history or [], history_window)
     current_time = datetime.now().strftime('%Y년 %m월 %d일 %H시 %M분')
     
-    return (
-        "당신은 친근하고 전문적인 스마트홈 어시스턴트야. 실시간 센서 데이터를 바탕으로 사용자에게 도움이 되는 정보를 제공해.\n\n"
-        
-        f"**현재 시간:** {current_time}\n"
-        "사용자가 현재 시간을 물어보거나 '지금', '현재'라는 표현을 사용하면 반드시 위의 현재 시간을 사용해.\n"
-        "절대로 이전 대화나 센서 데이터의 시간과 혼동하지 마.\n\n"
-        
-        "**중요**: 아래 센서 데이터 섹션에 특정 날짜와 시간의 데이터가 제공되어 있다면, 그 데이터를 사용해서 답변해.\n"
-        "현재 시간과 센서 데이터의 시간을 절대 혼동하지 마.\n\n"
-
-        "**중요**: "
-        
-        "답변 가이드라인:\n"
-        "1. 반드시 위의 센서 데이터 섹션만을 참조해서 답변해. 다른 날짜나 시간의 데이터는 언급하지 마\n"
-        "2. 센서 데이터에 정확한 날짜와 시간이 표시되어 있으면 해당 데이터를 사용해\n"
-        "3. 물어보는 질의를 명확히 제시하고 현재 상황을 친근하게 설명해\n"
-        "4. 측정 시점을 정확히 언급해 (예: '8월 11일 14시 1분') - 24시간제로 표시\n"
-        "5. 상황에 따른 실용적인 조언을 해 (에어컨, 환기, 제습기 등)\n"
-        "6. 건강이나 편안함과 관련된 팁을 제공해\n"
-        "7. 온도 기준: 18도 미만(춥다), 18-22도(시원), 22-26도(적정), 26-30도(따뜻), 30도이상(더워), 대신 온도를 물어보면 대답해\n"
-        "8. 습도 기준: 30%미만(건조), 30-40%(쾌적), 40-60%(적정), 60-70%(습함), 70%이상(매우습함), 대신 습도를 물어보면 대답해\n"
-        "9. CO2 기준: 400ppm미만(매우깨끗), 400-600ppm(좋음), 600-1000ppm(보통), 1000-1500ppm(환기필요), 1500ppm이상(환기권장), 대신 공기질을 물어보면 대답해\n"
-        "10. 반드시 데이터 출처 태그([D1], [D2] 등)를 포함하지마\n"
-        "11. 이모티콘은 사용하지 마\n" 
-        "12. **, 강조하는 특수문자는 사용하지 마\n"
-        "13. 사용자가 질문한 센서 정보만 답변해 (온도만 물어보면 온도만, 습도만 물어보면 습도만, 공기질만 물어보면 이산화탄소만)\n"
-        "14. 공기질은 이산화탄소로 대답해\n"
-        "15. gas는 이산화탄소, CO2와 같으니 gas, CO2는 모두 이산화탄소로 대답해\n"
-        "16. 몇 시간 전에 데이터를 물어볼 때, 같은 시간, 같은 분이면 같은 데이터야. (예시: 5시 1분의 3시간 전은 2시 1분인데, 2시 1분 데이터가 있으니 같은거)\n"
-        "17. 이전, 방금, 금방의 내용이나 대화 기록을 물을 때는 위의 [이전 대화] 섹션을 참조해서 정확하게 대답해\n"
-        "18. [이전 대화]를 참조하는데, 물어본 질문에만 대답해\n"
-        "19. '현재 시간'이나 '지금'을 말할 때는 반드시 위의 **현재 시간**을 사용해. 이전 대화의 시간과 혼동하지 마\n"
-        "20. 센서 데이터 시간과 현재 시간을 명확히 구분해서 답변해\n"
-        "21. 몇 월인지 말하지 않을 때, 몇 월인지 물어보고, 현재 있는 데이터에 기반해서 말해\n"
-        "22. 몇 일만 적는다면 몇 월을 말씀하시는 걸까요? 라고 말해"
-        "23. 컨텍스트에 없는 내용은 추측하지 마\n\n"
-        
+    return SENSOR_SYSTEM_PROMPT, (
+        f"**현재 시간:** {current_time}\n\n"
         f"{hist_block}"
         f"**센서 데이터:**\n{context if context else '데이터를 찾을 수 없습니다.'}\n\n"
         f"**사용자 질문:** {query}\n\n"
         "위 센서 데이터를 참고해서 친근하고 도움이 되는 답변을 해"
     )
 
-def build_general_prompt(query: str, history: List[Dict] = None) -> str:
-    hist_block = _build_history_block(history or [])
+def build_general_prompt_parts(query: str, history: List[Dict] = None,
+                               history_window: Optional[HistoryWindow] = None) -> Tuple[str, str]:
+    """일반 답변 프롬프트 → (system, user 메시지)"""
+    hist_block = _build_history_block(history or [], history_window)
     current_time = datetime.now().strftime('%Y년 %m월 %d일 %H시 %M분')
     
-    return (
-        "너는 유능한 AI 어시스턴트야. 사용자의 질문에 대해 친절하고 정확하게 답변해줘.\n"
-        "필요한 만큼 충분히 설명하되, 명확하고 이해하기 쉽게 답변해줘.\n\n"
-        "답변 가이드라인:\n"
-        "1. 이전 대화나 질문 기록을 물어보면 위의 [이전 대화] 섹션을 정확히 참조해서 답변해\n"
-        "2. '내가 물어본 질문', '방금 뭐라고 했어' 등은 이전 대화에서 정확히 찾아서 답변해\n"
-        "3. 데이터에 없는 내용은 추측하지 말고 '모른다'고 답변해\n"
-        "4. **은 사용하지 마\n\n"
-        
-        f"**현재 시간:** {current_time}\n"
-        "사용자가 현재 시간을 물어보면 위 현재 시간으로 답변해줘.\n\n"
-        
+    return GENERAL_SYSTEM_PROMPT, (
+        f"**현재 시간:** {current_time}\n\n"
         f"{hist_block}"
         f"[질문]\n{query}"
     )
 
+def build_prompt(query: str, context: str, history: List[Dict] = None) -> str:
+    """system 없이 한 덩어리로 보내는 경우용 (build_prompt_parts를 이어 붙임)"""
+    return "\n\n".join(build_prompt_parts(query, context, history))
+
+def build_general_prompt(query: str, history: List[Dict] = None) -> str:
+    return "\n\n".join(build_general_prompt_parts(query, history))
+
 # ===== Claude 기반 답변 생성 =====
 @lru_cache(maxsize=0)
-def generate_answer_with_nova(prompt: str) -> str:
-    system_msg = None
+def generate_answer_with_nova(prompt: str, system: str = None) -> str:
+    system_msg = system
     messages = [
         {"role": "user", "content": [{"type": "text", "text": prompt}]}
     ]
@@ -3813,17 +4035,20 @@ def chat_loop(session=None):
 
         try:
 
-            # 0-3) 후속질문이라면 직전 센서 구간을 자동 주입
-            query = expand_followup_query_with_last_window(query_raw, session)
+            # 0-3) 후속질문이라면 직전 센서 구간을 자동 주입 (질의 분석은 요청당 1회, 확장되면 다시)
+            analysis = analyze_query(query_raw)
+            query = expand_followup_query_with_last_window(query_raw, session, analysis)
+            analysis = _analysis_for(query, analysis)
 
             # 1) 라우팅
-            route = decide_route(query)
+            route = decide_route(query, analysis)
 
             if route == "general":
                 # 세션별 히스토리 사용
                 current_history = session.history if session else HISTORY
-                prompt = build_general_prompt(query, history=current_history)
-                ans = generate_answer_with_nova(prompt)
+                system_prompt, prompt = build_general_prompt_parts(query, history=current_history,
+                                                                   history_window=getattr(session, "history_window", None))
+                ans = generate_answer_with_nova(prompt, system_prompt)
 
                 print(f"\n{ans}")
 
@@ -3845,10 +4070,10 @@ def chat_loop(session=None):
 
             # 2) 먼저 S3 로그에서 해당 시간의 센서 데이터 찾기 시도
             # 복수 시간 쿼리는 캐시를 건너뛰고 직접 검색
-            dt_strings = extract_datetime_strings(query)
+            dt_strings = analysis.dt_strings
             is_multiple_time_query = len(dt_strings) > 1
             
-            cached_sensor_data = None if is_multiple_time_query else find_sensor_data_from_s3_logs(query)
+            cached_sensor_data = None if is_multiple_time_query else find_sensor_data_from_s3_logs(query, analysis)
             #print(f"[DEBUG-CACHE] S3 로그 캐시 검색 결과: {cached_sensor_data is not None}")
             #if cached_sensor_data:
                 #print(f"[DEBUG-CACHE] 캐시된 데이터 timestamp: {cached_sensor_data.get('timestamp', 'No timestamp')}")
@@ -3863,8 +4088,8 @@ def chat_loop(session=None):
                     set_followup_timestamp(cached_dt, session)
                 
                 # 현재/최근 질문은 모든 센서 데이터 표시, 그 외는 요청된 필드만 표시
-                need_fields = detect_fields_in_query(query)
-                is_current_recent = is_recent_query(query) or "현재" in query
+                need_fields = analysis.fields
+                is_current_recent = analysis.is_recent or "현재" in query
                 response_parts = []
                 timestamp_str = cached_sensor_data['timestamp']
                 
@@ -3904,7 +4129,7 @@ def chat_loop(session=None):
 
             # 3) S3 로그에 없으면 기존 방식으로 센서 확정 → S3 검색
             #print(f"[DEBUG-S3] S3 직접 검색 시작")
-            top_docs, context = retrieve_documents_from_s3(query, session=session)
+            top_docs, context = retrieve_documents_from_s3(query, session=session, analysis=analysis)
             #print(f"[DEBUG-S3] S3 검색 완료, 결과 개수: {len(top_docs) if top_docs else 0}")
             if top_docs:
                 #print(f"[DEBUG-DOCS] top_docs[0] id: {top_docs[0].get('id', 'No id')}")
@@ -3926,12 +4151,13 @@ def chat_loop(session=None):
                 # 세션별 히스토리 사용
                 current_history = session.history if session else HISTORY
                 #print(f"[DEBUG-RAG] 사용할 context: {context[:200]}...")  # 첫 200자만 출력
-                prompt = build_prompt(query, context, history=current_history)
+                system_prompt, prompt = build_prompt_parts(query, context, history=current_history,
+                                                           history_window=getattr(session, "history_window", None))
                 
                 # RAG 센서 질문에서 타임스탬프 추출해서 후속질문용으로 저장 (세션별)
                 current_timestamp = get_followup_timestamp(session)
                 if not current_timestamp:
-                    dt_strings = extract_datetime_strings(query)
+                    dt_strings = analysis.dt_strings
                     for ds in dt_strings:
                         dt = parse_dt(ds)
                         if dt:
@@ -3940,9 +4166,10 @@ def chat_loop(session=None):
             else:
                 # 세션별 히스토리 사용
                 current_history = session.history if session else HISTORY
-                prompt = build_general_prompt(query, history=current_history)
+                system_prompt, prompt = build_general_prompt_parts(query, history=current_history,
+                                                                   history_window=getattr(session, "history_window", None))
                 
-            ans = generate_answer_with_nova(prompt)
+            ans = generate_answer_with_nova(prompt, system_prompt)
             print(f"\n{ans}")
 
             # 히스토리 및 저장 (세션별)
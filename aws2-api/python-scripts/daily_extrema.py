@@ -0,0 +1,261 @@
+"""
+일별 극값(최고/최저) 요약
+sensor/date_data/YYYYMMDD/ 원시 데이터를 질문마다 전부 GET 하지 않도록,
+날짜별로 온도/습도/가스의 최고·최저 값과 그 시각을 요약해 로컬에 보관한다.
+
+- 배치: 지난 날짜 원시 데이터를 한 번 훑어 complete 요약 생성
+    python daily_extrema.py build --from 20250801 --to 20250810
+- 오늘: 마지막으로 반영한 키 뒤(StartAfter)만 LIST/GET 해서 증분 갱신
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import concurrent.futures as _f
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+import request_trace
+from sensor_cache import HOUR_SEAL_GRACE, KST, seal_clock
+
+EXTREMA_VERSION = 1
+EXTREMA_METRICS = ("temperature", "humidity", "gas")
+RAW_PREFIX = "sensor/date_data/"
+
+class ReadBudgetExceeded(Exception):
+    """새로 읽어야 할 원시 객체 수가 상한을 넘음 (요약은 바뀌지 않음)"""
+
+def _iter_records(content: str) -> Iterable[Dict]:
+    """원시 객체 본문의 레코드들 (단일 객체 / 리스트 / JSON Lines)"""
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        for line in content.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                yield data
+        return
+    if isinstance(data, dict):
+        yield data
+    elif isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                yield item
+
+def empty_summary(day: date) -> Dict:
+    return {
+        "version": EXTREMA_VERSION,
+        "date": day.isoformat(),
+        "complete": False,
+        "last_key": None,
+        "objects": 0,
+        "metrics": {m: {"max": None, "min": None, "count": 0} for m in EXTREMA_METRICS},
+    }
+
+def fold_record(summary: Dict, record: Dict):
+    """레코드 하나를 요약에 반영 (같은 값이면 먼저 본 시각 유지)"""
+    timestamp = record.get("timestamp", "")
+    for metric in EXTREMA_METRICS:
+        if metric not in record:
+            continue
+        try:
+            value = float(record[metric])
+        except (TypeError, ValueError):
+            continue
+        stats = summary["metrics"][metric]
+        stats["count"] += 1
+        if stats["max"] is None or value > stats["max"]["value"]:
+            stats["max"] = {"value": value, "timestamp": timestamp}
+        if stats["min"] is None or value < stats["min"]["value"]:
+            stats["min"] = {"value": value, "timestamp": timestamp}
+
+class DailyExtremaStore:
+    """날짜별 극값 요약 (메모리 + 로컬 JSON 파일, 스레드 안전)"""
+
+    def __init__(self, s3_client, bucket: str, store_dir: str = None, raw_prefix: str = RAW_PREFIX,
+                 max_workers: int = 10):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.store_dir = store_dir
+        self.raw_prefix = raw_prefix
+        self.max_workers = max_workers
+        self._summaries: Dict[str, Dict] = {}
+        self._objects_per_day: Optional[int] = None   # 완료된 요약의 하루 원시 객체 수 최댓값 (지연 계산)
+        self._lock = threading.RLock()
+
+    def _is_day_complete(self, day: date, now: datetime = None) -> bool:
+        now = now or seal_clock()
+        return now >= datetime(day.year, day.month, day.day) + timedelta(days=1) + HOUR_SEAL_GRACE
+
+    def _read_object(self, key: str) -> str:
+        response = self.s3.get_object(Bucket=self.bucket, Key=key)
+        return response['Body'].read().decode('utf-8')
+
+    def _new_keys(self, day: date, start_after: str = None):
+        kwargs = {"Bucket": self.bucket, "Prefix": f"{self.raw_prefix}{day:%Y%m%d}/"}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        while True:
+            resp = self.s3.list_objects_v2(**kwargs)
+            for obj in resp.get("Contents", []):
+                yield obj["Key"]
+            if not resp.get("IsTruncated"):
+                return
+            kwargs.pop("StartAfter", None)
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+
+    def update(self, day: date, force_complete: bool = None, max_new_objects: int = None) -> Dict:
+        """
+        last_key 이후 원시 객체를 반영해 요약 갱신 (키 순서대로 반영해 동점 처리 유지)
+        max_new_objects: 새 객체가 이보다 많으면 GET 없이 ReadBudgetExceeded (LIST만 사용)
+        """
+        with self._lock:
+            day_id = day.isoformat()
+            summary = self._summaries.get(day_id) or self._load(day_id) or empty_summary(day)
+            if summary.get("complete"):
+                self._summaries[day_id] = summary
+                return summary
+
+            complete = self._is_day_complete(day) if force_complete is None else force_complete
+            keys = list(self._new_keys(day, summary["last_key"]))
+            if max_new_objects is not None and len(keys) > max_new_objects:
+                raise ReadBudgetExceeded(f"{day}: 새 원시 객체 {len(keys)}개 > 상한 {max_new_objects}개")
+            folded = 0
+            failed = False
+            if keys:
+                with _f.ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+                    read = request_trace.bind(self._read_object)  # 요청 추적이 켜져 있으면 같은 추적에 집계
+                    futures = [ex.submit(read, key) for key in keys]
+                    for key, fut in zip(keys, futures):
+                        try:
+                            content = fut.result()
+                        except Exception as e:
+                            # 실패한 키에서 멈춤: last_key는 순서대로 성공한 마지막 키까지만 → 다음 호출에서 다시 읽음
+                            print(f"[경고] 극값 원시 객체 읽기 실패, {key}부터 다음에 다시 반영: {e}")
+                            failed = True
+                            for rest in futures[folded + 1:]:
+                                rest.cancel()
+                            break
+                        for record in _iter_records(content):
+                            fold_record(summary, record)
+                        summary["objects"] += 1
+                        summary["last_key"] = key
+                        folded += 1
+
+            # 읽기 실패가 있으면 빠진 객체가 남아 있으므로 완료로 표시하지 않음
+            summary["complete"] = complete and not failed
+            if summary["complete"] and self._objects_per_day is not None:
+                self._objects_per_day = max(self._objects_per_day, summary["objects"])
+            summary["updated_at"] = datetime.now(KST).isoformat()
+            self._summaries[day_id] = summary
+            if folded or summary["complete"]:
+                self._save(summary)
+            return summary
+
+    def get(self, day: date, max_new_objects: int = None) -> Dict:
+        return self.update(day, max_new_objects=max_new_objects)
+
+    def has_complete(self, day: date) -> bool:
+        """완료된 요약이 메모리/로컬 파일에 있는지 (S3 조회 없음, 검색 계획용)"""
+        with self._lock:
+            summary = self._summaries.get(day.isoformat()) or self._load(day.isoformat())
+            return bool(summary and summary.get("complete"))
+
+    def extremum(self, day: date, metric: str, direction: str, max_new_objects: int = None) -> Optional[Dict]:
+        """{"value", "timestamp"} 또는 None (max_new_objects를 넘으면 ReadBudgetExceeded)"""
+        return self.get(day, max_new_objects)["metrics"].get(metric, {}).get(direction)
+
+    def folded_objects(self, day: date) -> int:
+        """그날 요약에 이미 반영된 원시 객체 수 (S3 조회 없음, 검색 계획용)"""
+        with self._lock:
+            summary = self._summaries.get(day.isoformat()) or self._load(day.isoformat())
+            return int(summary.get("objects", 0)) if summary else 0
+
+    def objects_per_day(self) -> Optional[int]:
+        """로컬에 있는 완료된 요약 중 하루 원시 객체 수 최댓값 (검색 계획 추정용, 없으면 None)"""
+        with self._lock:
+            if self._objects_per_day is None:
+                counts = []
+                if self.store_dir and os.path.isdir(self.store_dir):
+                    for name in os.listdir(self.store_dir):
+                        if not name.endswith("_extrema.json"):
+                            continue
+                        try:
+                            with open(os.path.join(self.store_dir, name), "r", encoding="utf-8") as f:
+                                summary = json.load(f)
+                        except Exception:
+                            continue
+                        if summary.get("complete"):
+                            counts.append(int(summary.get("objects", 0)))
+                self._objects_per_day = max(counts, default=0)
+            return self._objects_per_day or None
+
+    # ----- 로컬 파일 -----
+    def _path(self, day_id: str) -> str:
+        return os.path.join(self.store_dir, f"{day_id.replace('-', '')}_extrema.json")
+
+    def _load(self, day_id: str) -> Optional[Dict]:
+        if not self.store_dir:
+            return None
+        path = self._path(day_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+            if summary.get("version") != EXTREMA_VERSION:
+                return None
+            return summary
+        except Exception as e:
+            print(f"[경고] 극값 요약 로드 실패: {e}")
+            return None
+
+    def _save(self, summary: Dict):
+        if not self.store_dir:
+            return
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            path = self._path(summary["date"])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[경고] 극값 요약 저장 실패: {e}")
+
+def main(argv=None):
+    """배치 빌드: 기간 내 각 날짜 요약을 원시 데이터로 생성"""
+    parser = argparse.ArgumentParser(description="일별 극값 요약 배치 빌드")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--from", dest="date_from", required=True, help="YYYYMMDD")
+    build.add_argument("--to", dest="date_to", help="YYYYMMDD (기본: --from과 같은 날)")
+    build.add_argument("--rebuild", action="store_true", help="기존 요약을 지우고 처음부터 다시 생성")
+    args = parser.parse_args(argv)
+
+    from chatbot import LOCAL_CACHE_DIR, S3_BUCKET_DATA, s3
+
+    store = DailyExtremaStore(
+        s3, S3_BUCKET_DATA,
+        store_dir=os.path.join(LOCAL_CACHE_DIR, "daily_extrema"),
+    )
+    day = datetime.strptime(args.date_from, "%Y%m%d").date()
+    last = datetime.strptime(args.date_to or args.date_from, "%Y%m%d").date()
+    while day <= last:
+        if args.rebuild and store.store_dir and os.path.exists(store._path(day.isoformat())):
+            os.remove(store._path(day.isoformat()))
+        summary = store.update(day)
+        print(f"{day.isoformat()}: 객체 {summary['objects']}개, complete={summary['complete']}")
+        day += timedelta(days=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
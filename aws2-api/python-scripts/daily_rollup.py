@@ -0,0 +1,214 @@
+"""
+일간 롤업 저장소
+houravg 24개를 매번 LIST + GET 해서 평균을 내는 대신, 날짜별로 센서 필드마다
+avg/min/max/count와 시간별 값을 미리 계산한 레코드 하나를 로컬에 보관한다.
+
+- 지난 날짜: 하루가 끝나면(마지막 시간 구간 봉인 후) complete 레코드로 한 번 쓰고 다시 만들지 않음
+- 오늘: 키 인덱스의 그날 houravg 키 목록이 레코드와 달라졌을 때만 다시 계산
+  (이미 본 시간 파일은 객체 캐시에서 읽으므로 새 시간 파일만 GET)
+- 시간 파일 읽기가 하나라도 실패하면 complete로 표시/저장하지 않고 다음 호출에서 다시 계산
+- 키 인덱스가 아직 없으면(콜드) 전체 LIST 대신 키 탐색기로 그날 폴더만 LIST (인덱스 빌드는 on_cold에 맡김)
+"""
+
+import os
+import json
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from key_seek import KeySeeker
+from sensor_index import SensorKeyIndex
+from sensor_cache import HOUR_SEAL_GRACE, KST, seal_clock, SensorObjectCache
+
+ROLLUP_VERSION = 2  # 2: 읽기 실패가 섞인 채 complete로 저장됐을 수 있는 이전 레코드 무효화
+
+# houravg 값 필드 후보 (앞에서부터 먼저 찾은 값 사용)
+HOUR_VALUE_FIELDS = {
+    "temperature": ['hourtemp', 'temperature', 'temp', 'avg_temp', 'hourly_temp'],
+    "humidity": ['hourhum', 'humidity', 'hum', 'avg_humidity'],
+    "gas": ['hourgas', 'gas', 'co2', 'avg_gas'],
+}
+# averages 구조 내부 필드 후보
+AVERAGES_VALUE_FIELDS = {
+    "temperature": ['temperature', 'temp', 'hourtemp'],
+    "humidity": ['humidity', 'hum', 'hourhum'],
+    "gas": ['gas', 'co2', 'hourgas'],
+}
+# hour_data 항목에서 쓰는 이름 (기존 응답 형식 유지)
+HOUR_DATA_NAMES = {"temperature": "temp", "humidity": "humidity", "gas": "gas"}
+
+def extract_hour_values(data: Dict) -> Dict[str, float]:
+    """houravg 레코드 하나에서 온도/습도/가스 값 추출"""
+    values = {}
+    for metric, fields in HOUR_VALUE_FIELDS.items():
+        for field in fields:
+            if field in data and data[field] is not None:
+                values[metric] = data[field]
+                break
+    avg_data = data.get('averages')
+    if isinstance(avg_data, dict):
+        for metric, fields in AVERAGES_VALUE_FIELDS.items():
+            if metric in values:
+                continue
+            for field in fields:
+                if field in avg_data and avg_data[field] is not None:
+                    values[metric] = avg_data[field]
+                    break
+    return values
+
+def build_rollup(day: date, hour_keys: List[str], load_json, complete: bool) -> Dict:
+    """
+    시간 키 목록으로 일간 롤업 레코드 계산 (load_json: key → dict)
+    읽기 실패 수는 "failed"에 기록, 하나라도 실패하면 complete가 아님
+    """
+    hours = []
+    series = {metric: [] for metric in HOUR_VALUE_FIELDS}
+    failed = 0
+    for key in hour_keys:
+        try:
+            data = load_json(key)
+        except Exception as e:
+            failed += 1
+            print(f"[경고] 일간 롤업 시간 파일 읽기 실패 ({key}): {e}")
+            continue
+        if not isinstance(data, dict):
+            continue
+        values = extract_hour_values(data)
+        if not values:
+            continue
+        hour_info = {'hour': int(key.split('/')[-1].split('_')[0][-2:]), 'key': key}
+        for metric, value in values.items():
+            series[metric].append(value)
+            hour_info[HOUR_DATA_NAMES[metric]] = value
+        hours.append(hour_info)
+
+    fields = {}
+    for metric, vals in series.items():
+        if vals:
+            fields[metric] = {
+                "avg": sum(vals) / len(vals),
+                "min": min(vals),
+                "max": max(vals),
+                "count": len(vals),
+            }
+
+    return {
+        "version": ROLLUP_VERSION,
+        "date": day.isoformat(),
+        "complete": complete and failed == 0,
+        "failed": failed,
+        "built_at": datetime.now(KST).isoformat(),
+        "keys": list(hour_keys),
+        "fields": fields,
+        "hours": sorted(hours, key=lambda x: x['hour']),
+    }
+
+class DailyRollupStore:
+    """날짜별 롤업 레코드 (메모리 + 로컬 JSON 파일, 스레드 안전)"""
+
+    def __init__(self, index: SensorKeyIndex, cache: SensorObjectCache, store_dir: str = None,
+                 family: str = "houravg", seeker: KeySeeker = None, prefix: str = "",
+                 on_cold: Callable[[str], None] = None):
+        self.index = index
+        self.cache = cache
+        self.store_dir = store_dir
+        self.family = family
+        self.seeker = seeker
+        self.prefix = prefix      # 키 탐색기용 S3 prefix (패밀리 폴더 앞부분)
+        self.on_cold = on_cold    # 인덱스가 콜드일 때 호출 (백그라운드 빌드 예약)
+        self._records: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def _use_index(self) -> bool:
+        """인덱스가 준비됐거나 키 탐색기가 없으면 True (콜드면 on_cold로 빌드를 맡기고 False)"""
+        if self.seeker is None or self.index.is_warm(self.family):
+            return True
+        if self.on_cold is not None:
+            self.on_cold(self.family)
+        return False
+
+    def _day_keys(self, day: date) -> List[str]:
+        start = datetime(day.year, day.month, day.day)
+        end = start + timedelta(hours=23)
+        if self._use_index():
+            hits = self.index.between(self.family, start, end)
+        else:
+            hits = self.seeker.between(f"{self.prefix}{self.family}/", start, end)
+        return [key for _, key in hits]
+
+    def _is_day_complete(self, day: date, now: datetime = None) -> bool:
+        now = now or seal_clock()
+        return now >= datetime(day.year, day.month, day.day) + timedelta(days=1) + HOUR_SEAL_GRACE
+
+    def get(self, day: date) -> Optional[Dict]:
+        """
+        해당 날짜 롤업 반환 (데이터가 없으면 None)
+        완료된 날짜는 저장된 레코드를 그대로, 진행 중인 날짜는 키 목록이 바뀐 경우에만 다시 계산
+        """
+        day_id = day.isoformat()
+        with self._lock:
+            record = self._records.get(day_id) or self._load(day_id)
+            if record and record.get("complete"):
+                self._records[day_id] = record
+                return record if record.get("fields") else None
+
+            keys = self._day_keys(day)
+            complete = self._is_day_complete(day)
+            if record and record.get("keys") == keys and not complete and not record.get("failed"):
+                self._records[day_id] = record
+                return record if record.get("fields") else None
+
+            record = build_rollup(day, keys, self.cache.get_json, complete)
+            self._records[day_id] = record
+            # 읽기 실패가 있으면 저장하지 않음 (메모리 레코드도 failed라 다음 호출에서 다시 계산)
+            if keys and not record["failed"]:
+                self._save(record)
+            return record if record.get("fields") else None
+
+    def has_complete(self, day: date) -> bool:
+        """완료된 롤업이 메모리/로컬 파일에 있는지 (S3 조회 없음, 검색 계획용)"""
+        with self._lock:
+            record = self._records.get(day.isoformat()) or self._load(day.isoformat())
+            return bool(record and record.get("complete"))
+
+    def latest_day(self, until: date) -> Optional[date]:
+        """until 이하에서 houravg 데이터가 있는 가장 최근 날짜"""
+        end = datetime(until.year, until.month, until.day, 23, 59)
+        if self._use_index():
+            hit = self.index.family(self.family).floor(end)
+        else:
+            hit = self.seeker.floor(f"{self.prefix}{self.family}/", end)
+        return hit[0].date() if hit else None
+
+    # ----- 로컬 파일 -----
+    def _path(self, day_id: str) -> str:
+        return os.path.join(self.store_dir, f"{day_id.replace('-', '')}_daily.json")
+
+    def _load(self, day_id: str) -> Optional[Dict]:
+        if not self.store_dir:
+            return None
+        path = self._path(day_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            if record.get("version") != ROLLUP_VERSION:
+                return None
+            return record
+        except Exception as e:
+            print(f"[경고] 일간 롤업 로드 실패: {e}")
+            return None
+
+    def _save(self, record: Dict):
+        if not self.store_dir:
+            return
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            path = self._path(record["date"])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[경고] 일간 롤업 저장 실패: {e}")
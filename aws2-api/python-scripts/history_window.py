@@ -0,0 +1,114 @@
+"""
+프롬프트용 대화 히스토리 창 (토큰 예산 + 이전 대화 요약)
+기존에는 최대 50턴의 Q/A(답변 최대 1,000자)를 매 요청 프롬프트에 그대로 넣어서
+세션이 길어질수록 입력이 수만 자로 늘고 LLM 지연도 같이 늘었다.
+
+- 최근 verbatim_turns턴: 원문 (답변은 answer_chars자까지)
+- 그 이전 턴: "질문 → 답변 첫 문장" 한 줄 요약으로 접음
+  새로 창 밖으로 밀려난 턴만 접는 증분 방식 (마지막으로 접은 턴의 지문으로 이어서)
+- 전체 블록은 추정 토큰 token_budget 이내: 원문 최신 턴 → 요약 최신 줄 순으로 채우고 넘치는 오래된 것부터 생략
+요약은 히스토리에서 결정적으로 만들어지므로 따로 저장하지 않음 (세션 로드 후 첫 요청에서 다시 접힘)
+"""
+
+import re
+import math
+import hashlib
+from typing import Dict, List, Optional
+
+_SENTENCE_END = re.compile(r"(?<=[.!?다요])\s+")
+
+def estimate_tokens(text: str) -> int:
+    """대략적인 토큰 수 (영문/숫자 4자당 1, 한글 등 비ASCII 문자는 1자당 0.8)"""
+    if not text:
+        return 0
+    ascii_n = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_n / 4 + (len(text) - ascii_n) * 0.8)
+
+def _fingerprint(turn: Dict) -> str:
+    raw = f"{turn.get('query', '')}\x00{turn.get('answer', '')}\x00{turn.get('route', '')}"
+    return hashlib.sha1(raw.encode("utf-8", errors="ignore")).hexdigest()
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+def summarize_turn(turn: Dict, query_chars: int = 80, answer_chars: int = 100) -> str:
+    """턴 하나 → 한 줄 요약 (질문 + 답변 첫 문장)"""
+    answer = " ".join((turn.get("answer") or "").split())
+    first = _SENTENCE_END.split(answer, 1)[0] if answer else ""
+    return f"- {_clip(turn.get('query', ''), query_chars)} → {_clip(first, answer_chars)}"
+
+class HistoryWindow:
+    """세션별 히스토리 창 (UserSession.history_window)"""
+
+    def __init__(self, verbatim_turns: int = 4, token_budget: int = 2000, answer_chars: int = 600,
+                 max_summary_lines: int = 40):
+        self.verbatim_turns = verbatim_turns
+        self.token_budget = token_budget
+        self.answer_chars = answer_chars
+        self.max_summary_lines = max_summary_lines
+        self.summary_lines: List[str] = []
+        self.dropped = 0                       # 요약 줄 상한으로 버린 오래된 턴 수
+        self._last_folded: Optional[str] = None
+
+    def update(self, history: List[Dict]):
+        """창 밖으로 밀려난 턴 중 아직 접지 않은 것만 요약에 추가"""
+        older = history[:-self.verbatim_turns] if len(history) > self.verbatim_turns else []
+        start = 0
+        if self._last_folded is not None:
+            for i in range(len(older) - 1, -1, -1):
+                if _fingerprint(older[i]) == self._last_folded:
+                    start = i + 1
+                    break
+            else:
+                # 마지막으로 접은 턴이 없음 (히스토리가 바뀜) → 처음부터 다시
+                self.summary_lines, self.dropped, self._last_folded = [], 0, None
+        for turn in older[start:]:
+            self.summary_lines.append(summarize_turn(turn))
+            self._last_folded = _fingerprint(turn)
+        if len(self.summary_lines) > self.max_summary_lines:
+            cut = len(self.summary_lines) - self.max_summary_lines
+            self.summary_lines = self.summary_lines[cut:]
+            self.dropped += cut
+
+    def build_block(self, history: List[Dict]) -> str:
+        """프롬프트용 [이전 대화] 블록 (히스토리가 없으면 빈 문자열)"""
+        if not history:
+            return ""
+        self.update(history)
+        budget = self.token_budget
+
+        # 1) 최근 턴 원문 (최신부터, 가장 최근 턴은 예산이 모자라면 답변을 더 잘라서라도 포함)
+        recent = []
+        for turn in reversed(history[-self.verbatim_turns:]):
+            a = turn.get("answer", "")
+            if len(a) > self.answer_chars:
+                a = a[:self.answer_chars] + " …(이하 생략)"
+            text = f"Q: {turn.get('query', '')}\nA: {a}"
+            cost = estimate_tokens(text)
+            if cost > budget:
+                if recent:
+                    break
+                text = text[:max(0, int(budget / 0.8))] + " …(이하 생략)"
+                cost = estimate_tokens(text)
+            recent.append(text)
+            budget -= cost
+
+        # 2) 이전 대화 요약 (최신 줄부터 남은 예산만큼)
+        summary = []
+        for line in reversed(self.summary_lines):
+            cost = estimate_tokens(line) + 1
+            if cost > budget:
+                break
+            summary.append(line)
+            budget -= cost
+        omitted = self.dropped + len(self.summary_lines) - len(summary)
+
+        parts = []
+        if summary or omitted:
+            head = "(더 이전 대화 요약)"
+            if omitted:
+                head += f" 그 이전 {omitted}개 대화 생략"
+            parts.append(head + ("\n" + "\n".join(reversed(summary)) if summary else ""))
+        parts.extend(reversed(recent))
+        return "\n\n[이전 대화(참고용)]\n" + "\n\n".join(parts) + "\n"
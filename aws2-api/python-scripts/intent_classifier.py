@@ -0,0 +1,286 @@
+"""
+로컬 라우팅 분류기 (sensor_data / general)
+문자 n-gram(1~3) + 로지스틱 회귀, 순수 파이썬이라 추가 의존성 없음.
+decide_route에서 키워드 규칙으로 결정되지 않은 질의를 Bedrock 라우터 대신 먼저 판정한다.
+
+학습 데이터: 채팅 로그 버킷에 이미 쌓인 route 필드
+  chatlog/<session_id>.json                (세션 파일의 history[].route)
+  chatlog/<session_id>/<turn>_<ts>.json    (턴 파일의 route)
+  sensor* → sensor_data, general* → general, 그 외(error 등)는 제외
+
+  python intent_classifier.py train                          # S3 채팅 로그로 학습 → models/intent_model.json
+  python intent_classifier.py train --input labeled.jsonl    # {"query", "route"} 한 줄씩
+  python intent_classifier.py eval --input labeled.jsonl [--threshold 0.85]
+  python intent_classifier.py predict "8월 11일 강의실 어때?"
+"""
+
+import os
+import sys
+import json
+import math
+import random
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MODEL_VERSION = 1
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "intent_model.json")
+LABELS = ("general", "sensor_data")   # 0, 1
+
+def route_to_label(route: str) -> Optional[str]:
+    route = (route or "").lower()
+    if route.startswith("sensor"):
+        return "sensor_data"
+    if route.startswith("general"):
+        return "general"
+    return None
+
+def _normalize(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+def extract_features(query: str, ngram_max: int = 3) -> Dict[str, float]:
+    """문자 n-gram 빈도 (앞뒤 경계 표시 포함), 길이로 정규화"""
+    text = f"^{_normalize(query)}$"
+    feats: Dict[str, float] = {}
+    for n in range(1, ngram_max + 1):
+        for i in range(len(text) - n + 1):
+            g = text[i:i + n]
+            if g.strip():
+                feats[g] = feats.get(g, 0.0) + 1.0
+    if feats:
+        norm = math.sqrt(sum(v * v for v in feats.values()))
+        for g in feats:
+            feats[g] /= norm
+    return feats
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+class IntentClassifier:
+    """학습된 가중치로 질의 도메인을 판정"""
+
+    def __init__(self, weights: Dict[str, float], bias: float, ngram_max: int = 3, meta: Dict = None):
+        self.weights = weights
+        self.bias = bias
+        self.ngram_max = ngram_max
+        self.meta = meta or {}
+
+    def prob_sensor(self, query: str) -> float:
+        w = self.weights
+        z = self.bias
+        for g, v in extract_features(query, self.ngram_max).items():
+            z += w.get(g, 0.0) * v
+        return _sigmoid(z)
+
+    def classify(self, query: str) -> Dict:
+        """classify_query_with_llm과 같은 형식: {"domain", "confidence"}"""
+        p = self.prob_sensor(query)
+        if p >= 0.5:
+            return {"domain": "sensor_data", "confidence": p}
+        return {"domain": "general", "confidence": 1.0 - p}
+
+    # ----- 저장/로드 -----
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MODEL_VERSION,
+                "ngram_max": self.ngram_max,
+                "bias": self.bias,
+                "weights": self.weights,
+                "meta": self.meta,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IntentClassifier"]:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            if d.get("version") != MODEL_VERSION:
+                print(f"[경고] 라우팅 모델 버전 불일치: {d.get('version')}")
+                return None
+            return cls(d["weights"], d["bias"], d.get("ngram_max", 3), d.get("meta"))
+        except Exception as e:
+            print(f"[경고] 라우팅 모델 로드 실패: {e}")
+            return None
+
+# ===== 학습 / 평가 =====
+def train(samples: List[Tuple[str, str]], epochs: int = 15, lr: float = 0.5, l2: float = 1e-4,
+          ngram_max: int = 3, seed: int = 13) -> IntentClassifier:
+    """
+    samples: [(query, label)] → SGD 로지스틱 회귀
+    클래스 불균형은 표본 가중치(빈도 역수)로 보정
+    """
+    rng = random.Random(seed)
+    data = [(extract_features(q, ngram_max), 1.0 if label == "sensor_data" else 0.0) for q, label in samples]
+    n_pos = sum(1 for _, y in data if y == 1.0)
+    n_neg = len(data) - n_pos
+    w_pos = len(data) / (2.0 * n_pos) if n_pos else 1.0
+    w_neg = len(data) / (2.0 * n_neg) if n_neg else 1.0
+
+    weights: Dict[str, float] = {}
+    bias = 0.0
+    for epoch in range(epochs):
+        rng.shuffle(data)
+        step = lr / (1.0 + epoch)
+        for feats, y in data:
+            z = bias + sum(weights.get(g, 0.0) * v for g, v in feats.items())
+            grad = (_sigmoid(z) - y) * (w_pos if y == 1.0 else w_neg)
+            for g, v in feats.items():
+                old = weights.get(g, 0.0)
+                weights[g] = old - step * (grad * v + l2 * old)
+            bias -= step * grad
+
+    weights = {g: round(v, 6) for g, v in weights.items() if abs(v) >= 1e-4}
+    return IntentClassifier(weights, round(bias, 6), ngram_max, meta={
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "samples": len(samples),
+        "sensor_samples": n_pos,
+        "general_samples": n_neg,
+    })
+
+def evaluate(model: IntentClassifier, samples: List[Tuple[str, str]], threshold: float = 0.85) -> Dict:
+    """정확도, 클래스별 정밀도/재현율, 임계치 이상 판정 비율(LLM 생략 비율)과 그 구간 정확도"""
+    counts = {label: {"tp": 0, "fp": 0, "fn": 0} for label in LABELS}
+    correct = covered = covered_correct = 0
+    for query, label in samples:
+        out = model.classify(query)
+        pred = out["domain"]
+        ok = pred == label
+        correct += ok
+        if out["confidence"] >= threshold:
+            covered += 1
+            covered_correct += ok
+        if ok:
+            counts[label]["tp"] += 1
+        else:
+            counts[pred]["fp"] += 1
+            counts[label]["fn"] += 1
+    n = len(samples) or 1
+    per_class = {}
+    for label, c in counts.items():
+        precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+        recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+        per_class[label] = {"precision": round(precision, 4), "recall": round(recall, 4)}
+    return {
+        "samples": len(samples),
+        "accuracy": round(correct / n, 4),
+        "per_class": per_class,
+        "threshold": threshold,
+        "coverage": round(covered / n, 4),
+        "covered_accuracy": round(covered_correct / covered, 4) if covered else None,
+    }
+
+# ===== 데이터 =====
+def load_jsonl(path: str) -> List[Tuple[str, str]]:
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            label = rec.get("label") or route_to_label(rec.get("route"))
+            if rec.get("query") and label in LABELS:
+                samples.append((rec["query"], label))
+    return samples
+
+def iter_chatlog_samples(s3_client, bucket: str, prefix: str = "chatlog/") -> Iterable[Tuple[str, str]]:
+    """채팅 로그 버킷의 세션 파일/턴 파일에서 (query, label) 추출"""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"]
+            if not key.endswith(".json"):
+                continue
+            try:
+                body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+                rec = json.loads(body.decode("utf-8", errors="ignore"))
+            except Exception as e:
+                print(f"[경고] 채팅 로그 읽기 실패 {key}: {e}", file=sys.stderr)
+                continue
+            turns = rec.get("history") if isinstance(rec.get("history"), list) else [rec]
+            for turn in turns:
+                if not isinstance(turn, dict):
+                    continue
+                label = route_to_label(turn.get("route"))
+                if turn.get("query") and label:
+                    yield turn["query"], label
+
+def dedupe(samples: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """같은 질의(정규화 기준)는 마지막 라벨 하나만"""
+    latest: Dict[str, Tuple[str, str]] = {}
+    for query, label in samples:
+        latest[_normalize(query)] = (query, label)
+    return list(latest.values())
+
+def _load_samples(args) -> List[Tuple[str, str]]:
+    if args.input:
+        return dedupe(load_jsonl(args.input))
+    from chatbot import CHATLOG_BUCKET, CHATLOG_PREFIX, s3_logs
+    return dedupe(iter_chatlog_samples(s3_logs, CHATLOG_BUCKET, CHATLOG_PREFIX))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="로컬 라우팅 분류기 학습/평가")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tr = sub.add_parser("train", help="채팅 로그(또는 --input)로 학습")
+    tr.add_argument("--input", help='{"query", "route"|"label"} JSONL (기본: S3 채팅 로그)')
+    tr.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    tr.add_argument("--holdout", type=float, default=0.2, help="평가용으로 떼어둘 비율 (0이면 전체 학습)")
+    tr.add_argument("--epochs", type=int, default=15)
+    tr.add_argument("--threshold", type=float, default=0.85)
+
+    ev = sub.add_parser("eval", help="저장된 모델 평가")
+    ev.add_argument("--input", help='{"query", "route"|"label"} JSONL (기본: S3 채팅 로그)')
+    ev.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    ev.add_argument("--threshold", type=float, default=0.85)
+
+    pr = sub.add_parser("predict", help="질의 하나 판정")
+    pr.add_argument("query")
+    pr.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "predict":
+        model = IntentClassifier.load(args.model)
+        if model is None:
+            print(f"모델 없음: {args.model}")
+            return 1
+        print(json.dumps(model.classify(args.query), ensure_ascii=False))
+        return 0
+
+    samples = _load_samples(args)
+    if not samples:
+        print("학습/평가할 표본이 없습니다.")
+        return 1
+
+    if args.command == "eval":
+        model = IntentClassifier.load(args.model)
+        if model is None:
+            print(f"모델 없음: {args.model}")
+            return 1
+        print(json.dumps(evaluate(model, samples, args.threshold), ensure_ascii=False, indent=2))
+        return 0
+
+    rng = random.Random(13)
+    rng.shuffle(samples)
+    n_hold = int(len(samples) * args.holdout) if args.holdout > 0 else 0
+    held, train_set = samples[:n_hold], samples[n_hold:]
+    model = train(train_set, epochs=args.epochs)
+    if held:
+        report = evaluate(model, held, args.threshold)
+        model.meta["holdout"] = report
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    model.save(args.out)
+    print(f"저장: {args.out} (표본 {len(train_set)}개, 가중치 {len(model.weights)}개)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+시간순 키에서 LIST 몇 번으로 이웃 키 찾기 (전체 키 인덱스 없이)
+센서 키는 <family>/YYYY/MM/DD/HH/<YYYYMMDDHH[MM]>_<family>.json 형태라 사전순 = 시간순이다.
+
+- ceil(T):  T 이상 첫 키 → list_objects_v2(StartAfter=<T의 키 앞부분>, MaxKeys=1) 한 번
+- floor(T): T 이하 마지막 키 → T의 시 폴더부터 일/월/연 폴더로 한 단계씩 올라가며(Delimiter="/")
+            T보다 이른 마지막 하위 폴더를 찾고, 거기서 다시 시 폴더까지 내려감
+            데이터 공백이 며칠/몇 달이어도 요청 수는 max_requests(기본 10) 이내
+- between(A, B): [A, B] 구간 키 (A 키 앞부터 LIST, B를 넘으면 중단)
+- latest(): 가장 늦은 키 (hint 이후 LIST 한 번, 없으면 루트부터 내려감)
+반환은 SensorKeyIndex와 같은 (datetime, key) 튜플
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sensor_index import HOUR_FAMILIES, parse_key_time
+
+MAX_SEEK_REQUESTS = 10  # 연도 경계를 넘는 floor 최악 9번 (시 폴더 1 + 올라가기 4 + 내려가기 4)
+
+Hit = Optional[Tuple[datetime, str]]
+
+class _Budget:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def take(self) -> bool:
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+def family_of(prefix: str) -> str:
+    """'minavg/' 또는 '<S3_PREFIX>minavg/' → 'minavg'"""
+    return prefix.rstrip("/").rsplit("/", 1)[-1]
+
+def seek_key(prefix: str, dt: datetime) -> str:
+    """dt 시각 키의 앞부분 (같은 시각 키 바로 앞, 더 이른 키 뒤에 정렬됨)"""
+    stamp = f"{dt:%Y%m%d%H}" if family_of(prefix) in HOUR_FAMILIES else f"{dt:%Y%m%d%H%M}"
+    return f"{prefix}{dt:%Y/%m/%d/%H}/{stamp}"
+
+class KeySeeker:
+    """파티션 키 이웃 탐색 (호출마다 요청 수 상한, 스레드 안전)"""
+
+    def __init__(self, s3_client, bucket: str, max_requests: int = MAX_SEEK_REQUESTS):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "requests": 0}
+
+    # ----- 공개 API -----
+    def ceil(self, prefix: str, dt: datetime, not_after: datetime = None) -> Hit:
+        """dt 이상에서 가장 이른 키"""
+        budget = _Budget(self.max_requests)
+        try:
+            return self._ceil(prefix, dt, not_after, budget)
+        finally:
+            self._record(budget)
+
+    def floor(self, prefix: str, dt: datetime, not_before: datetime = None) -> Hit:
+        """dt 이하에서 가장 늦은 키 (not_before보다 이른 키만 남으면 None)"""
+        budget = _Budget(self.max_requests)
+        try:
+            return self._floor(prefix, dt, not_before, budget)
+        finally:
+            self._record(budget)
+
+    def neighbors(self, prefix: str, dt: datetime, max_distance: timedelta = None) -> Tuple[Hit, Hit]:
+        """(floor, ceil) - SensorKeyIndex.neighbors와 같은 형태"""
+        lo = dt - max_distance if max_distance is not None else None
+        hi = dt + max_distance if max_distance is not None else None
+        return self.floor(prefix, dt, not_before=lo), self.ceil(prefix, dt, not_after=hi)
+
+    def between(self, prefix: str, start: datetime, end: datetime, max_pages: int = None) -> List[Tuple[datetime, str]]:
+        """
+        [start, end] 구간의 키들 (시간순) - SensorKeyIndex.between과 같은 형태
+        start 키 앞에서 시작해 end를 넘는 키가 나오면 중단 (페이지당 최대 1000개, 최대 max_pages 페이지)
+        """
+        budget = _Budget(max_pages or self.max_requests)
+        out = []
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix, "StartAfter": seek_key(prefix, start)}
+        try:
+            while budget.take():
+                resp = self.s3.list_objects_v2(**kwargs)
+                for dt, key in self._hits(resp, prefix):
+                    if dt > end:
+                        return out
+                    if dt >= start:
+                        out.append((dt, key))
+                if not resp.get("IsTruncated"):
+                    return out
+                kwargs.pop("StartAfter", None)
+                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+            return out
+        finally:
+            self._record(budget)
+
+    def latest(self, prefix: str, hint: datetime = None) -> Tuple[Hit, int]:
+        """
+        가장 늦은 키 → (hit, 사용한 LIST 수)
+        hint(대략적인 현재 시각)가 있으면 hint-1시간 이후 키를 먼저 한 번에 LIST
+        """
+        budget = _Budget(self.max_requests)
+        try:
+            if hint is not None and budget.take():
+                resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=prefix,
+                                               StartAfter=seek_key(prefix, hint - timedelta(hours=1)))
+                hits = self._hits(resp, prefix)
+                if hits and not resp.get("IsTruncated"):
+                    return hits[-1], budget.used
+            return self._last_under(prefix, prefix, 4, budget), budget.used
+        finally:
+            self._record(budget)
+
+    # ----- 내부 -----
+    def _record(self, budget: _Budget):
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["requests"] += budget.used
+
+    def _hits(self, resp: Dict, prefix: str) -> List[Tuple[datetime, str]]:
+        family = family_of(prefix)
+        hits = []
+        for obj in resp.get("Contents", []):
+            dt = parse_key_time(obj["Key"], family)
+            if dt is not None:
+                hits.append((dt, obj["Key"]))
+        return hits
+
+    def _ceil(self, prefix: str, dt: datetime, not_after: Optional[datetime], budget: _Budget) -> Hit:
+        start_after = seek_key(prefix, dt)
+        while budget.take():
+            resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=prefix, StartAfter=start_after, MaxKeys=1)
+            contents = resp.get("Contents", [])
+            if not contents:
+                return None
+            hits = self._hits(resp, prefix)
+            if hits and hits[0][0] >= dt:
+                hit = hits[0]
+                if not_after is not None and hit[0] > not_after:
+                    return None
+                return hit
+            # 시각을 읽을 수 없는 키(json 아님 등)나 dt보다 이른 같은 시 폴더 키(시간 패밀리)는 건너뜀
+            start_after = contents[-1]["Key"]
+        return None
+
+    def _floor(self, prefix: str, dt: datetime, not_before: Optional[datetime], budget: _Budget) -> Hit:
+        parts = [f"{dt:%Y}/", f"{dt:%m}/", f"{dt:%d}/", f"{dt:%H}/"]
+
+        # 1) dt가 속한 시 폴더 (한 시간 최대 60개라 한 페이지)
+        if not budget.take():
+            return None
+        resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=prefix + "".join(parts))
+        hits = [h for h in self._hits(resp, prefix) if h[0] <= dt]
+        if hits:
+            return self._bounded(hits[-1], not_before)
+
+        # 2) 일 → 월 → 연 → 루트 순으로 올라가며 dt보다 이른 마지막 하위 폴더에서 내려가기
+        # 해당 단계 후보는 모두 boundary 이전이므로 boundary가 not_before 이하면 더 볼 필요 없음
+        boundaries = [
+            dt.replace(minute=0, second=0, microsecond=0),
+            dt.replace(hour=0, minute=0, second=0, microsecond=0),
+            dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+            dt.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+        ]
+        for level, boundary in zip((3, 2, 1, 0), boundaries):
+            if not_before is not None and boundary <= not_before:
+                return None
+            parent = prefix + "".join(parts[:level])
+            own_child = parent + parts[level]
+            if not budget.take():
+                return None
+            children = self._child_prefixes(parent)
+            for child in reversed([c for c in children if c < own_child]):
+                hit = self._last_under(prefix, child, 3 - level, budget)
+                if hit:
+                    return self._bounded(hit, not_before)
+                if budget.used >= budget.limit:
+                    return None
+        return None
+
+    @staticmethod
+    def _bounded(hit: Hit, not_before: Optional[datetime]) -> Hit:
+        if hit and not_before is not None and hit[0] < not_before:
+            return None
+        return hit
+
+    def _child_prefixes(self, parent: str) -> List[str]:
+        resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=parent, Delimiter="/")
+        return sorted(p["Prefix"] for p in resp.get("CommonPrefixes", []))
+
+    def _last_under(self, prefix: str, folder: str, depth: int, budget: _Budget) -> Hit:
+        """folder 아래 가장 늦은 키 (depth: 시 폴더까지 남은 단계 수, 0이면 folder가 시 폴더)"""
+        if not budget.take():
+            return None
+        if depth == 0:
+            resp = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=folder)
+            hits = self._hits(resp, prefix)
+            return hits[-1] if hits else None
+        for child in reversed(self._child_prefixes(folder)):
+            hit = self._last_under(prefix, child, depth - 1, budget)
+            if hit or budget.used >= budget.limit:
+                return hit
+        return None
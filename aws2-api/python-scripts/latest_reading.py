@@ -0,0 +1,73 @@
+"""
+최신 센서 측정값 조회 (S3 요청 수 상한 보장)
+recommendbot.py / simple_temperature_bot.py 공용
+
+minavg 키는 minavg/YYYY/MM/DD/HH/YYYYMMDDHHMM_minavg.json 형태라 사전순 = 시간순이다.
+1) 빠른 경로: '현재-1시간' 키 뒤부터(StartAfter) LIST → 그 뒤 키 중 마지막 (자정을 넘겨도 한 번)
+2) 느린 경로: Delimiter="/" 로 연→월→일→시 폴더를 한 단계씩 내려가며 가장 늦은 폴더 선택
+데이터 공백이 며칠이든 LIST 최대 6번(빠른 경로 1 + 폴더 단계 5) + GET 1번으로 끝난다.
+GET은 파일 끝 몇 KB만 받는 Range 요청 (tail_reader, 레코드가 없으면 범위를 넓혀 추가 GET)
+"""
+
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from key_seek import KeySeeker
+from tail_reader import read_tail_record
+
+MINAVG_PREFIX = "minavg/"
+MAX_LIST_REQUESTS = 6
+
+def minavg_key(dt: datetime, prefix: str = MINAVG_PREFIX) -> str:
+    """시각에 해당하는 minavg 키"""
+    return f"{prefix}{dt:%Y/%m/%d/%H}/{dt:%Y%m%d%H%M}_minavg.json"
+
+def find_latest_minavg_key(s3_client, bucket: str, now: datetime = None, prefix: str = MINAVG_PREFIX,
+                           max_requests: int = MAX_LIST_REQUESTS) -> Tuple[Optional[str], int]:
+    """
+    가장 최근 minavg 키 찾기 (key_seek.KeySeeker.latest)
+    반환: (key 또는 None, 사용한 LIST 요청 수)
+    """
+    hit, used = KeySeeker(s3_client, bucket, max_requests=max_requests).latest(prefix, hint=now or datetime.now())
+    return (hit[1] if hit else None), used
+
+def _is_minavg_record(data: Dict) -> bool:
+    return 'timestamp' in data and data.get('mintemp') is not None
+
+def read_latest_record(s3_client, bucket: str, key: str) -> Tuple[Optional[Dict], int]:
+    """
+    minavg 파일에서 mintemp가 있는 마지막 레코드 (JSON Lines 대응, 끝부분만 Range GET)
+    반환: (레코드 또는 None, 사용한 GET 요청 수)
+    """
+    return read_tail_record(s3_client, bucket, key, accept=_is_minavg_record)
+
+def find_latest_minavg_reading(s3_client, bucket: str, now: datetime = None, prefix: str = MINAVG_PREFIX,
+                               max_requests: int = MAX_LIST_REQUESTS) -> Optional[Dict]:
+    """
+    가장 최근 실내 센서 측정값
+    반환 형식은 기존 find_current_indoor_temperature와 동일
+    """
+    now = now or datetime.now()
+    key, list_requests = find_latest_minavg_key(s3_client, bucket, now=now, prefix=prefix, max_requests=max_requests)
+    if not key:
+        return None
+
+    data, get_requests = read_latest_record(s3_client, bucket, key)
+    if not data:
+        return None
+
+    try:
+        data_time = datetime.fromisoformat(data['timestamp'])
+        time_diff_minutes = int(abs((now - data_time.replace(tzinfo=None)).total_seconds()) / 60)
+    except ValueError:
+        time_diff_minutes = None
+
+    return {
+        'timestamp': data['timestamp'],
+        'temperature': float(data['mintemp']),
+        'humidity': data.get('minhum'),
+        'gas': data.get('mingas'),
+        'source': key,
+        'time_diff_minutes': time_diff_minutes,
+        's3_requests': list_requests + get_requests,
+    }
@@ -0,0 +1,314 @@
+"""
+분/시 데이터 존재 비트맵 (날짜별 minavg 1,440비트 + houravg 24비트)
+"가장 가까운 데이터" 조회가 LIST를 여러 번 던져 빈 구간을 찾아내는 대신
+키 인덱스에서 날짜별 존재 비트맵을 만들어 두고 비트 연산으로 답한다.
+
+- 슬롯 i: minavg = 0시 0분 + i분, houravg = i시
+- 최근접 존재 시각: floor = (bits & 하위 마스크).bit_length() - 1, ceil = 최하위 set 비트
+- 커버리지/빈 구간: 마스크 후 popcount, 0비트 연속 구간
+- 갱신: 키 인덱스가 이미 있는(warm) 패밀리만 새로 늘어난 항목을 접어 넣음 (LIST 없음)
+- 로컬 파일에 저장해서 다음 프로세스는 인덱스 빌드 전에도 바로 조회
+covered_until(인덱스에서 본 가장 늦은 키 시각) 이후는 아직 모르는 구간이라 답하지 않는다.
+"""
+
+import os
+import json
+import bisect
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sensor_index import HOUR_FAMILIES
+
+BITMAP_VERSION = 1
+BITMAP_FAMILIES = ("minavg", "houravg")
+KEY_FORMATS = {
+    "minavg": "minavg/{dt:%Y/%m/%d/%H}/{dt:%Y%m%d%H%M}_minavg.json",
+    "houravg": "houravg/{dt:%Y/%m/%d/%H}/{dt:%Y%m%d%H}_houravg.json",
+}
+
+def _popcount(x: int) -> int:
+    return bin(x).count("1")
+
+def _span_mask(lo: int, hi: int) -> int:
+    """슬롯 lo..hi(포함) 마스크"""
+    return ((1 << (hi - lo + 1)) - 1) << lo
+
+def _one_runs(bits: int) -> List[Tuple[int, int]]:
+    """1비트 연속 구간 [(시작 슬롯, 끝 슬롯)]"""
+    runs = []
+    while bits:
+        lo = (bits & -bits).bit_length() - 1
+        t = bits >> lo
+        length = ((~t) & (t + 1)).bit_length() - 1   # t의 하위 연속 1비트 수
+        runs.append((lo, lo + length - 1))
+        bits &= ~_span_mask(lo, lo + length - 1)
+    return runs
+
+class FamilyPresence:
+    """한 패밀리의 날짜별 존재 비트맵"""
+
+    def __init__(self, family: str):
+        self.family = family
+        self.slots = 24 if family in HOUR_FAMILIES else 24 * 60
+        self.step = timedelta(hours=1) if self.slots == 24 else timedelta(minutes=1)
+        self.days: Dict[date, int] = {}
+        self.sorted_days: List[date] = []
+        self.covered_until: Optional[datetime] = None
+        self.folded = 0   # 키 인덱스에서 접어 넣은 항목 수
+
+    # ----- 슬롯 변환 -----
+    def slot(self, dt: datetime) -> int:
+        return dt.hour if self.slots == 24 else dt.hour * 60 + dt.minute
+
+    def slot_time(self, day: date, slot: int) -> datetime:
+        return datetime(day.year, day.month, day.day) + self.step * slot
+
+    def key_for(self, dt: datetime, prefix: str = "") -> str:
+        return prefix + KEY_FORMATS[self.family].format(dt=dt)
+
+    # ----- 갱신 -----
+    def clear(self):
+        self.days, self.sorted_days, self.covered_until, self.folded = {}, [], None, 0
+
+    def add(self, dt: datetime):
+        day = dt.date()
+        if day not in self.days:
+            bisect.insort(self.sorted_days, day)
+            self.days[day] = 0
+        self.days[day] |= 1 << self.slot(dt)
+        if self.covered_until is None or dt > self.covered_until:
+            self.covered_until = dt
+
+    def knows(self, dt: datetime) -> bool:
+        """dt 시점까지 비트맵이 확정적인지 (이후는 인덱스에 아직 안 들어온 구간)"""
+        return self.covered_until is not None and dt <= self.covered_until
+
+    # ----- 조회 -----
+    def has(self, dt: datetime) -> bool:
+        return bool(self.days.get(dt.date(), 0) >> self.slot(dt) & 1)
+
+    def floor(self, dt: datetime) -> Optional[datetime]:
+        """dt 이하에서 가장 늦은 존재 슬롯 시각"""
+        day = dt.date()
+        bits = self.days.get(day, 0) & ((1 << (self.slot(dt) + 1)) - 1)
+        if not bits:
+            i = bisect.bisect_left(self.sorted_days, day)
+            if i == 0:
+                return None
+            day = self.sorted_days[i - 1]
+            bits = self.days[day]
+        return self.slot_time(day, bits.bit_length() - 1)
+
+    def ceil(self, dt: datetime) -> Optional[datetime]:
+        """dt 이상에서 가장 이른 존재 슬롯 시각"""
+        day, lo = dt.date(), self.slot(dt)
+        if dt > self.slot_time(day, lo):
+            lo += 1   # 슬롯 중간 시각이면 다음 슬롯부터
+        bits = self.days.get(day, 0) >> lo << lo
+        if not bits:
+            i = bisect.bisect_right(self.sorted_days, day)
+            if i >= len(self.sorted_days):
+                return None
+            day = self.sorted_days[i]
+            bits = self.days[day]
+        return self.slot_time(day, (bits & -bits).bit_length() - 1)
+
+    def _day_spans(self, start: datetime, end: datetime):
+        """[start, end]를 날짜별 (날짜, lo 슬롯, hi 슬롯)으로"""
+        day = start.date()
+        while day <= end.date():
+            lo = self.slot(start) if day == start.date() else 0
+            hi = self.slot(end) if day == end.date() else self.slots - 1
+            yield day, lo, hi
+            day += timedelta(days=1)
+
+    def count(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        """[start, end] 구간 (존재 슬롯 수, 전체 슬롯 수)"""
+        present = expected = 0
+        for day, lo, hi in self._day_spans(start, end):
+            present += _popcount(self.days.get(day, 0) & _span_mask(lo, hi))
+            expected += hi - lo + 1
+        return present, expected
+
+    def missing(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """[start, end]에서 데이터가 없는 연속 구간 [(첫 빈 슬롯 시각, 마지막 빈 슬롯 시각)] (날짜를 넘으면 이어 붙임)"""
+        out: List[Tuple[datetime, datetime]] = []
+        for day, lo, hi in self._day_spans(start, end):
+            holes = ~self.days.get(day, 0) & _span_mask(lo, hi)
+            for a, b in _one_runs(holes):
+                first, last = self.slot_time(day, a), self.slot_time(day, b)
+                if out and out[-1][1] + self.step == first:
+                    out[-1] = (out[-1][0], last)
+                else:
+                    out.append((first, last))
+        return out
+
+    def present_times(self, day: date, limit: int = None) -> List[datetime]:
+        """그날 존재 슬롯 시각 (이른 것부터)"""
+        out = []
+        for a, b in _one_runs(self.days.get(day, 0)):
+            for slot in range(a, b + 1):
+                out.append(self.slot_time(day, slot))
+                if limit and len(out) >= limit:
+                    return out
+        return out
+
+class PresenceBitmaps:
+    """패밀리별 존재 비트맵 묶음 (키 인덱스에서 갱신, 로컬 파일 저장, 스레드 안전)"""
+
+    def __init__(self, index, path: str = None, prefix: str = "", families=BITMAP_FAMILIES):
+        self.index = index
+        self.path = path
+        self.prefix = prefix
+        self.families: Dict[str, FamilyPresence] = {f: FamilyPresence(f) for f in families}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def family(self, family: str) -> Optional[FamilyPresence]:
+        with self._lock:
+            self._load()
+        return self.families.get(family.strip("/"))
+
+    def refresh(self, family: str = None) -> int:
+        """
+        인덱스가 warm인 패밀리의 새 항목을 비트에 반영, 반영한 항목 수 반환
+        인덱스 항목이 끝이 아닌 곳에 끼어들었으면(늦게 올라온 키) 그 패밀리는 처음부터 다시 만듦
+        """
+        with self._lock:
+            self._load()
+            added = 0
+            targets = [family.strip("/")] if family else list(self.families)
+            for name in targets:
+                fp = self.families.get(name)
+                if fp is None or not self.index.is_warm(name):
+                    continue
+                fam = self.index.families[name]
+                if len(fam) == fp.folded:
+                    continue
+                start = bisect.bisect_right(fam.times, fp.covered_until) if fp.covered_until else 0
+                if start != fp.folded:
+                    fp.clear()
+                    start = 0
+                for dt in fam.times[start:]:
+                    fp.add(dt)
+                added += len(fam) - start
+                fp.folded = len(fam)
+            if added:
+                self._save()
+            return added
+
+    # ----- 조회 (확정 구간 밖이면 None → 호출 측이 다른 경로 사용) -----
+    def neighbors(self, family: str, dt: datetime):
+        """
+        (floor, ceil) = ((시각, 키) 또는 None, ...) — 키 인덱스 neighbors와 같은 형태
+        dt가 확정 구간 밖이면 None
+        """
+        fp = self.family(family)
+        if fp is None or not fp.knows(dt):
+            return None
+        lo, hi = fp.floor(dt), fp.ceil(dt)
+        return ((lo, fp.key_for(lo, self.prefix)) if lo else None,
+                (hi, fp.key_for(hi, self.prefix)) if hi else None)
+
+    def is_missing(self, family: str, dt: datetime) -> bool:
+        """dt에 데이터가 없다고 확정할 수 있으면 True"""
+        fp = self.family(family)
+        return fp is not None and fp.knows(dt) and not fp.has(dt)
+
+    def coverage(self, family: str, start: datetime, end: datetime) -> Optional[Tuple[int, int]]:
+        """[start, end] (존재, 전체) 슬롯 수, 확정 구간 밖이면 None"""
+        fp = self.family(family)
+        if fp is None or not fp.knows(end):
+            return None
+        return fp.count(start, end)
+
+    def gaps(self, family: str, start: datetime, end: datetime) -> Optional[List[Tuple[datetime, datetime]]]:
+        """[start, end]의 빈 구간 (확정 구간까지만), 비트맵이 없으면 None"""
+        fp = self.family(family)
+        if fp is None or fp.covered_until is None or start > fp.covered_until:
+            return None
+        return fp.missing(start, min(end, fp.covered_until))
+
+    def keys_near(self, dt: datetime, days: int = 3, limit: int = 20,
+                  families=BITMAP_FAMILIES) -> Optional[List[str]]:
+        """dt 전후 days일 동안 데이터가 있는 키 (날짜 순, 날짜별로 이른 것부터), 비트맵이 없으면 None"""
+        fps = [self.family(f) for f in families]
+        if any(fp is None or fp.covered_until is None for fp in fps):
+            return None
+        keys: List[str] = []
+        for offset in range(-days, days + 1):
+            day = (dt + timedelta(days=offset)).date()
+            for fp in fps:
+                for t in fp.present_times(day, limit - len(keys)):
+                    keys.append(fp.key_for(t, self.prefix))
+                if len(keys) >= limit:
+                    return keys
+        return keys
+
+    # ----- 로컬 파일 -----
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            if snap.get("version") != BITMAP_VERSION or snap.get("prefix") != self.prefix:
+                return
+            for name, body in snap.get("families", {}).items():
+                fp = self.families.get(name)
+                if fp is None:
+                    continue
+                for day_id, hex_bits in body.get("days", {}).items():
+                    fp.days[datetime.strptime(day_id, "%Y%m%d").date()] = int(hex_bits, 16)
+                fp.sorted_days = sorted(fp.days)
+                fp.covered_until = datetime.fromisoformat(body["covered_until"]) if body.get("covered_until") else None
+                fp.folded = int(body.get("folded", 0))
+        except Exception as e:
+            print(f"[경고] 존재 비트맵 로드 실패: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            snap = {
+                "version": BITMAP_VERSION,
+                "prefix": self.prefix,
+                "saved_at": datetime.now().isoformat(),
+                "families": {
+                    name: {
+                        "covered_until": fp.covered_until.isoformat() if fp.covered_until else None,
+                        "folded": fp.folded,
+                        "days": {f"{d:%Y%m%d}": format(bits, "x") for d, bits in fp.days.items()},
+                    }
+                    for name, fp in self.families.items()
+                },
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[경고] 존재 비트맵 저장 실패: {e}")
+
+def format_gaps(gaps: List[Tuple[datetime, datetime]], family: str = "minavg", limit: int = 5) -> str:
+    """빈 구간 → "13시 05분~13시 40분(36분), ..." (limit개까지)"""
+    hourly = family in HOUR_FAMILIES
+    multi_day = len({d for g in gaps for d in (g[0].date(), g[1].date())}) > 1
+
+    def _t(dt: datetime) -> str:
+        text = f"{dt.hour}시" if hourly else f"{dt.hour}시 {dt.minute:02d}분"
+        return f"{dt.month}월 {dt.day}일 {text}" if multi_day else text
+
+    parts = []
+    for first, last in gaps[:limit]:
+        n = int((last - first) / (timedelta(hours=1) if hourly else timedelta(minutes=1))) + 1
+        unit = "시간" if hourly else "분"
+        parts.append(_t(first) if first == last else f"{_t(first)}~{_t(last)}({n}{unit})")
+    if len(gaps) > limit:
+        parts.append(f"외 {len(gaps) - limit}곳")
+    return ", ".join(parts)
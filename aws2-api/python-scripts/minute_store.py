@@ -0,0 +1,303 @@
+"""
+분 평균 일별 컬럼 저장소 (minavg 하루치 → 고정 레이아웃 바이너리 파일 1개)
+하루에 걸친 질의가 minavg 객체 최대 1,440개 GET + JSON 파싱이 되지 않도록
+지난(봉인된) 날짜의 분 평균을 압축 작업으로 파일 하나에 모아 두고 mmap으로 읽는다.
+
+레이아웃 (YYYYMMDD.amin, 리틀 엔디언):
+  헤더 32바이트    magic "AWMIN\\0", version(u16), slots(u16), fields(u16), day(u32 YYYYMMDD), present(u16)
+  값 컬럼          float32 × 1440슬롯 × 3 (온도 → 습도 → CO2, 필드별로 연속 → 구간 = 슬라이스 하나)
+  유효 비트맵      1440비트 (슬롯 i = 0시 0분 + i분, 비트가 0이면 측정 없음)
+
+- 로컬: <store_dir>/YYYYMMDD.amin (mmap 읽기 전용)
+- 원격(선택): 데이터 버킷 <remote_prefix>YYYY/MM/YYYYMMDD.amin
+  fetch_remote면 로컬에 없는 날짜를 한 번 GET해서 로컬에 저장 (없는 날짜는 프로세스 동안 다시 묻지 않음)
+
+  python minute_store.py compact --days 7                    # 어제부터 7일 압축
+  python minute_store.py compact --date 2026-10-17 --upload  # S3에도 업로드
+  python minute_store.py show --date 2026-10-17 --time 14:30
+"""
+
+import os
+import sys
+import mmap
+import math
+import struct
+import argparse
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from range_engine import FIELDS, extract_row, parse_record
+from sensor_cache import MINUTE_SEAL_GRACE, seal_clock
+
+STORE_VERSION = 1
+MAGIC = b"AWMIN\0"
+SLOTS = 24 * 60
+HEADER = struct.Struct("<6sHHHIH14x")          # 32바이트
+COLUMN_BYTES = SLOTS * 4
+BITMAP_OFFSET = HEADER.size + COLUMN_BYTES * len(FIELDS)
+BITMAP_BYTES = SLOTS // 8
+FILE_SIZE = BITMAP_OFFSET + BITMAP_BYTES
+
+Row = Tuple[float, float, float]
+
+def slot_of(dt: datetime) -> int:
+    return dt.hour * 60 + dt.minute
+
+def encode_day(day: date, rows: Iterable[Tuple[datetime, Row]]) -> bytes:
+    """[(분 시각, (온도, 습도, CO2))] → 파일 바이트"""
+    values = array("f", [math.nan]) * (SLOTS * len(FIELDS))
+    bitmap = bytearray(BITMAP_BYTES)
+    present = 0
+    for dt, row in rows:
+        if dt.date() != day or all(math.isnan(v) for v in row):
+            continue
+        slot = slot_of(dt)
+        if not bitmap[slot >> 3] & (1 << (slot & 7)):
+            present += 1
+        bitmap[slot >> 3] |= 1 << (slot & 7)
+        for j, v in enumerate(row):
+            values[j * SLOTS + slot] = v
+    if sys.byteorder != "little":
+        values.byteswap()
+    header = HEADER.pack(MAGIC, STORE_VERSION, SLOTS, len(FIELDS), int(f"{day:%Y%m%d}"), present)
+    return header + values.tobytes() + bytes(bitmap)
+
+class MinuteDay:
+    """하루치 컬럼 파일 (mmap 읽기 전용, 슬라이스는 복사 없는 memoryview)"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, slots, n_fields, day_id, present = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != STORE_VERSION or slots != SLOTS or n_fields != len(FIELDS) \
+                    or len(self._mm) != FILE_SIZE:
+                raise ValueError(f"형식 불일치: {path}")
+        except Exception:
+            self._mm.close()
+            raise
+        self.path = path
+        self.day = datetime.strptime(str(day_id), "%Y%m%d").date()
+        self.present = present
+        view = memoryview(self._mm)
+        self._columns = [view[HEADER.size + j * COLUMN_BYTES: HEADER.size + (j + 1) * COLUMN_BYTES].cast("f")
+                         for j in range(len(FIELDS))]
+        self._bitmap = view[BITMAP_OFFSET:BITMAP_OFFSET + BITMAP_BYTES]
+        self._views = [view, self._bitmap, *self._columns]
+
+    def is_valid(self, slot: int) -> bool:
+        return bool(self._bitmap[slot >> 3] & (1 << (slot & 7)))
+
+    def column(self, field: str, lo: int = 0, hi: int = SLOTS) -> memoryview:
+        """필드 하나의 [lo, hi) 슬롯 값 (float32, 측정 없는 슬롯은 NaN)"""
+        return self._columns[FIELDS.index(field)][lo:hi]
+
+    def row(self, slot: int) -> Optional[Row]:
+        if not self.is_valid(slot):
+            return None
+        return tuple(col[slot] for col in self._columns)
+
+    def rows(self, lo: int = 0, hi: int = SLOTS) -> List[Tuple[datetime, Row]]:
+        """[lo, hi) 슬롯 중 측정이 있는 것만 [(시각, 행)]"""
+        base = datetime(self.day.year, self.day.month, self.day.day)
+        cols = [c[lo:hi] for c in self._columns]
+        return [(base + timedelta(minutes=lo + i), tuple(c[i] for c in cols))
+                for i in range(hi - lo) if self.is_valid(lo + i)]
+
+    def close(self):
+        """
+        mmap 닫기 (다른 스레드가 쓰는 중이면 호출하지 말 것)
+        column()으로 내준 슬라이스가 아직 살아 있으면 mmap을 닫을 수 없으므로 그대로 두고,
+        마지막 슬라이스가 사라질 때 GC가 매핑을 해제
+        """
+        for v in self._views:
+            v.release()
+        self._views = []
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+class MinuteStore:
+    """날짜별 컬럼 파일 (열린 mmap 재사용, 스레드 안전)"""
+
+    def __init__(self, store_dir: str, s3_client=None, bucket: str = None, remote_prefix: str = "minute_store/",
+                 fetch_remote: bool = False):
+        self.store_dir = store_dir
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.remote_prefix = remote_prefix
+        self.fetch_remote = fetch_remote   # 로컬에 없는 날짜를 원격에서 받아올지 (업로드는 항상 가능)
+        self._days: Dict[date, MinuteDay] = {}
+        self._remote_missing = set()   # 원격에도 없는 날짜 (프로세스 동안 다시 묻지 않음)
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "downloaded": 0, "compacted": 0}
+
+    def path(self, day: date) -> str:
+        return os.path.join(self.store_dir, f"{day:%Y%m%d}.amin")
+
+    def remote_key(self, day: date) -> str:
+        return f"{self.remote_prefix}{day:%Y/%m}/{day:%Y%m%d}.amin"
+
+    @staticmethod
+    def is_sealed(day: date, now: datetime = None) -> bool:
+        """하루의 마지막 분 구간까지 봉인됐는지 (압축 대상)"""
+        now = now or seal_clock()
+        return now >= datetime(day.year, day.month, day.day) + timedelta(days=1) + MINUTE_SEAL_GRACE
+
+    def has_day(self, day: date) -> bool:
+        """봉인된 날짜의 로컬 파일이 있는지 (원격 GET 없음, 검색 계획용)"""
+        return self.is_sealed(day) and (day in self._days or os.path.exists(self.path(day)))
+
+    # ----- 읽기 -----
+    def get_day(self, day: date, fetch_remote: bool = None) -> Optional[MinuteDay]:
+        if fetch_remote is None:
+            fetch_remote = self.fetch_remote
+        with self._lock:
+            opened = self._days.get(day)
+            if opened is not None:
+                return opened
+            path = self.path(day)
+            if not os.path.exists(path) and not (fetch_remote and self._download(day)):
+                return None
+            try:
+                opened = MinuteDay(path)
+            except Exception as e:
+                print(f"[경고] 분 컬럼 파일 열기 실패 ({day}): {e}")
+                return None
+            self._days[day] = opened
+            self.stats["opened"] += 1
+            return opened
+
+    def lookup(self, dt: datetime) -> Optional[Row]:
+        """분 하나 (파일이 없거나 측정이 없으면 None)"""
+        day = self.get_day(dt.date())
+        return day.row(slot_of(dt)) if day else None
+
+    def series(self, start: datetime, end: datetime) -> Optional[Tuple[List[datetime], List[Row]]]:
+        """[start, end] 분 구간 (times, rows) - 구간의 날짜가 하나라도 저장소에 없으면 None"""
+        days = []
+        d = start.date()
+        while d <= end.date():
+            day = self.get_day(d) if self.is_sealed(d) else None
+            if day is None:
+                return None
+            days.append(day)
+            d += timedelta(days=1)
+        times, rows = [], []
+        for day in days:
+            lo = slot_of(start) if day.day == start.date() else 0
+            hi = slot_of(end) + 1 if day.day == end.date() else SLOTS
+            for t, row in day.rows(lo, hi):
+                times.append(t)
+                rows.append(row)
+        return times, rows
+
+    def _download(self, day: date) -> bool:
+        if self.s3 is None or not self.bucket or day in self._remote_missing:
+            return False
+        try:
+            body = self.s3.get_object(Bucket=self.bucket, Key=self.remote_key(day))["Body"].read()
+        except Exception:
+            # NoSuchKey 포함: 이 날짜는 아직 압축되지 않음
+            self._remote_missing.add(day)
+            return False
+        if len(body) != FILE_SIZE:
+            self._remote_missing.add(day)
+            return False
+        self._write(day, body)
+        self.stats["downloaded"] += 1
+        return True
+
+    # ----- 압축 -----
+    def compact_day(self, day: date, points: List[Tuple[datetime, str]], fetch_text: Callable[[str], str],
+                    map_fn: Callable = map, upload: bool = False) -> Optional[MinuteDay]:
+        """
+        그날 minavg 키들(points: [(시각, 키)])을 읽어 컬럼 파일로 저장
+        아직 봉인되지 않은 날짜나 측정이 하나도 없는 날짜는 만들지 않음 (None)
+        """
+        if not self.is_sealed(day):
+            return None
+
+        def _load(point):
+            dt, key = point
+            try:
+                record = parse_record(fetch_text(key))
+            except Exception:
+                return None
+            return (dt, extract_row(record)) if record else None
+
+        rows = [r for r in map_fn(_load, points) if r is not None]
+        if not rows:
+            return None
+        body = encode_day(day, rows)
+        with self._lock:
+            # 이전 매핑은 닫지 않고 버림: get_day로 받아 간 스레드가 아직 읽고 있을 수 있음
+            # (os.replace 뒤에도 이전 파일 내용은 그대로 유지되고, 참조가 모두 사라지면 GC가 해제)
+            self._days.pop(day, None)
+            self._write(day, body)
+            self._remote_missing.discard(day)
+            self.stats["compacted"] += 1
+        if upload and self.s3 is not None and self.bucket:
+            self.s3.put_object(Bucket=self.bucket, Key=self.remote_key(day), Body=body,
+                               ContentType="application/octet-stream")
+        return self.get_day(day, fetch_remote=False)
+
+    def _write(self, day: date, body: bytes):
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = self.path(day)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        with self._lock:
+            for day in self._days.values():
+                day.close()
+            self._days.clear()
+
+# ===== 압축 작업 CLI =====
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="minavg 일별 컬럼 파일 압축/조회")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cp = sub.add_parser("compact", help="지난 날짜의 minavg를 컬럼 파일로 압축")
+    cp.add_argument("--date", help="YYYY-MM-DD (기본: 어제부터 --days일)")
+    cp.add_argument("--days", type=int, default=1)
+    cp.add_argument("--upload", action="store_true", help="데이터 버킷에도 업로드")
+    cp.add_argument("--force", action="store_true", help="이미 있는 파일도 다시 생성")
+    sh = sub.add_parser("show", help="컬럼 파일에서 분 하나 조회")
+    sh.add_argument("--date", required=True)
+    sh.add_argument("--time", required=True, help="HH:MM")
+    args = parser.parse_args(argv)
+
+    import chatbot
+    store = chatbot.get_minute_store()
+
+    if args.command == "show":
+        day = datetime.strptime(args.date, "%Y-%m-%d").date()
+        hh, mm = map(int, args.time.split(":"))
+        row = store.lookup(datetime(day.year, day.month, day.day, hh, mm))
+        print({f: round(v, 4) for f, v in zip(FIELDS, row) if v == v} if row else "데이터 없음")
+        return 0
+
+    if args.date:
+        days = [datetime.strptime(args.date, "%Y-%m-%d").date()]
+    else:
+        yesterday = seal_clock().date() - timedelta(days=1)
+        days = [yesterday - timedelta(days=i) for i in range(args.days)]
+    for day in days:
+        if not args.force and store.get_day(day, fetch_remote=False) is not None:
+            print(f"{day}: 이미 있음")
+            continue
+        start = datetime(day.year, day.month, day.day)
+        points = chatbot.get_sensor_index().between("minavg", start, start + timedelta(minutes=SLOTS - 1))
+        out = store.compact_day(day, points, chatbot.get_object_cache().get_text,
+                                chatbot.get_lookup_executor().map, upload=args.upload)
+        print(f"{day}: " + (f"{out.present}/{SLOTS}분 저장 ({out.path})" if out else "건너뜀 (봉인 전이거나 데이터 없음)"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+구간 집계 엔진 ("14시부터 16시까지 평균 온도" 같은 범위 질의)
+구간 [start, end]의 minavg(구간이 길면 houravg) 시계열을 온도/습도/CO2 배열로 읽어
+평균, 최저/최고와 그 시각, 표준편차, 커버리지(있어야 할 측정 중 실제 있는 비율)를 한 번에 계산하고
+문서를 통째로 나열하는 대신 프롬프트용 요약 블록을 만든다.
+
+numpy가 있으면 (n, 3) 배열 벡터 연산, 없으면 같은 결과를 순수 파이썬으로 계산
+"""
+
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tail_reader import last_json_record
+
+try:
+    import numpy as np
+except ImportError:  # 선택 의존성
+    np = None
+
+FIELDS = ("temperature", "humidity", "gas")
+FIELD_LABELS = {"temperature": "온도", "humidity": "습도", "gas": "이산화탄소(CO2)"}
+FIELD_UNITS = {"temperature": "도", "humidity": "%", "gas": "ppm"}
+
+# 해상도별 원본 필드 (앞에 있는 것 우선)
+SOURCE_FIELDS = {
+    "minute": {"temperature": ("mintemp", "temperature"), "humidity": ("minhum", "humidity"), "gas": ("mingas", "gas")},
+    "hour": {"temperature": ("hourtemp", "temperature"), "humidity": ("hourhum", "humidity"), "gas": ("hourgas", "gas")},
+}
+STEP = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+MAX_BUCKETS = 24  # 시간대별 평균은 이 개수 이하일 때만 (프롬프트 길이)
+
+def parse_record(text: str) -> Optional[Dict]:
+    """센서 파일 → 레코드 dict (JSON Lines면 마지막 유효 줄, mintrend는 data 안쪽)"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = last_json_record(text, accept=None)
+    if not isinstance(data, dict):
+        return None
+    if isinstance(data.get("data"), dict):
+        return {**data["data"], "timestamp": data.get("timestamp", data["data"].get("timestamp"))}
+    return data
+
+def _value(record: Dict, names: Sequence[str]) -> float:
+    for name in names:
+        v = record.get(name)
+        if v is None:
+            continue
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            continue
+    return math.nan
+
+def extract_row(record: Dict, resolution: str = "minute") -> Tuple[float, float, float]:
+    """레코드 → (온도, 습도, CO2), 없는 값은 NaN"""
+    names = SOURCE_FIELDS[resolution]
+    return tuple(_value(record, names[f]) for f in FIELDS)
+
+class RangeSeries:
+    """구간 시계열: times[i]의 (온도, 습도, CO2) = rows[i] (없는 값은 NaN)"""
+
+    def __init__(self, start: datetime, end: datetime, resolution: str,
+                 times: List[datetime], rows: List[Tuple[float, float, float]]):
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.times = times
+        self.rows = rows
+
+    @property
+    def expected(self) -> int:
+        """구간에 있어야 할 측정 개수 (양 끝 포함)"""
+        step = STEP[self.resolution]
+        first = self.start.replace(second=0, microsecond=0)
+        if self.resolution == "hour":
+            first = first.replace(minute=0)
+        return max(1, int((self.end - first) // step) + 1)
+
+def build_series(start: datetime, end: datetime, resolution: str, points: Iterable[Tuple[datetime, str]],
+                 fetch_text: Callable[[str], str], map_fn: Callable = map) -> RangeSeries:
+    """
+    points: [(키 시각, 키)] (시간순) → 파일을 읽어 시계열 생성
+    map_fn: 병렬 실행기의 map (기본: 순차)
+    """
+    points = [(dt, key) for dt, key in points if start <= dt <= end]
+
+    def _load(point):
+        dt, key = point
+        try:
+            record = parse_record(fetch_text(key))
+        except Exception:
+            return None
+        if not record:
+            return None
+        return dt, extract_row(record, resolution)
+
+    times, rows = [], []
+    for item in map_fn(_load, points):
+        if item is None:
+            continue
+        times.append(item[0])
+        rows.append(item[1])
+    return RangeSeries(start, end, resolution, times, rows)
+
+# ===== 집계 =====
+def summarize(series: RangeSeries, bucket: timedelta = timedelta(hours=1)) -> Optional[Dict]:
+    """
+    필드별 {"mean", "min", "max", "min_time", "max_time", "std", "count", "coverage"}
+    + 전체 커버리지 + bucket 단위 평균(시간대별)
+    측정이 하나도 없으면 None
+    """
+    if not series.rows:
+        return None
+    fields = _summarize_numpy(series) if np is not None else _summarize_python(series)
+    if not any(f["count"] for f in fields.values()):
+        return None
+    expected = series.expected
+    present = sum(1 for row in series.rows if any(not math.isnan(v) for v in row))
+    return {
+        "start": series.start,
+        "end": series.end,
+        "resolution": series.resolution,
+        "expected": expected,
+        "present": present,
+        "coverage": min(1.0, present / expected),
+        "fields": fields,
+        "buckets": _bucket_means(series, bucket) if series.resolution == "minute" else [],
+    }
+
+def _field_stats(count, mean, std, vmin, vmax, tmin, tmax, expected) -> Dict:
+    if not count:
+        return {"count": 0, "coverage": 0.0}
+    return {
+        "count": int(count),
+        "coverage": min(1.0, count / expected),
+        "mean": float(mean), "std": float(std),
+        "min": float(vmin), "min_time": tmin,
+        "max": float(vmax), "max_time": tmax,
+    }
+
+def _summarize_numpy(series: RangeSeries) -> Dict:
+    vals = np.asarray(series.rows, dtype=float)              # (n, 3)
+    mask = ~np.isnan(vals)
+    counts = mask.sum(axis=0)
+    safe = np.maximum(counts, 1)
+    sums = np.where(mask, vals, 0.0).sum(axis=0)
+    means = sums / safe
+    stds = np.sqrt(np.where(mask, (vals - means) ** 2, 0.0).sum(axis=0) / safe)
+    argmin = np.where(mask, vals, np.inf).argmin(axis=0)
+    argmax = np.where(mask, vals, -np.inf).argmax(axis=0)
+    expected = series.expected
+    out = {}
+    for j, f in enumerate(FIELDS):
+        out[f] = _field_stats(counts[j], means[j], stds[j], vals[argmin[j], j], vals[argmax[j], j],
+                              series.times[argmin[j]], series.times[argmax[j]], expected)
+    return out
+
+def _summarize_python(series: RangeSeries) -> Dict:
+    expected = series.expected
+    out = {}
+    for j, f in enumerate(FIELDS):
+        pairs = [(row[j], t) for t, row in zip(series.times, series.rows) if not math.isnan(row[j])]
+        if not pairs:
+            out[f] = _field_stats(0, 0, 0, 0, 0, None, None, expected)
+            continue
+        values = [v for v, _ in pairs]
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        vmin, tmin = min(pairs, key=lambda p: p[0])
+        vmax, tmax = max(pairs, key=lambda p: p[0])
+        out[f] = _field_stats(len(values), mean, std, vmin, vmax, tmin, tmax, expected)
+    return out
+
+def _bucket_means(series: RangeSeries, bucket: timedelta) -> List[Dict]:
+    """bucket(기본 1시간) 단위 필드 평균 [{"start", "temperature", ...}]"""
+    origin = series.start.replace(minute=0, second=0, microsecond=0)
+    n_buckets = int((series.end - origin) // bucket) + 1
+    if n_buckets <= 1 or n_buckets > MAX_BUCKETS:
+        return []
+    idx = [int((t - origin) // bucket) for t in series.times]
+    if np is not None:
+        vals = np.asarray(series.rows, dtype=float)
+        mask = ~np.isnan(vals)
+        sums = np.zeros((n_buckets, len(FIELDS)))
+        counts = np.zeros((n_buckets, len(FIELDS)))
+        np.add.at(sums, np.asarray(idx), np.where(mask, vals, 0.0))
+        np.add.at(counts, np.asarray(idx), mask)
+        means = [[(sums[b, j] / counts[b, j]) if counts[b, j] else None for j in range(len(FIELDS))]
+                 for b in range(n_buckets)]
+    else:
+        acc = [[[0.0, 0] for _ in FIELDS] for _ in range(n_buckets)]
+        for b, row in zip(idx, series.rows):
+            for j, v in enumerate(row):
+                if not math.isnan(v):
+                    acc[b][j][0] += v
+                    acc[b][j][1] += 1
+        means = [[(s / c) if c else None for s, c in cells] for cells in acc]
+    out = []
+    for b, row in enumerate(means):
+        if all(v is None for v in row):
+            continue
+        out.append({"start": origin + bucket * b, **{f: (float(v) if v is not None else None) for f, v in zip(FIELDS, row)}})
+    return out
+
+# ===== 프롬프트 블록 =====
+def _fmt_time(dt: datetime, resolution: str, with_date: bool = False) -> str:
+    text = f"{dt.hour}시" if resolution == "hour" else f"{dt.hour}시 {dt.minute:02d}분"
+    return f"{dt.month}월 {dt.day}일 {text}" if with_date else text
+
+def format_summary(summary: Dict, fields: Iterable[str] = None, tag: str = "R1", source: str = "") -> str:
+    """요약 dict → 프롬프트용 텍스트 블록"""
+    fields = [f for f in FIELDS if not fields or f in set(fields)]
+    start, end, res = summary["start"], summary["end"], summary["resolution"]
+    unit_name = "분 평균" if res == "minute" else "시간 평균"
+    multi_day = end.date() != start.date()
+    span = f"{start.year}년 {_fmt_time(start, res, True)} ~ {_fmt_time(end, res, multi_day)}"
+    lines = [f"[{tag}] {span} 구간 집계 ({unit_name} {summary['expected']}개 중 {summary['present']}개, "
+             f"커버리지 {summary['coverage'] * 100:.1f}%){source}"]
+    for f in fields:
+        st = summary["fields"][f]
+        label, unit = FIELD_LABELS[f], FIELD_UNITS[f]
+        if not st["count"]:
+            lines.append(f"{label}: 데이터 없음")
+            continue
+        lines.append(
+            f"{label}: 평균 {st['mean']:.2f}{unit}, 최저 {st['min']:.2f}{unit} ({_fmt_time(st['min_time'], res, multi_day)}), "
+            f"최고 {st['max']:.2f}{unit} ({_fmt_time(st['max_time'], res, multi_day)}), 표준편차 {st['std']:.2f}"
+        )
+    if summary.get("buckets"):
+        parts = []
+        for b in summary["buckets"]:
+            vals = [f"{FIELD_LABELS[f].split('(')[0]} {b[f]:.1f}{FIELD_UNITS[f]}" for f in fields if b.get(f) is not None]
+            parts.append(f"{_fmt_time(b['start'], 'hour', multi_day)} " + "/".join(vals))
+        lines.append("시간대별 평균: " + " | ".join(parts))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,192 @@
+"""
+요청 단위 추적 (선택 사용)
+한 번의 챗봇 요청에서 단계별 소요 시간과 S3(LIST/HEAD/GET/PUT)·Bedrock 호출 수, 전송 바이트를 집계한다.
+
+- boto3 기본 세션에 botocore 이벤트 훅을 걸어두면 이후 만들어지는 모든 클라이언트 호출이 집계됨
+  (chatbot.py가 클라이언트 생성 전에 install_boto3_hooks() 호출)
+- 추적이 켜지지 않은 요청에서는 훅이 바로 반환하므로 비용이 거의 없음
+- 활성 추적은 contextvars로 요청 스레드에만 묶임: 백그라운드 스레드(키 인덱스 빌더, write-behind 전송)의
+  호출은 집계되지 않음, 요청 경로에서 스레드풀에 넘기는 작업은 bind(fn)으로 감싸 같은 추적에 집계
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+_ACTIVE: "contextvars.ContextVar[Optional[RequestTrace]]" = contextvars.ContextVar("request_trace", default=None)
+_HOOKS_INSTALLED = False
+
+class RequestTrace:
+    """단계별 시간 + AWS 호출 집계"""
+
+    def __init__(self, request_id: str = None):
+        self.request_id = request_id
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.calls: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.stage_calls: Dict[str, Dict[str, int]] = {}
+        self.current_stage: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """with trace.stage("retrieval"): ... (같은 이름이 여러 번이면 합산)"""
+        prev = self.current_stage
+        self.current_stage = name
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self.current_stage = prev
+
+    def record_call(self, service: str, operation: str, bytes_in: int = 0, bytes_out: int = 0):
+        with self._lock:
+            op = self.calls.setdefault(service, {}).setdefault(operation, {"count": 0, "bytes_in": 0, "bytes_out": 0})
+            op["count"] += 1
+            op["bytes_in"] += bytes_in
+            op["bytes_out"] += bytes_out
+            stage = self.current_stage or "other"
+            name = f"{service}.{operation}"
+            per_stage = self.stage_calls.setdefault(stage, {})
+            per_stage[name] = per_stage.get(name, 0) + 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "started_at": self.started_at.isoformat(),
+                "total_sec": round(time.perf_counter() - self._t0, 4),
+                "stages": {k: round(v, 4) for k, v in self.stages.items()},
+                "calls": json.loads(json.dumps(self.calls)),
+                "stage_calls": json.loads(json.dumps(self.stage_calls)),
+            }
+
+# ===== 활성 추적 =====
+def start_trace(request_id: str = None) -> RequestTrace:
+    trace = RequestTrace(request_id)
+    _ACTIVE.set(trace)
+    return trace
+
+def end_trace() -> Optional[Dict]:
+    trace = _ACTIVE.get()
+    _ACTIVE.set(None)
+    return trace.to_dict() if trace else None
+
+def current_trace() -> Optional[RequestTrace]:
+    return _ACTIVE.get()
+
+def bind(fn: Callable) -> Callable:
+    """
+    현재 추적을 다른 스레드에서 실행될 fn에 연결 (요청 스레드에서 submit/map 직전에 감쌈)
+    추적이 없으면 fn 그대로
+    """
+    trace = _ACTIVE.get()
+    if trace is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _ACTIVE.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _ACTIVE.reset(token)
+    return run
+
+@contextlib.contextmanager
+def stage(name: str):
+    """활성 추적이 없으면 아무것도 하지 않는 단계 타이머"""
+    trace = _ACTIVE.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+# ===== botocore 훅 =====
+def _body_size(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+def _call_name(event_name: str):
+    """'after-call.s3.GetObject' → ('s3', 'GetObject')"""
+    parts = (event_name or "").split(".")
+    if len(parts) >= 3:
+        return parts[1], parts[2]
+    return "unknown", "unknown"
+
+def _on_before_call(params=None, context=None, **kwargs):
+    if _ACTIVE.get() is None or context is None or params is None:
+        return
+    context["trace_bytes_out"] = _body_size(params.get("body"))
+
+def _on_after_call(http_response=None, context=None, event_name=None, **kwargs):
+    trace = _ACTIVE.get()
+    if trace is None:
+        return
+    bytes_in = 0
+    if http_response is not None:
+        try:
+            bytes_in = int(http_response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            bytes_in = 0
+    service, operation = _call_name(event_name)
+    trace.record_call(service, operation, bytes_in, (context or {}).get("trace_bytes_out", 0))
+
+def _on_after_call_error(context=None, event_name=None, **kwargs):
+    """연결 오류 등 응답 없이 실패한 호출도 횟수에 포함"""
+    trace = _ACTIVE.get()
+    if trace is None:
+        return
+    service, operation = _call_name(event_name)
+    trace.record_call(service, operation, 0, (context or {}).get("trace_bytes_out", 0))
+
+def register_hooks(events):
+    """이벤트 시스템(세션 또는 client.meta.events)에 훅 등록"""
+    events.register("before-call", _on_before_call, unique_id="request-trace-before")
+    events.register("after-call", _on_after_call, unique_id="request-trace-after")
+    events.register("after-call-error", _on_after_call_error, unique_id="request-trace-error")
+
+def install_boto3_hooks():
+    """boto3 기본 세션에 훅 등록 (이후 생성되는 클라이언트에 적용, 여러 번 호출해도 1회)"""
+    global _HOOKS_INSTALLED
+    if _HOOKS_INSTALLED:
+        return
+    try:
+        import boto3
+        register_hooks(boto3._get_default_session().events)
+        _HOOKS_INSTALLED = True
+    except Exception as e:
+        print(f"[경고] 요청 추적 훅 등록 실패: {e}")
+
+# ===== 로컬 추적 파일 =====
+def write_trace_file(trace: Dict, trace_dir: str, extra: Dict = None):
+    """trace_dir/trace-YYYYMMDD.jsonl 에 한 줄 추가"""
+    if not trace or not trace_dir:
+        return
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+        record = dict(trace)
+        if extra:
+            record.update(extra)
+        path = os.path.join(trace_dir, f"trace-{datetime.now():%Y%m%d}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"[경고] 추적 파일 저장 실패: {e}")
@@ -0,0 +1,297 @@
+"""
+센서 검색 계획기 (retrieve_documents_from_s3 앞단)
+질의 분석 결과를 명시적인 검색 계획으로 바꾼다:
+어떤 패밀리/파티션을 읽고 무엇을 집계하는지, 예상 LIST/GET 수는 얼마인지.
+
+- 요청당 예산(LIST/GET)을 넘는 계획은 더 싼 대안으로 내림
+    극값: 원시 데이터 요약 → 분 컬럼 저장소 → 시간 평균(롤업)
+    구간: 분 컬럼 저장소 → 분 평균 → 시간 평균 → 최근 쪽으로 구간 축소
+    시점 여러 개: 예산에 맞게 앞쪽 시점만
+    일반 스캔: 남은 GET 예산만큼만 파일 스캔
+- 계획기는 I/O를 하지 않음: 인덱스/저장소 상태는 probes 콜백으로 받음 (explain이 공짜)
+
+probes (없으면 가장 비싼 경우로 가정):
+  index_warm(family) -> bool          키 인덱스 빌드 여부 (아니면 키 탐색 LIST)
+  store_has_day(date) -> bool         분 컬럼 저장소에 그날 파일이 있는지
+  extrema_cached(date) -> bool        완료된 극값 요약이 로컬에 있는지
+  rollup_cached(date) -> bool         완료된 일간 롤업이 로컬에 있는지
+  raw_objects_per_day() -> int        완료된 극값 요약에서 본 하루 원시 객체 수 (없으면 RAW_OBJECTS_PER_DAY)
+  raw_objects_folded(date) -> int     그날 극값 요약에 이미 반영된 원시 객체 수
+추정은 추정일 뿐이라 극값 원시 경로는 실행 시에도 GET 상한(extrema_max_reads)을 걸고,
+넘으면 시간 평균으로 내려감 (chatbot._extremum_from)
+"""
+
+import math
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+LIST_PAGE_KEYS = 1000
+SEEK_LISTS_PER_LOOKUP = 2          # 인덱스 없이 키 탐색 1회당 LIST (StartAfter + 폴더 단계 평균)
+INDEX_BUILD_LISTS = 20             # 인덱스 없이 구간 키 목록(페이지네이션) 추정
+RAW_OBJECTS_PER_DAY = 720          # 원시 데이터 하루 객체 수 기본 추정 (완료된 요약이 하나도 없을 때)
+SCAN_PREFIX_LISTS = 4              # 일반 스캔이 도는 prefix × 페이지 추정
+
+class PlanStep:
+    """계획의 한 단계 (실행 순서대로, 앞 단계가 답을 만들면 뒤 단계는 실행되지 않음)"""
+
+    def __init__(self, name: str, families: List[str], partitions: List[str], aggregates: List[str],
+                 est_list: int, est_get: int, note: str = ""):
+        self.name = name
+        self.families = families
+        self.partitions = partitions
+        self.aggregates = aggregates
+        self.est_list = est_list
+        self.est_get = est_get
+        self.note = note
+
+    def to_dict(self) -> Dict:
+        out = {"step": self.name, "families": self.families, "partitions": self.partitions,
+               "aggregates": self.aggregates, "est_list": self.est_list, "est_get": self.est_get}
+        if self.note:
+            out["note"] = self.note
+        return out
+
+class RetrievalPlan:
+    """검색 계획: kind + 단계 목록 + 실행 옵션 (retrieve_documents_from_s3가 options를 따름)"""
+
+    def __init__(self, kind: str, budget: Dict[str, int]):
+        self.kind = kind
+        self.budget = dict(budget)
+        self.steps: List[PlanStep] = []
+        self.options: Dict = {}
+        self.downgrades: List[str] = []   # 예산 때문에 바꾼 내역
+
+    def add(self, step: PlanStep) -> PlanStep:
+        self.steps.append(step)
+        return step
+
+    @property
+    def est_list(self) -> int:
+        return sum(s.est_list for s in self.steps)
+
+    @property
+    def est_get(self) -> int:
+        return sum(s.est_get for s in self.steps)
+
+    @property
+    def within_budget(self) -> bool:
+        return self.est_list <= self.budget["list"] and self.est_get <= self.budget["get"]
+
+    def remaining_get(self) -> int:
+        return max(0, self.budget["get"] - self.est_get)
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "steps": [s.to_dict() for s in self.steps],
+            "options": {k: (v.isoformat() if isinstance(v, (date, datetime)) else v) for k, v in self.options.items()},
+            "estimate": {"list": self.est_list, "get": self.est_get},
+            "budget": self.budget,
+            "within_budget": self.within_budget,
+            "downgrades": self.downgrades,
+        }
+
+    def describe(self) -> str:
+        """사람이 읽는 한 줄씩 요약 (explain 응답용)"""
+        lines = [f"계획: {self.kind} (예상 LIST {self.est_list} / GET {self.est_get}, "
+                 f"예산 LIST {self.budget['list']} / GET {self.budget['get']})"]
+        for i, s in enumerate(self.steps, start=1):
+            part = ", ".join(s.partitions[:3]) + (f" 외 {len(s.partitions) - 3}개" if len(s.partitions) > 3 else "")
+            lines.append(f"{i}. {s.name}: {'/'.join(s.families) or '-'} [{part}] → {', '.join(s.aggregates)} "
+                         f"(LIST {s.est_list}, GET {s.est_get}){' - ' + s.note if s.note else ''}")
+        for d in self.downgrades:
+            lines.append(f"* {d}")
+        return "\n".join(lines)
+
+def _probe(probes: Dict[str, Callable], name: str, *args) -> bool:
+    fn = probes.get(name)
+    if fn is None:
+        return False
+    try:
+        return bool(fn(*args))
+    except Exception:
+        return False
+
+def _probe_value(probes: Dict[str, Callable], name: str, *args) -> Optional[int]:
+    fn = probes.get(name)
+    if fn is None:
+        return None
+    try:
+        value = fn(*args)
+    except Exception:
+        return None
+    return int(value) if value is not None else None
+
+def _days(start: datetime, end: datetime) -> List[date]:
+    out, day = [], start.date()
+    while day <= end.date():
+        out.append(day)
+        day += timedelta(days=1)
+    return out
+
+def _list_cost(probes, family: str, n_keys: int = 0, lookups: int = 1) -> int:
+    """인덱스가 있으면 0, 없으면 키 탐색/구간 LIST 추정"""
+    if _probe(probes, "index_warm", family):
+        return 0
+    if n_keys:
+        return max(1, math.ceil(n_keys / LIST_PAGE_KEYS))
+    return SEEK_LISTS_PER_LOOKUP * lookups
+
+class RetrievalPlanner:
+    """QueryAnalysis와 비슷한 객체(속성 접근) → RetrievalPlan"""
+
+    def __init__(self, budget: Dict[str, int], probes: Dict[str, Callable] = None,
+                 minute_max_hours: int = 6, store_max_hours: int = 48, max_range_days: int = 31,
+                 scan_max_files: int = 100000, raw_objects_per_day: int = RAW_OBJECTS_PER_DAY):
+        self.budget = {"list": int(budget.get("list", 0)), "get": int(budget.get("get", 0))}
+        self.probes = probes or {}
+        self.minute_max_hours = minute_max_hours
+        self.store_max_hours = store_max_hours
+        self.max_range_days = max_range_days
+        self.scan_max_files = scan_max_files
+        self.raw_objects_per_day = raw_objects_per_day
+
+    def plan(self, analysis, day: Optional[date] = None, now: datetime = None) -> RetrievalPlan:
+        """
+        retrieve_documents_from_s3 분기 순서대로 kind 결정
+        day: 극값/일간 평균 질의의 대상 날짜 (질의 문장에서 해석, 없으면 None)
+        """
+        a = analysis
+        now = now or datetime.now()
+        if a.is_extrema:
+            return self._plan_extrema(day, now)
+        if a.is_daily_avg:
+            return self._plan_daily(day)
+        if not a.offset_value and a.range_start and a.range_end - a.range_start <= timedelta(days=self.max_range_days):
+            return self._plan_range(a.range_start, a.range_end, now)
+        if a.offset_value:
+            return self._plan_points("offset", [None], a.granularity)
+        points = list(a.datetimes) if a.datetimes else []
+        if points:
+            return self._plan_points("points", points, a.granularity)
+        return self._plan_points("recent", [now], "hour")
+
+    # ----- 극값 -----
+    def _plan_extrema(self, day: Optional[date], now: datetime) -> RetrievalPlan:
+        plan = RetrievalPlan("extrema", self.budget)
+        if day is None:
+            plan.add(PlanStep("none", [], [], [], 0, 0, "날짜를 해석하지 못함 → 데이터 없음 안내"))
+            plan.options["extrema_source"] = "raw"
+            return plan
+        day_id = f"{day:%Y%m%d}"
+        if _probe(self.probes, "extrema_cached", day):
+            raw_get = raw_list = 0
+        else:
+            elapsed = 1.0 if day < now.date() else max(0.0, min(1.0, (now - datetime(day.year, day.month, day.day)) / timedelta(days=1)))
+            per_day = _probe_value(self.probes, "raw_objects_per_day") or self.raw_objects_per_day
+            folded = _probe_value(self.probes, "raw_objects_folded", day) or 0
+            raw_get = max(0, math.ceil(per_day * elapsed) - folded)
+            raw_list = max(1, math.ceil(raw_get / LIST_PAGE_KEYS))
+        candidates = [
+            ("raw", PlanStep("daily_extrema", ["sensor/date_data"], [day_id], ["최고/최저 값", "시각(초)"],
+                             raw_list, raw_get)),
+        ]
+        if _probe(self.probes, "store_has_day", day):
+            candidates.append(("minute_store", PlanStep("minute_store_extrema", ["minute_store"], [day_id],
+                                                        ["최고/최저 값", "시각(분)"], 0, 0, "압축된 분 컬럼")))
+        rollup_get = 0 if _probe(self.probes, "rollup_cached", day) else 24
+        candidates.append(("hourly", PlanStep("hourly_rollup_extrema", ["houravg"], [day_id],
+                                              ["최고/최저 시간 평균", "시각(시)"],
+                                              _list_cost(self.probes, "houravg", n_keys=24) if rollup_get else 0,
+                                              rollup_get, "시간 평균 기준 (근사)")))
+        step = self._choose(plan, candidates, "extrema_source")
+        if plan.options["extrema_source"] == "raw" and step.est_get:
+            # 실행 시 상한: 실제 새 객체 수가 예산을 넘으면 GET 없이 시간 평균으로
+            plan.options["extrema_max_reads"] = self.budget["get"]
+            step.note = f"새 원시 객체가 {self.budget['get']}개를 넘으면 시간 평균으로"
+        return plan
+
+    # ----- 일간 평균 -----
+    def _plan_daily(self, day: Optional[date]) -> RetrievalPlan:
+        plan = RetrievalPlan("daily_avg", self.budget)
+        cached = day is not None and _probe(self.probes, "rollup_cached", day)
+        plan.add(PlanStep("daily_rollup", ["houravg"], [f"{day:%Y%m%d}"] if day else [],
+                          ["일 평균/최저/최고", "시간별 값"],
+                          0 if cached else _list_cost(self.probes, "houravg", n_keys=24),
+                          0 if cached else 24))
+        return plan
+
+    # ----- 구간 -----
+    def _plan_range(self, start: datetime, end: datetime, now: datetime) -> RetrievalPlan:
+        plan = RetrievalPlan("range", self.budget)
+        span = end - start
+        minutes = int(span // timedelta(minutes=1)) + 1
+        hours = int((end - start.replace(minute=0)) // timedelta(hours=1)) + 1
+        days = _days(start, end)
+        parts = [f"{d:%Y%m%d}" for d in days]
+        aggregates = ["평균", "최저/최고+시각", "표준편차", "커버리지"]
+
+        candidates = []
+        sealed = end.date() < now.date()
+        if span <= timedelta(hours=self.store_max_hours) and sealed and \
+                all(_probe(self.probes, "store_has_day", d) for d in days):
+            candidates.append(("store", PlanStep("minute_store_range", ["minute_store"], parts,
+                                                 aggregates + ["시간대별 평균"], 0, 0, "mmap 슬라이스")))
+        if span <= timedelta(hours=self.minute_max_hours):
+            candidates.append(("minute", PlanStep("minute_range", ["minavg", "mintrend"], parts,
+                                                  aggregates + ["시간대별 평균"],
+                                                  _list_cost(self.probes, "minavg", n_keys=minutes), minutes)))
+        candidates.append(("hour", PlanStep("hour_range", ["houravg", "hourtrend"], parts, aggregates,
+                                            _list_cost(self.probes, "houravg", n_keys=hours), hours)))
+        step = self._choose(plan, candidates, "range_resolution")
+        plan.options["range_start"] = start
+        plan.options["range_end"] = end
+
+        if not plan.within_budget and plan.options["range_resolution"] == "hour":
+            # 시간 평균으로도 넘치면 최근 쪽으로 구간을 줄임 (집계 블록에 실제 구간이 그대로 표시됨)
+            keep = max(1, min(self.budget["get"], hours))
+            clipped = end.replace(minute=0) - timedelta(hours=keep - 1)
+            plan.options["range_start"] = clipped
+            step.est_get = keep
+            step.est_list = _list_cost(self.probes, "houravg", n_keys=keep)
+            step.partitions = [f"{d:%Y%m%d}" for d in _days(clipped, end)]
+            step.note = f"예산 초과로 {clipped:%Y-%m-%d %H시}부터로 축소"
+            plan.downgrades.append(f"구간 {hours}시간 → 최근 {keep}시간")
+        return plan
+
+    # ----- 시점 조회 (+ 실패 시 일반 스캔) -----
+    def _plan_points(self, kind: str, points: List[Optional[datetime]], granularity: str) -> RetrievalPlan:
+        plan = RetrievalPlan(kind, self.budget)
+        family = "minavg" if granularity == "minute" else "houravg"
+        n = len(points)
+        per_list = _list_cost(self.probes, family)
+        max_points = n
+        if n > 1:
+            # 시점 하나 = GET 1 + (인덱스 없으면) 키 탐색 LIST
+            fit = min(self.budget["get"], self.budget["list"] // per_list if per_list else n)
+            max_points = max(1, min(n, fit))
+            if max_points < n:
+                plan.downgrades.append(f"시점 {n}개 → 앞쪽 {max_points}개")
+        parts = [f"{p:%Y%m%d%H%M}" if granularity == "minute" else f"{p:%Y%m%d%H}" for p in points[:max_points] if p]
+        plan.add(PlanStep("point_lookup", [family, "minavg" if family == "houravg" else "houravg"],
+                          parts or ["(상대 시각)"], ["가장 가까운 측정값"], per_list * max_points, max_points))
+        plan.options["max_points"] = max_points
+        plan.add(PlanStep("closest_fallback", ["houravg", "minavg"], [], ["가장 가까운 측정값"],
+                          _list_cost(self.probes, "houravg"), 1, "앞 단계가 비었을 때만"))
+        scan_limit = min(self.scan_max_files, plan.remaining_get())
+        plan.options["scan_limit"] = scan_limit
+        plan.add(PlanStep("generic_scan", ["houravg", "hourtrend"] if granularity != "minute" else ["minavg", "mintrend"],
+                          [], ["키/본문 점수 상위 문서"], SCAN_PREFIX_LISTS, scan_limit,
+                          "앞 단계가 모두 비었을 때만, 남은 GET 예산만큼"))
+        return plan
+
+    def _choose(self, plan: RetrievalPlan, candidates, option: str) -> PlanStep:
+        """선호 순서대로 예산 안에 드는 첫 후보, 없으면 가장 싼 후보"""
+        chosen = None
+        for name, step in candidates:
+            if step.est_list <= self.budget["list"] and step.est_get <= self.budget["get"]:
+                chosen = (name, step)
+                break
+        if chosen is None:
+            chosen = min(candidates, key=lambda c: (c[1].est_get, c[1].est_list))
+        first = candidates[0]
+        if chosen[0] != first[0]:
+            plan.downgrades.append(f"{first[1].name} (GET {first[1].est_get}, LIST {first[1].est_list}) 예산 초과 "
+                                   f"→ {chosen[1].name}")
+        plan.options[option] = chosen[0]
+        return plan.add(chosen[1])
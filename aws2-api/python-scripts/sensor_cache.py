@@ -0,0 +1,267 @@
+"""
+센서 집계 객체 콘텐츠 캐시 (메모리 LRU + 디스크, ETag 검증)
+minavg/houravg 등 지난 구간의 집계 파일은 한 번 쓰이면 바뀌지 않으므로
+질문마다 다시 내려받지 않고 캐시에서 읽는다.
+
+- 봉인된 구간(구간 종료 + 유예 시간이 지난 키): 만료 없음, 용량 초과 시 LRU로만 제거
+- 아직 열려 있는 현재 분/시 구간: 짧은 TTL, 만료 후엔 If-None-Match 조건부 GET으로 재검증
+- LIST 결과의 ETag를 넘기면 캐시 항목 ETag와 비교해 다르면 다시 받음
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sensor_index import HOUR_FAMILIES, parse_key_time
+
+KST = timezone(timedelta(hours=9))
+
+MINUTE_SEAL_GRACE = timedelta(minutes=2)   # 분 집계 파일이 늦게 써지는 경우 대비
+HOUR_SEAL_GRACE = timedelta(minutes=10)    # 시간 집계 파일이 늦게 써지는 경우 대비
+
+def seal_clock() -> datetime:
+    """봉인 판단용 현재 시각 (KST와 서버 로컬 시각 중 이른 쪽 → 서버 시간대가 달라도 열린 구간을 봉인하지 않음)"""
+    return min(datetime.now(KST).replace(tzinfo=None), datetime.now())
+
+class CachedObject:
+    """캐시된 객체 한 개 (디코딩된 텍스트)"""
+    __slots__ = ("key", "etag", "size", "text", "truncated", "sealed", "fetched_at")
+
+    def __init__(self, key: str, etag: str, size: int, text: str, truncated: bool, sealed: bool, fetched_at: float):
+        self.key = key
+        self.etag = etag
+        self.size = size            # 원본 객체 크기 (bytes)
+        self.text = text
+        self.truncated = truncated  # Range로 앞부분만 받은 경우
+        self.sealed = sealed
+        self.fetched_at = fetched_at
+
+    def to_dict(self) -> Dict:
+        return {"key": self.key, "etag": self.etag, "size": self.size, "text": self.text, "truncated": self.truncated}
+
+def _is_not_modified(e: Exception) -> bool:
+    code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("304", "NotModified")
+
+def _text_bytes(text: str) -> int:
+    """메모리 용량 계산용 UTF-8 바이트 수 (한글 등 비ASCII 문자는 글자 수보다 큼)"""
+    return len(text.encode("utf-8"))
+
+def _is_invalid_range(e: Exception) -> bool:
+    code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("416", "InvalidRange")
+
+class SensorObjectCache:
+    """센서 버킷 객체 2단 캐시 (스레드 안전)"""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = "", cache_dir: str = None,
+                 max_memory_bytes: int = 64 * 1024 * 1024, max_disk_bytes: int = 512 * 1024 * 1024,
+                 open_ttl: float = 30.0):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.open_ttl = open_ttl
+        self._memory: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # 최초 디스크 쓰기 때 계산
+        self._lock = threading.RLock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "revalidated": 0, "misses": 0}
+
+    # ----- 봉인 판단 -----
+    def is_sealed(self, key: str, now: datetime = None) -> bool:
+        """키의 집계 구간이 끝나고 유예 시간까지 지났으면 True (KST naive 기준)"""
+        rel = key[len(self.prefix):] if self.prefix and key.startswith(self.prefix) else key
+        family = rel.split("/", 1)[0]
+        key_time = parse_key_time(key, family)
+        if key_time is None:
+            return False
+        now = now or seal_clock()
+        if family in HOUR_FAMILIES:
+            return now >= key_time + timedelta(hours=1) + HOUR_SEAL_GRACE
+        return now >= key_time + timedelta(minutes=1) + MINUTE_SEAL_GRACE
+
+    # ----- 조회 -----
+    def fetch(self, key: str, etag: str = None, max_bytes: int = None) -> CachedObject:
+        """
+        캐시 우선으로 객체를 읽어 CachedObject 반환
+        S3 오류(NoSuchKey 등)는 호출부의 기존 예외 처리가 그대로 동작하도록 다시 던진다.
+        """
+        # 락은 메모리 LRU/통계/디스크 기록에만 잡는다 (파일 읽기와 조건부 GET 중에는 다른 스레드가 캐시를 계속 씀)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        source = "memory_hits"
+        if entry is None and self.cache_dir:
+            entry = self._load_disk(key)
+            source = "disk_hits"
+            if entry is not None:
+                with self._lock:
+                    self._remember(entry)
+
+        if entry is not None and self._usable(entry, etag, max_bytes):
+            if not entry.sealed and time.time() - entry.fetched_at >= self.open_ttl:
+                return self._revalidate(entry, max_bytes)
+            with self._lock:
+                self.stats[source] += 1
+            return entry
+
+        with self._lock:
+            self.stats["misses"] += 1
+        entry = self._download(key, max_bytes)
+        with self._lock:
+            self._remember(entry)
+            if entry.sealed:
+                self._save_disk(entry)
+        return entry
+
+    def get_text(self, key: str, etag: str = None, max_bytes: int = None) -> str:
+        return self.fetch(key, etag=etag, max_bytes=max_bytes).text
+
+    def get_json(self, key: str, etag: str = None):
+        return json.loads(self.get_text(key, etag=etag))
+
+    def _usable(self, entry: CachedObject, etag: str, max_bytes: int) -> bool:
+        if etag and entry.etag and etag != entry.etag:
+            return False
+        # 잘린 항목은 같은 길이 이하 요청에만 사용
+        if entry.truncated and (max_bytes is None or max_bytes > _text_bytes(entry.text)):
+            return False
+        return True
+
+    def _download(self, key: str, max_bytes: int = None, if_none_match: str = None) -> CachedObject:
+        kwargs = {"Bucket": self.bucket, "Key": key}
+        if if_none_match:
+            kwargs["IfNoneMatch"] = if_none_match
+        resp = None
+        if max_bytes:
+            try:
+                resp = self.s3.get_object(Range=f"bytes=0-{max_bytes - 1}", **kwargs)
+            except Exception as e:
+                # 빈 객체는 Range 요청이 416 → 일반 GET으로 재시도
+                if not _is_invalid_range(e):
+                    raise
+        if resp is None:
+            resp = self.s3.get_object(**kwargs)
+
+        data = resp["Body"].read()
+        size = resp.get("ContentLength", len(data))
+        content_range = resp.get("ContentRange")
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[-1]
+            if total.isdigit():
+                size = int(total)
+        return CachedObject(
+            key=key,
+            etag=resp.get("ETag"),
+            size=size,
+            text=data.decode("utf-8", errors="ignore"),
+            truncated=len(data) < size,
+            sealed=self.is_sealed(key),
+            fetched_at=time.time(),
+        )
+
+    def _revalidate(self, entry: CachedObject, max_bytes: int) -> CachedObject:
+        """열린 구간 항목 TTL 만료 → 조건부 GET (변경 없으면 본문 없이 304)"""
+        try:
+            fresh = self._download(entry.key, max_bytes, if_none_match=entry.etag)
+        except Exception as e:
+            if not _is_not_modified(e):
+                raise
+            entry.fetched_at = time.time()
+            entry.sealed = self.is_sealed(entry.key)
+            with self._lock:
+                self.stats["revalidated"] += 1
+                if entry.sealed:
+                    self._save_disk(entry)
+            return entry
+        with self._lock:
+            self._remember(fresh)
+            if fresh.sealed:
+                self._save_disk(fresh)
+        return fresh
+
+    # ----- 메모리 LRU -----
+    def _remember(self, entry: CachedObject):
+        """호출부가 self._lock을 잡은 상태에서 호출 (용량은 UTF-8 인코딩 바이트 기준)"""
+        old = self._memory.pop(entry.key, None)
+        if old is not None:
+            self._memory_bytes -= _text_bytes(old.text)
+        self._memory[entry.key] = entry
+        self._memory_bytes += _text_bytes(entry.text)
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= _text_bytes(evicted.text)
+
+    # ----- 디스크 -----
+    def _disk_path(self, key: str) -> str:
+        digest = hashlib.sha1(f"{self.bucket}/{key}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def _load_disk(self, key: str) -> Optional[CachedObject]:
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            if d.get("key") != key:
+                return None
+            os.utime(path)  # 디스크 LRU용 접근 시각 갱신
+            return CachedObject(d["key"], d.get("etag"), d.get("size", 0), d["text"], d.get("truncated", False), True, time.time())
+        except Exception as e:
+            print(f"[경고] 센서 캐시 파일 읽기 실패: {e}")
+            return None
+
+    def _save_disk(self, entry: CachedObject):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(entry.key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"  # 프로세스마다 다른 임시 파일 (같은 프로세스 안에서는 self._lock으로 직렬화)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+        except Exception as e:
+            print(f"[경고] 센서 캐시 파일 저장 실패: {e}")
+
+    def _scan_disk(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        """오래 안 쓴 파일부터 지워 최대 용량의 90%까지 줄임"""
+        files = sorted(self._scan_disk(), key=lambda x: x[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
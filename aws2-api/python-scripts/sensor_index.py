@@ -0,0 +1,236 @@
+"""
+센서 버킷 시간 파티션 키 인덱스
+minavg/mintrend/houravg/hourtrend 키를 패밀리별로 시간순 정렬해 메모리에 보관하고,
+가장 가까운 시각 조회를 S3 왕복 없이 bisect로 처리한다.
+
+- 최초 1회: 패밀리 prefix 전체를 페이지네이션으로 LIST (로컬 스냅샷이 있으면 스냅샷 로드)
+- 이후: 마지막으로 본 키 뒤(StartAfter)만 LIST 해서 증분 갱신
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+INDEX_FAMILIES = ("minavg", "mintrend", "houravg", "hourtrend")
+HOUR_FAMILIES = ("houravg", "hourtrend")
+
+# 파일명 앞부분 타임스탬프: YYYYMMDDHHMM(분) 또는 YYYYMMDDHH(시간)
+_STAMP_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})?(?!\d)")
+
+def parse_key_time(key: str, family: str = None) -> Optional[datetime]:
+    """키 파일명에서 시각 추출 (시간 패밀리는 정시로 내림)"""
+    filename = key.rsplit("/", 1)[-1]
+    if not filename.lower().endswith(".json"):
+        return None
+    m = _STAMP_RE.match(filename)
+    if not m:
+        return None
+    y, mo, d, hh, mm = m.groups()
+    try:
+        dt = datetime(int(y), int(mo), int(d), int(hh), int(mm) if mm else 0)
+    except ValueError:
+        return None
+    if family in HOUR_FAMILIES:
+        dt = dt.replace(minute=0)
+    return dt
+
+class FamilyIndex:
+    """한 데이터 패밀리의 (시각, 키) 정렬 목록"""
+
+    def __init__(self, family: str):
+        self.family = family
+        self.times: List[datetime] = []
+        self.keys: List[str] = []
+        self.last_key: Optional[str] = None  # 증분 갱신용 StartAfter
+        self.built = False
+        self.refreshed_at = 0.0
+
+    def add(self, key: str) -> bool:
+        dt = parse_key_time(key, self.family)
+        if self.last_key is None or key > self.last_key:
+            self.last_key = key
+        if dt is None:
+            return False
+        i = bisect.bisect_right(self.times, dt)
+        # 같은 시각 키는 하나만 유지 (먼저 본 키 우선)
+        if i > 0 and self.times[i - 1] == dt:
+            return False
+        self.times.insert(i, dt)
+        self.keys.insert(i, key)
+        return True
+
+    def __len__(self):
+        return len(self.times)
+
+    def get(self, dt: datetime) -> Optional[str]:
+        """정확히 해당 시각의 키"""
+        i = bisect.bisect_left(self.times, dt)
+        if i < len(self.times) and self.times[i] == dt:
+            return self.keys[i]
+        return None
+
+    def floor(self, dt: datetime) -> Optional[Tuple[datetime, str]]:
+        """dt 이하에서 가장 늦은 항목"""
+        i = bisect.bisect_right(self.times, dt)
+        if i == 0:
+            return None
+        return self.times[i - 1], self.keys[i - 1]
+
+    def ceil(self, dt: datetime) -> Optional[Tuple[datetime, str]]:
+        """dt 이상에서 가장 이른 항목"""
+        i = bisect.bisect_left(self.times, dt)
+        if i >= len(self.times):
+            return None
+        return self.times[i], self.keys[i]
+
+    def nearest(self, dt: datetime, max_distance: timedelta = None) -> Optional[Tuple[datetime, str]]:
+        best = None
+        for hit in (self.floor(dt), self.ceil(dt)):
+            if not hit:
+                continue
+            if best is None or abs(hit[0] - dt) < abs(best[0] - dt):
+                best = hit
+        if best and max_distance is not None and abs(best[0] - dt) > max_distance:
+            return None
+        return best
+
+    def between(self, start: datetime, end: datetime) -> List[Tuple[datetime, str]]:
+        """[start, end] 구간의 항목들 (시간순)"""
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        return list(zip(self.times[lo:hi], self.keys[lo:hi]))
+
+    def latest(self) -> Optional[Tuple[datetime, str]]:
+        if not self.times:
+            return None
+        return self.times[-1], self.keys[-1]
+
+class SensorKeyIndex:
+    """패밀리별 키 인덱스 묶음 (스레드 안전)"""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = "", families=INDEX_FAMILIES,
+                 snapshot_path: str = None, refresh_interval: float = 60.0):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.families: Dict[str, FamilyIndex] = {f: FamilyIndex(f) for f in families}
+        self._lock = threading.RLock()
+        self._snapshot_loaded = False
+
+    # ----- 빌드/갱신 -----
+    def _list_family(self, fam: FamilyIndex) -> int:
+        """fam.last_key 이후 키를 모두 LIST 해서 추가, 추가된 개수 반환"""
+        added = 0
+        kwargs = {"Bucket": self.bucket, "Prefix": f"{self.prefix}{fam.family}/"}
+        if fam.last_key:
+            kwargs["StartAfter"] = fam.last_key
+        while True:
+            resp = self.s3.list_objects_v2(**kwargs)
+            for obj in resp.get("Contents", []):
+                if fam.add(obj["Key"]):
+                    added += 1
+            if not resp.get("IsTruncated"):
+                break
+            kwargs.pop("StartAfter", None)
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+        fam.built = True
+        fam.refreshed_at = time.time()
+        return added
+
+    def refresh(self, family: str = None, force: bool = False) -> int:
+        """인덱스 갱신 (최초엔 전체 LIST, 이후엔 마지막 키 뒤만 LIST)"""
+        with self._lock:
+            self._load_snapshot()
+            targets = [self.families[family]] if family else list(self.families.values())
+            added = 0
+            now = time.time()
+            for fam in targets:
+                if force or not fam.built or now - fam.refreshed_at >= self.refresh_interval:
+                    added += self._list_family(fam)
+            if added:
+                self._save_snapshot()
+            return added
+
+    def family(self, family: str) -> FamilyIndex:
+        """갱신 주기가 지났으면 증분 갱신 후 패밀리 인덱스 반환"""
+        family = family.strip("/")
+        self.refresh(family)
+        return self.families[family]
+
+    def is_warm(self, family: str) -> bool:
+        """
+        LIST 전체 빌드 없이 바로 조회 가능한지 (이미 빌드했거나 로컬 스냅샷이 있음)
+        다른 스레드가 빌드 중이면 기다리지 않고 False
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._load_snapshot()
+            return self.families[family.strip("/")].built
+        finally:
+            self._lock.release()
+
+    # ----- 조회 -----
+    def get(self, family: str, dt: datetime) -> Optional[str]:
+        return self.family(family).get(dt)
+
+    def nearest(self, family: str, dt: datetime, max_distance: timedelta = None) -> Optional[Tuple[datetime, str]]:
+        return self.family(family).nearest(dt, max_distance)
+
+    def neighbors(self, family: str, dt: datetime) -> Tuple[Optional[Tuple[datetime, str]], Optional[Tuple[datetime, str]]]:
+        fam = self.family(family)
+        return fam.floor(dt), fam.ceil(dt)
+
+    def between(self, family: str, start: datetime, end: datetime) -> List[Tuple[datetime, str]]:
+        return self.family(family).between(start, end)
+
+    def latest(self, family: str) -> Optional[Tuple[datetime, str]]:
+        return self.family(family).latest()
+
+    # ----- 로컬 스냅샷 -----
+    def _load_snapshot(self):
+        if self._snapshot_loaded:
+            return
+        self._snapshot_loaded = True
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            if snap.get("bucket") != self.bucket or snap.get("prefix") != self.prefix:
+                return
+            for name, keys in snap.get("families", {}).items():
+                fam = self.families.get(name)
+                if fam is None:
+                    continue
+                for k in keys:
+                    fam.add(k)
+                # 스냅샷은 증분 LIST의 출발점일 뿐, 갱신 시각은 0으로 두어 바로 증분 갱신되게 함
+                fam.built = True
+        except Exception as e:
+            print(f"[경고] 키 인덱스 스냅샷 로드 실패: {e}")
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            snap = {
+                "bucket": self.bucket,
+                "prefix": self.prefix,
+                "saved_at": datetime.now().isoformat(),
+                "families": {name: fam.keys for name, fam in self.families.items() if fam.built},
+            }
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snap, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"[경고] 키 인덱스 스냅샷 저장 실패: {e}")
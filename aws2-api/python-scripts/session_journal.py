@@ -0,0 +1,187 @@
+"""
+세션 저널 (턴마다 작은 레코드 추가 + 주기적 스냅샷)
+
+  스냅샷: chatlogs/<session_id>.json                    (기존 세션 파일 형식 + "journal_seq")
+  저널:   chatlog_journal/<session_id>/<seq:08d>.json   (이번 턴 대화 1개 + 현재 컨텍스트 상태)
+
+- 저장: 턴마다 PUT 1번 (평소엔 작은 레코드, 정리 차례면 레코드 대신 이번 턴까지 담은 스냅샷)
+  정리 차례 = 마지막 스냅샷 이후 레코드가 compact_every개 쌓였거나 아직 스냅샷이 없는 새 세션
+  (새 세션은 첫 턴에 스냅샷을 써서 NestJS 세션 목록(chatlogs/ LIST)에 바로 나타나게 함)
+- 정리 때는 스냅샷 PUT 뒤에 접힌 레코드 삭제 (writer(WriteBehindQueue 등)가 있으면 그쪽에 맡겨
+  응답 경로 밖에서 순서대로 전송, 스냅샷이 실패하면 그 뒤 삭제는 보내지 않음)
+- 스냅샷 PUT이 실패하면 같은 내용을 레코드로 남겨 로드 시 꼬리로 복구
+- 로드: 스냅샷 GET + journal_seq 이후 레코드 LIST(StartAfter) → 순서대로 적용
+  (NestJS chatbot.service.ts getChatbotHistory도 같은 방식으로 꼬리를 합쳐 읽음)
+"""
+
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+_STATE_KEYS = ("last_sensor_ctx", "followup_timestamp", "followup_context")
+
+class SessionJournal:
+    def __init__(self, s3_client, bucket: str, snapshot_prefix: str = "chatlogs/",
+                 journal_prefix: str = "chatlog_journal/", compact_every: int = 20, max_history: int = 50,
+                 writer=None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.snapshot_prefix = snapshot_prefix
+        self.journal_prefix = journal_prefix
+        self.compact_every = compact_every
+        self.max_history = max_history
+        self.writer = writer
+        self._cursors: Dict[str, Dict[str, int]] = {}  # session_id → {"seq", "snapshot_seq"(=마지막 정리 지점)}
+        self._lock = threading.Lock()
+
+    # ----- 키 -----
+    def snapshot_key(self, session_id: str) -> str:
+        return f"{self.snapshot_prefix}{session_id}.json"
+
+    def record_prefix(self, session_id: str) -> str:
+        return f"{self.journal_prefix}{session_id}/"
+
+    def record_key(self, session_id: str, seq: int) -> str:
+        return f"{self.record_prefix(session_id)}{seq:08d}.json"
+
+    # ----- 로드 -----
+    def load(self, session_id: str) -> Optional[Dict]:
+        """
+        스냅샷 + 꼬리 레코드를 합친 세션 상태 (없으면 None)
+        {"session_id", "turn_id", "history", "last_sensor_ctx", "followup_timestamp", "followup_context"}
+        """
+        state = self._get_json(self.snapshot_key(session_id))
+        snapshot_seq = int(state.get("journal_seq", 0)) if state else 0
+        seq = snapshot_seq
+        if state is None:
+            state = {"session_id": session_id, "turn_id": 0, "history": [],
+                     "last_sensor_ctx": {}, "followup_timestamp": None, "followup_context": {}}
+            found = False
+        else:
+            found = True
+
+        for key in self._list_tail(session_id, snapshot_seq):
+            try:
+                rec_seq = int(key.rsplit("/", 1)[-1][:-5])
+            except ValueError:
+                continue
+            if rec_seq <= seq:
+                continue
+            record = self._get_json(key)
+            if record is None:
+                continue
+            self._apply(state, record)
+            seq = rec_seq
+            found = True
+
+        with self._lock:
+            self._cursors[session_id] = {"seq": seq, "snapshot_seq": snapshot_seq}
+        return state if found else None
+
+    def _apply(self, state: Dict, record: Dict):
+        turn = record.get("turn")
+        if turn:
+            state["history"].append(turn)
+            if len(state["history"]) > self.max_history:
+                state["history"] = state["history"][-self.max_history:]
+        state["turn_id"] = record.get("turn_id", state.get("turn_id", 0))
+        for k in _STATE_KEYS:
+            if k in record:
+                state[k] = record[k]
+
+    # ----- 저장 -----
+    def append(self, session_id: str, state: Dict, turn: Dict = None) -> bool:
+        """
+        턴 1개 기록 (turn이 없으면 컨텍스트 상태만), 정리 차례면 레코드 대신 스냅샷을 씀
+        state: 현재 세션 전체 상태 (스냅샷으로 사용, 레코드에는 컨텍스트 필드만 들어감)
+        """
+        with self._lock:
+            cursor = self._cursors.setdefault(session_id, {"seq": 0, "snapshot_seq": 0})
+            cursor["seq"] += 1
+            seq = cursor["seq"]
+            # snapshot_seq == 0: 이 세션의 스냅샷이 아직 없음 (새 세션 또는 journal_seq 없는 예전 파일)
+            due = cursor["snapshot_seq"] == 0 or seq - cursor["snapshot_seq"] >= self.compact_every
+
+        if due and self.compact(session_id, state):
+            return True
+
+        record = {"seq": seq, "turn_id": state.get("turn_id", 0), "turn": turn,
+                  "saved_at": datetime.now().isoformat(timespec="seconds")}
+        for k in _STATE_KEYS:
+            record[k] = state.get(k)
+        try:
+            self._put_json(self.record_key(session_id, seq), record)
+        except Exception as e:
+            print(f"[오류] 세션 저널 기록 실패: {e}")
+            return False
+        return True
+
+    def compact(self, session_id: str, state: Dict) -> bool:
+        """
+        현재 상태(마지막 seq까지 반영)를 스냅샷으로 쓰고 스냅샷에 접힌 레코드 삭제
+        (writer 사용 시 삭제는 스냅샷 PUT 뒤에 큐에 들어가므로 스냅샷이 실패하면 실행되지 않음)
+        """
+        with self._lock:
+            cursor = self._cursors.setdefault(session_id, {"seq": 0, "snapshot_seq": 0})
+            seq, old_snapshot_seq = cursor["seq"], cursor["snapshot_seq"]
+        snapshot = {
+            "session_id": session_id,
+            "turn_id": state.get("turn_id", 0),
+            "history": (state.get("history") or [])[-self.max_history:],
+            **{k: state.get(k) for k in _STATE_KEYS},
+            "journal_seq": seq,
+            "last_saved": datetime.now().isoformat(),
+        }
+        try:
+            self._put_json(self.snapshot_key(session_id), snapshot, indent=2)
+        except Exception as e:
+            print(f"[오류] 세션 스냅샷 저장 실패: {e}")
+            return False
+        with self._lock:
+            cursor["snapshot_seq"] = max(cursor["snapshot_seq"], seq)
+        if seq > old_snapshot_seq + 1:
+            # 마지막 seq는 스냅샷으로만 썼으므로 그 앞 레코드만 삭제
+            self._delete_records(session_id, range(old_snapshot_seq + 1, seq))
+        return True
+
+    # ----- S3 -----
+    def _get_json(self, key: str) -> Optional[Dict]:
+        try:
+            resp = self.s3.get_object(Bucket=self.bucket, Key=key)
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return json.loads(resp["Body"].read().decode("utf-8"))
+
+    def _put_json(self, key: str, data: Dict, indent: int = None):
+        body = json.dumps(data, ensure_ascii=False, indent=indent, default=str).encode("utf-8")
+        if self.writer is not None:
+            self.writer.put(self.bucket, key, body, "application/json")
+            return
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/json")
+
+    def _list_tail(self, session_id: str, after_seq: int) -> List[str]:
+        keys = []
+        kwargs = {"Bucket": self.bucket, "Prefix": self.record_prefix(session_id)}
+        if after_seq:
+            kwargs["StartAfter"] = self.record_key(session_id, after_seq)
+        while True:
+            resp = self.s3.list_objects_v2(**kwargs)
+            keys.extend(obj["Key"] for obj in resp.get("Contents", []) if obj["Key"].endswith(".json"))
+            if not resp.get("IsTruncated"):
+                return keys
+            kwargs.pop("StartAfter", None)
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+
+    def _delete_records(self, session_id: str, seqs):
+        if self.writer is not None:
+            self.writer.delete(self.bucket, [self.record_key(session_id, s) for s in seqs])
+            return
+        keys = [{"Key": self.record_key(session_id, s)} for s in seqs]
+        for i in range(0, len(keys), 1000):
+            try:
+                self.s3.delete_objects(Bucket=self.bucket, Delete={"Objects": keys[i:i + 1000], "Quiet": True})
+            except Exception as e:
+                # 남은 레코드는 journal_seq 이하라 로드 시 건너뜀
+                print(f"[경고] 세션 저널 정리 실패: {e}")
+                return
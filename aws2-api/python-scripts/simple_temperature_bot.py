@@ -1,16 +1,17 @@
 import json
 import re
-import boto3
 from datetime import datetime
 from typing import Dict, Optional
 
-# AWS 설정
-s3_data = boto3.client('s3')
-bedrock = boto3.client('bedrock-runtime', region_name='ap-northeast-2')
+from latest_reading import find_latest_minavg_reading
+from aws_clients import lazy_client
+
+# AWS 설정 (공용 레지스트리 클라이언트, 첫 호출 때 생성)
+s3_data = lazy_client('s3')
+bedrock = lazy_client('bedrock-runtime', 'ap-northeast-2')
 
 S3_BUCKET_DATA = "aws2-airwatch-data"
 S3_PREFIX = "minavg/"  # minavg 폴더에서만 검색
-MAX_FILES_TO_SCAN = 50  # 적절한 파일 수
 INFERENCE_PROFILE_ARN = "arn:aws:bedrock:ap-northeast-2:070561229682:inference-profile/apac.anthropic.claude-sonnet-4-20250514-v1:0"
 
 def extract_external_conditions(query: str) -> dict:
@@ -44,208 +45,16 @@ def extract_external_conditions(query: str) -> dict:
     return external_data
 
 def find_current_indoor_temperature() -> Optional[Dict]:
-    """S3_BUCKET_DATA에서 현재 시간 기준 가장 가까운 센서 데이터를 찾는 함수"""
+    """S3_BUCKET_DATA에서 현재 시간 기준 가장 가까운 센서 데이터를 찾는 함수 (LIST 최대 6번 + GET 1번)"""
     try:
-        current_time = datetime.now()
-        #print(f"[DEBUG] 현재 시간: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # 빠른 방법: 현재 시간부터 역추적해서 첫 번째 존재하는 파일 찾기
-        from datetime import timedelta
-        
-        #print(f"[DEBUG] 현재 시간부터 역추적해서 가장 가까운 파일 검색 중...")
-        
-        
-        # 1차: 현재 시간부터 50분 전까지 빠르게 확인
-        for minutes_back in range(0, 50):
-            target_time = current_time - timedelta(minutes=minutes_back)
-            file_path = f"minavg/{target_time.year:04d}/{target_time.month:02d}/{target_time.day:02d}/{target_time.hour:02d}/{target_time.year:04d}{target_time.month:02d}{target_time.day:02d}{target_time.hour:02d}{target_time.minute:02d}_minavg.json"
-            
-            try:
-                # HEAD 요청으로 파일 존재 여부만 빠르게 확인
-                s3_data.head_object(Bucket=S3_BUCKET_DATA, Key=file_path)
-                
-                # 파일이 존재하면 내용 가져오기
-                file_response = s3_data.get_object(Bucket=S3_BUCKET_DATA, Key=file_path)
-                file_content = file_response['Body'].read().decode('utf-8')
-                #print(f"[DEBUG] 가까운 파일 발견: {file_path} (현재시간 -{minutes_back}분)")
-                
-                # 파일에서 최신 데이터 추출
-                for line in reversed(file_content.strip().split('\n')):
-                    if not line.strip():
-                        continue
-                    try:
-                        data = json.loads(line)
-                        if 'timestamp' in data and 'mintemp' in data and data['mintemp'] is not None:
-                            timestamp_str = data['timestamp']
-                            temperature = float(data['mintemp'])
-                            
-                            #print(f"[DEBUG] 1차 검색 성공: {timestamp_str}, 온도: {temperature}도")
-                            
-                            return {
-                                'timestamp': timestamp_str,
-                                'temperature': temperature,
-                                'humidity': data.get('minhum'),
-                                'gas': data.get('mingas'),
-                                'source': f'1차검색 {file_path}',
-                                'time_diff_minutes': minutes_back
-                            }
-                    except json.JSONDecodeError:
-                        continue
-                        
-            except:
-                continue  # 파일이 없으면 다음 분 시도
-        
-        #print("[DEBUG] 1차 검색 실패. 2차: 날짜별로 최신 데이터 검색...")
-        
-        # 2차: 계층적 검색 (날짜→시간→분 순서로 역추적)
-        for days_back in range(0, 10):  # 최대 10일 전까지
-            check_date = current_time - timedelta(days=days_back)
-            #print(f"[DEBUG] {check_date.strftime('%Y-%m-%d')} 날짜에서 계층적 검색 시작")
-            
-            # 해당 날짜에 데이터가 있는지 확인
-            date_prefix = f"{S3_PREFIX}{check_date.year:04d}/{check_date.month:02d}/{check_date.day:02d}/"
-            try:
-                response = s3_data.list_objects_v2(
-                    Bucket=S3_BUCKET_DATA,
-                    Prefix=date_prefix,
-                    MaxKeys=1
-                )
-                if 'Contents' not in response:
-                    #print(f"[DEBUG] {check_date.strftime('%Y-%m-%d')} 날짜에 파일 없음 - 다음 날짜로")
-                    continue
-                    
-                #print(f"[DEBUG] {check_date.strftime('%Y-%m-%d')} 날짜에 데이터 존재 - 시간별 검색 시작")
-                
-                # 시간별로 23시부터 0시까지 역순 검색
-                for hour in range(23, -1, -1):
-                    hour_prefix = f"{date_prefix}{hour:02d}/"
-                    
-                    try:
-                        hour_response = s3_data.list_objects_v2(
-                            Bucket=S3_BUCKET_DATA,
-                            Prefix=hour_prefix,
-                            MaxKeys=1
-                        )
-                        if 'Contents' not in hour_response:
-                            continue  # 해당 시간에 데이터 없음
-                            
-                        #print(f"[DEBUG] {check_date.strftime('%Y-%m-%d')} {hour:02d}시에 데이터 존재 - 분별 검색 시작")
-                        
-                        # 분별로 59분부터 0분까지 역순 검색
-                        for minute in range(59, -1, -1):
-                            file_key = f"minavg/{check_date.year:04d}/{check_date.month:02d}/{check_date.day:02d}/{hour:02d}/{check_date.year:04d}{check_date.month:02d}{check_date.day:02d}{hour:02d}{minute:02d}_minavg.json"
-                            
-                            try:
-                                # HEAD로 파일 존재 확인
-                                s3_data.head_object(Bucket=S3_BUCKET_DATA, Key=file_key)
-                                
-                                # 파일이 존재하면 내용 가져오기
-                                file_response = s3_data.get_object(Bucket=S3_BUCKET_DATA, Key=file_key)
-                                file_content = file_response['Body'].read().decode('utf-8')
-                                
-                                #print(f"[DEBUG] 파일 발견: {file_key}")
-                                
-                                # 파일에서 가장 최신 데이터 추출 (역순)
-                                for line in reversed(file_content.strip().split('\n')):
-                                    if not line.strip():
-                                        continue
-                                    try:
-                                        data = json.loads(line)
-                                        if 'timestamp' in data and 'mintemp' in data and data['mintemp'] is not None:
-                                            timestamp_str = data['timestamp']
-                                            temperature = float(data['mintemp'])
-                                            data_time = datetime.fromisoformat(timestamp_str)
-                                            time_diff = abs((data_time - current_time).total_seconds())
-                                            
-                                            #print(f"[DEBUG] 계층적 검색 성공: {timestamp_str}, 온도: {temperature}도, 시간차: {int(time_diff/60)}분")
-                                            
-                                            return {
-                                                'timestamp': timestamp_str,
-                                                'temperature': temperature,
-                                                'humidity': data.get('minhum'),
-                                                'gas': data.get('mingas'),
-                                                'source': f'계층적검색 {file_key}',
-                                                'time_diff_minutes': int(time_diff / 60)
-                                            }
-                                    except (json.JSONDecodeError, ValueError):
-                                        continue
-                                        
-                            except:
-                                continue  # 파일이 없으면 다음 분으로
-                                
-                    except Exception:
-                        continue  # 해당 시간에 문제가 있으면 다음 시간으로
-                        
-            except Exception as e:
-                #print(f"[DEBUG] {check_date.strftime('%Y-%m-%d')} 날짜 검색 실패: {e}")
-                continue
-        
-        #print("[DEBUG] 2차 날짜별 검색 실패. 3차: S3 최신 파일에서 검색...")
-        
-        # 3차: 기본 방식 폴백
-        response = s3_data.list_objects_v2(
-            Bucket=S3_BUCKET_DATA,
-            Prefix=S3_PREFIX,
-            MaxKeys=MAX_FILES_TO_SCAN
-        )
-        
-        if 'Contents' not in response:
-            #print("[DEBUG] S3에서 파일을 찾을 수 없습니다.")
-            return None
-        
-        # LastModified 최신 파일부터 확인 (간단하게)
-        files = sorted(response['Contents'], key=lambda x: x['LastModified'], reverse=True)
-        #print(f"[DEBUG] 3차 검색: S3에서 가장 최근에 저장된 파일 가져오기...")
-        
-        # 실제 최신 파일들의 정보 출력
-        #print("[DEBUG] 실제 S3 최신 파일들:")
-        #for i, file in enumerate(files[:10]):
-        #   print(f"[DEBUG] {i+1}. {file['Key']} - LastModified: {file['LastModified']}")
-        
-        for obj in files[:5]:  # 최신 5개 파일만 확인
-            try:
-                file_response = s3_data.get_object(Bucket=S3_BUCKET_DATA, Key=obj['Key'])
-                content = file_response['Body'].read().decode('utf-8')
-                
-                #print(f"[DEBUG] 3차 검색에서 파일 확인 중: {obj['Key']}")
-                
-                # 파일에서 가장 최신 데이터만 추출 (역순으로)
-                lines = content.strip().split('\n')
-                for line in reversed(lines):  # 최신 데이터부터 확인
-                    if not line.strip():
-                        continue
-                        
-                    try:
-                        data = json.loads(line)
-                        
-                        if 'timestamp' in data and 'mintemp' in data and data['mintemp'] is not None:
-                            timestamp_str = data['timestamp']
-                            temperature = float(data['mintemp'])
-                            
-                            # 시간 차이 계산
-                            data_time = datetime.fromisoformat(timestamp_str)
-                            time_diff = abs((data_time - current_time).total_seconds())
-                            
-                            #print(f"[DEBUG] 3차 검색 성공: {timestamp_str}, 온도: {temperature}도, 시간차: {int(time_diff/60)}분")
-                            
-                            return {
-                                'timestamp': timestamp_str,
-                                'temperature': temperature,
-                                'humidity': data.get('minhum'),
-                                'gas': data.get('mingas'),
-                                'source': f'3차검색 {obj["Key"]}',
-                                'time_diff_minutes': int(time_diff / 60)
-                            }
-                            
-                    except json.JSONDecodeError:
-                        continue
-                        
-            except Exception:
-                continue
-        
+        result = find_latest_minavg_reading(s3_data, S3_BUCKET_DATA, prefix=S3_PREFIX)
+        if result:
+            #print(f"[DEBUG] 최신 데이터 발견: {result['source']} (S3 요청 {result['s3_requests']}회)")
+            return result
+
         print("적합한 온도 데이터를 찾지 못했습니다.")
         return None
-        
+
     except Exception as e:
         print(f"Error finding current temperature: {e}")
         return None
@@ -0,0 +1,104 @@
+"""
+JSON Lines 센서 파일 꼬리 읽기 (Range GET)
+minavg 파일에 레코드가 한 줄씩 덧붙는 경우 필요한 건 마지막 유효 레코드 하나뿐이라
+파일 전체를 받아 줄을 전부 나누는 대신 끝 N KB만 받아 뒤에서부터 완전한 줄을 확인한다.
+
+- 첫 요청: Range: bytes=-N (끝에서 N바이트, Content-Range로 전체 크기 확인)
+- 유효 레코드가 없으면 범위를 growth배로 넓혀 앞쪽 부족분만 추가로 받음 (이미 받은 바이트는 재요청 안 함)
+- 파일 처음까지 받았는데도 줄 단위 레코드가 없으면 여러 줄로 포맷된 단일 JSON으로 한 번 더 해석
+"""
+
+import json
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_TAIL_BYTES = 4 * 1024
+MAX_TAIL_BYTES = 1024 * 1024
+GROWTH = 4
+
+def _has_timestamp(record: Dict) -> bool:
+    return "timestamp" in record
+
+def last_json_record(text, accept: Callable[[Dict], bool] = None, complete_head: bool = True) -> Optional[Dict]:
+    """
+    텍스트(str/bytes)에서 accept를 만족하는 마지막 JSON 객체 줄
+    complete_head=False면 첫 줄은 잘린 줄로 보고 건너뜀 (꼬리 조각)
+    """
+    if isinstance(text, bytes):
+        # 줄바꿈 바이트는 UTF-8 멀티바이트 문자 안에 나오지 않으므로 바이트 단위로 잘라도 안전
+        newline, decode = b"\n", (lambda b: b.decode("utf-8", errors="ignore"))
+    else:
+        newline, decode = "\n", (lambda s: s)
+    lo = 0
+    if not complete_head:
+        first = text.find(newline)
+        if first == -1:
+            return None
+        lo = first + 1
+    end = len(text)
+    while end > lo:
+        cut = text.rfind(newline, lo, end)
+        line = decode(text[cut + 1 if cut != -1 else lo:end]).strip()
+        end = cut if cut != -1 else lo
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(record, dict) and (accept is None or accept(record)):
+            return record
+    return None
+
+def _total_size(resp: Dict, body_len: int) -> int:
+    content_range = resp.get("ContentRange")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[-1]
+        if total.isdigit():
+            return int(total)
+    return body_len
+
+def _is_invalid_range(e: Exception) -> bool:
+    code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("416", "InvalidRange")
+
+def read_tail_record(s3_client, bucket: str, key: str, accept: Callable[[Dict], bool] = _has_timestamp,
+                     initial_bytes: int = DEFAULT_TAIL_BYTES, max_bytes: int = MAX_TAIL_BYTES,
+                     growth: int = GROWTH) -> Tuple[Optional[Dict], int]:
+    """
+    key 파일에서 accept를 만족하는 마지막 레코드를 꼬리 Range GET으로 찾기
+    반환: (레코드 또는 None, 사용한 GET 요청 수)
+    max_bytes까지 넓혀도 없으면 None (파일 전체가 그보다 작으면 전체를 본 것)
+    """
+    want = initial_bytes
+    try:
+        resp = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{want}")
+    except Exception as e:
+        # 빈 객체는 접미사 Range도 416
+        if _is_invalid_range(e):
+            return None, 1
+        raise
+    buf = resp["Body"].read()
+    size = _total_size(resp, len(buf))
+    start = size - len(buf)   # buf가 파일에서 시작하는 위치
+    requests = 1
+
+    while True:
+        record = last_json_record(buf, accept, complete_head=(start == 0))
+        if record is not None:
+            return record, requests
+        if start == 0:
+            # 줄 단위 레코드가 없음 → 여러 줄로 포맷된 단일 JSON 파일일 수 있음
+            try:
+                record = json.loads(buf.decode("utf-8", errors="ignore"))
+            except json.JSONDecodeError:
+                return None, requests
+            ok = isinstance(record, dict) and (accept is None or accept(record))
+            return (record if ok else None), requests
+        if want >= max_bytes:
+            return None, requests
+        want = min(max_bytes, want * growth)
+        new_start = max(0, size - want)
+        resp = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={new_start}-{start - 1}")
+        buf = resp["Body"].read() + buf
+        start = new_start
+        requests += 1
@@ -0,0 +1,115 @@
+"""
+일반 문서 스캔용 상위 k개 스트리밍 스코어러
+후보 키 전부를 한꺼번에 제출하고 결과(본문 + 파싱된 JSON)를 모두 모아 정렬하는 대신
+
+- 동시 다운로드 수를 max_in_flight로 제한 (남은 키는 완료될 때마다 하나씩 제출)
+- 최소 힙에 상위 k개만 보관, 밀려난 문서는 본문/JSON 참조를 바로 끊음
+- 다운로드 전에 계산한 점수 상한(bound)이 높은 키부터 제출하고,
+  힙이 찼는데 다음 키의 상한이 k번째 점수보다 높지 않으면 나머지는 받지 않고 종료
+  (남은 키는 어느 것도 k번째를 이길 수 없으므로 전체를 받아 정렬한 결과와 같은 상위 k개)
+
+bound_fn은 실제 점수를 절대 넘지 않는 상한이어야 함 (모르면 None → 그 키는 항상 받음)
+동점은 원래 키 순서가 앞선 문서가 이김
+"""
+
+import heapq
+import concurrent.futures as _f
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+class TopK:
+    """점수 상위 k개 문서 (최소 힙, 루트 = 현재 k번째)"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[int, int, Dict]] = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    @property
+    def full(self) -> bool:
+        return len(self._heap) >= self.k
+
+    def threshold(self) -> Optional[Tuple[int, int]]:
+        """k번째 (점수, -순번) (아직 k개가 안 됐으면 None)"""
+        return self._heap[0][:2] if self.full else None
+
+    def push(self, doc: Dict, seq: int) -> bool:
+        """doc을 넣어 보고 상위 k개에 남았는지 반환 (밀려난 문서는 본문을 비움)"""
+        if self.k <= 0:
+            return False
+        entry = (doc["score"], -seq, doc)
+        if not self.full:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] <= self._heap[0][:2]:
+            _drop_payload(doc)
+            return False
+        _, _, evicted = heapq.heapreplace(self._heap, entry)
+        _drop_payload(evicted)
+        return True
+
+    def sorted(self) -> List[Dict]:
+        """점수 내림차순 (동점은 순번이 앞선 순)"""
+        return [doc for _, _, doc in sorted(self._heap, key=lambda e: (e[0], e[1]), reverse=True)]
+
+def _drop_payload(doc: Dict):
+    doc["content"] = None
+    doc["json"] = None
+
+def stream_top_k(keys: Iterable[str], score_fn: Callable[[str], Optional[Dict]], k: int,
+                 bound_fn: Callable[[str], int] = None, max_in_flight: int = 20,
+                 executor: _f.Executor = None, max_workers: int = 10) -> Tuple[List[Dict], Dict]:
+    """
+    score_fn(key) → {"id", "content", "score", ...} 또는 None 을 병렬 실행해 상위 k개 반환
+    bound_fn(key): 다운로드 전에 계산한 점수 상한 (None 반환이나 미지정이면 조기 종료 안 함)
+    반환: (상위 문서 목록, {"candidates", "submitted", "scored", "early_stop"})
+    """
+    keys = list(keys)
+    stats = {"candidates": len(keys), "submitted": 0, "scored": 0, "early_stop": False}
+    if not keys or k <= 0:
+        return [], stats
+
+    bounds = [bound_fn(key) if bound_fn else None for key in keys]
+    if bound_fn:
+        order = sorted(range(len(keys)), key=lambda i: (-(bounds[i] if bounds[i] is not None else float("inf")), i))
+    else:
+        order = list(range(len(keys)))
+
+    top = TopK(k)
+    own_executor = executor is None
+    if own_executor:
+        executor = _f.ThreadPoolExecutor(max_workers=max_workers)
+    in_flight: Dict[_f.Future, int] = {}
+    pos = 0
+    try:
+        while pos < len(order) or in_flight:
+            while pos < len(order) and len(in_flight) < max(1, max_in_flight):
+                i = order[pos]
+                threshold = top.threshold()
+                if threshold is not None and bounds[i] is not None and (bounds[i], -i) <= threshold:
+                    # (상한 내림차순, 순번 오름차순)으로 제출하므로 이후 키도 모두 k번째를 넘을 수 없음
+                    stats["early_stop"] = True
+                    pos = len(order)
+                    break
+                in_flight[executor.submit(score_fn, keys[i])] = i
+                stats["submitted"] += 1
+                pos += 1
+            if not in_flight:
+                break
+            done, _ = _f.wait(in_flight, return_when=_f.FIRST_COMPLETED)
+            for fut in done:
+                seq = in_flight.pop(fut)
+                try:
+                    doc = fut.result()
+                except Exception:
+                    doc = None
+                if doc:
+                    stats["scored"] += 1
+                    top.push(doc, seq)
+    finally:
+        for fut in in_flight:
+            fut.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
+    return top.sorted(), stats
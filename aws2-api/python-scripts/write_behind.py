@@ -0,0 +1,228 @@
+"""
+S3 쓰기 지연 큐 (채팅 로그/세션 저널 PUT을 응답 경로 밖에서 처리)
+오래 사는 프로세스(api_wrapper --worker)에서만 응답 시간이 줄어듦: 프로세스 종료를 응답 완료로 보는
+단발 실행에서는 종료 시 drain(최대 drain_timeout)이 그대로 응답 경로에 남으므로 쓰지 않는다.
+- put/delete 요청을 큐에 넣고 즉시 반환, 백그라운드 스레드가 묶어서 전송
+- 묶음 전송 조건: max_batch개가 모이거나 flush_interval초가 지나면
+- 같은 묶음 안에서 같은 키에 대한 PUT이 여러 번이면 마지막 것만 전송 (사이에 DELETE가 없을 때)
+- 실패 시 지수 백오프로 재시도, 끝내 실패하거나 종료 시까지 못 보낸 항목은 로컬 spool(JSONL)에 기록
+- 다음 시작 시(또는 spool_retry_interval 뒤 다음 묶음에서) spool을 큐 앞에 다시 넣어 재전송
+순서: 단일 스레드 FIFO라 같은 키에 대한 PUT/DELETE 순서가 유지됨
+  한 항목이 끝내 실패하면 그 항목과 뒤의 모든 쓰기를 순서대로 spool로 보냄
+  (예: 세션 스냅샷 PUT이 실패했는데 뒤이은 저널 레코드 DELETE만 전송되는 일이 없도록)
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+class WriteBehindQueue:
+    def __init__(self, s3_client, spool_path: str, max_batch: int = 20, flush_interval: float = 0.5,
+                 max_retries: int = 4, backoff_base: float = 0.2, drain_timeout: float = 10.0,
+                 spool_retry_interval: float = 30.0):
+        self.s3 = s3_client
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.drain_timeout = drain_timeout
+        self.spool_retry_interval = spool_retry_interval
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._inflight: List[Dict] = []
+        self._oldest: Optional[float] = None   # 큐에서 가장 오래 기다린 항목의 enqueue 시각
+        self._flush_requested = False
+        self._closed = False
+        self._spooling_since: Optional[float] = None   # 앞선 쓰기가 spool에 있는 동안 뒤 쓰기도 spool로 (순서 유지)
+        self._spool_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "sent": 0, "coalesced": 0, "retries": 0, "spooled": 0, "replayed": 0}
+
+        self._replay_spool()
+        self._thread = threading.Thread(target=self._run, name="s3-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ----- 공개 API -----
+    def put(self, bucket: str, key: str, body: bytes, content_type: str = "application/json"):
+        self._enqueue({"op": "put", "bucket": bucket, "key": key,
+                       "body": body.decode("utf-8") if isinstance(body, bytes) else body,
+                       "content_type": content_type})
+
+    def delete(self, bucket: str, keys: List[str]):
+        if keys:
+            self._enqueue({"op": "delete", "bucket": bucket, "keys": list(keys)})
+
+    def flush(self, timeout: float = None) -> bool:
+        """큐가 빌 때까지 대기 (True: 모두 전송/처리됨)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._queue or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def close(self):
+        """종료: drain_timeout까지 전송 시도 후 남은 항목은 spool로"""
+        with self._cond:
+            if self._closed:
+                return
+        self.flush(self.drain_timeout)
+        with self._cond:
+            self._closed = True
+            # 전송 중이던 묶음도 함께 보관 (PUT/DELETE는 멱등이라 중복 전송돼도 무방)
+            leftover = self._inflight + list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        if leftover:
+            self._spool(leftover)
+            print(f"[경고] 전송 못 한 S3 쓰기 {len(leftover)}건 spool에 보관: {self.spool_path}")
+
+    # ----- 내부 -----
+    def _enqueue(self, item: Dict):
+        with self._cond:
+            if self._closed:
+                self._spool([item])
+                return
+            if not self._queue:
+                self._oldest = time.monotonic()
+            self._queue.append(item)
+            self.stats["enqueued"] += 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._flush_requested = False
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # 묶음이 덜 찼으면 가장 오래된 항목이 flush_interval을 넘길 때까지 더 모음
+                while len(self._queue) < self.max_batch and not self._flush_requested and not self._closed:
+                    remaining = self._oldest + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                if self._spooling_since is not None and \
+                        time.monotonic() - self._spooling_since >= self.spool_retry_interval:
+                    # 재시도: spool을 큐 앞에 되돌려 원래 순서대로 다시 전송
+                    self._spooling_since = None
+                    self._queue.extendleft(reversed(self._claim_spool()))
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                self._oldest = time.monotonic() if self._queue else None
+                self._inflight = batch
+                spool_only = self._spooling_since is not None
+            if spool_only:
+                self._spool(batch)
+            else:
+                self._send_batch(batch)
+            with self._cond:
+                self._inflight = []
+                self._cond.notify_all()
+
+    def _coalesce(self, batch: List[Dict]) -> List[Dict]:
+        """같은 키에 대한 연속 PUT은 마지막 것만 (DELETE를 사이에 두면 유지)"""
+        out, later_puts = [], set()
+        for item in reversed(batch):
+            if item["op"] == "put":
+                ident = (item["bucket"], item["key"])
+                if ident in later_puts:
+                    self.stats["coalesced"] += 1
+                    continue
+                later_puts.add(ident)
+            else:
+                later_puts -= {(item["bucket"], k) for k in item["keys"]}
+            out.append(item)
+        out.reverse()
+        return out
+
+    def _send_batch(self, batch: List[Dict]):
+        """순서대로 전송, 끝내 실패한 항목에서 멈추고 그 항목부터 나머지를 spool로"""
+        items = self._coalesce(batch)
+        for i, item in enumerate(items):
+            if self._send_with_retry(item):
+                self.stats["sent"] += 1
+                continue
+            self._spool(items[i:])
+            with self._cond:
+                self._spooling_since = time.monotonic()
+            print(f"[오류] S3 쓰기 재시도 실패 → 이 항목부터 {len(items) - i}건 spool 보관 (이후 쓰기도 순서 유지를 위해 spool)")
+            return
+
+    def _send_with_retry(self, item: Dict) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                if item["op"] == "put":
+                    self.s3.put_object(Bucket=item["bucket"], Key=item["key"],
+                                       Body=item["body"].encode("utf-8"), ContentType=item["content_type"])
+                else:
+                    keys = item["keys"]
+                    for i in range(0, len(keys), 1000):
+                        self.s3.delete_objects(Bucket=item["bucket"], Delete={
+                            "Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+                return True
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"[경고] S3 쓰기 실패 ({item.get('key') or item['op']}): {e}")
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(self.backoff_base * (2 ** attempt))
+        return False
+
+    # ----- spool -----
+    def _spool(self, items: List[Dict]):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+            with self._spool_lock, open(self.spool_path, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self.stats["spooled"] += len(items)
+        except Exception as e:
+            print(f"[오류] spool 기록 실패 ({len(items)}건 유실): {e}")
+
+    def _claim_spool(self) -> List[Dict]:
+        """spool 항목을 가져감 (여러 프로세스가 동시에 가져가도 한 번만 가져가도록 rename)"""
+        if not os.path.exists(self.spool_path):
+            return []
+        claimed = f"{self.spool_path}.{os.getpid()}.replay"
+        items = []
+        with self._spool_lock:
+            try:
+                os.replace(self.spool_path, claimed)
+            except OSError:
+                return []
+            try:
+                with open(claimed, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            try:
+                                items.append(json.loads(line))
+                            except json.JSONDecodeError:
+                                continue
+                os.remove(claimed)
+            except Exception as e:
+                print(f"[경고] spool 재전송 준비 실패: {e}")
+                return []
+        self.stats["replayed"] += len(items)
+        return items
+
+    def _replay_spool(self):
+        """이전 실행에서 남긴 spool을 큐에 다시 넣음"""
+        items = self._claim_spool()
+        if items:
+            self._oldest = time.monotonic()
+        self._queue.extend(items)
+        if items:
+            print(f"[히스토리] spool에 남은 S3 쓰기 {len(items)}건 재전송")
@@ -2,6 +2,7 @@
 import sys
 import json
 import traceback
+import contextlib
 from datetime import datetime
 
 # 추천봇 모듈 import
@@ -15,15 +16,15 @@ except ImportError as e:
     }), file=sys.stderr)
     sys.exit(1)
 
-def process_recommendation_query(query: str) -> dict:
+def process_recommendation_query(query: str, on_delta=None) -> dict:
     """
-    추천 질의를 처리하고 결과를 반환
+    추천 질의를 처리하고 결과를 반환 (on_delta: 스트리밍 시 답변 조각 콜백)
     """
     try:
         start_time = datetime.now()
 
         # 추천봇에 질의 처리
-        answer = answer_query(query)
+        answer = answer_query(query, on_delta=on_delta)
 
         processing_time = (datetime.now() - start_time).total_seconds()
 
@@ -47,6 +48,38 @@ def process_recommendation_query(query: str) -> dict:
             "traceback": traceback.format_exc()
         }
 
+def stream_recommendation_query(query: str, out=sys.stdout) -> dict:
+    """
+    스트리밍 처리: {"type": "meta"} → {"type": "delta", "text"}... → {"type": "final", ...기존 응답 필드}
+    NDJSON 한 줄씩 out에 쓰고 바로 flush
+    """
+    start_time = datetime.now()
+    stats = {"deltas": 0, "first_token_sec": None}
+
+    def write(frame: dict):
+        out.write(json.dumps(frame, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def on_delta(text: str):
+        if stats["deltas"] == 0:
+            stats["first_token_sec"] = (datetime.now() - start_time).total_seconds()
+        stats["deltas"] += 1
+        write({"type": "delta", "text": text})
+
+    write({"type": "meta", "mode": "recommend_bot"})
+    with contextlib.redirect_stdout(sys.stderr):
+        result = process_recommendation_query(query, on_delta=on_delta)
+    # 센서 데이터 없음 등 LLM을 거치지 않은 답변은 한 조각으로 전송
+    if stats["deltas"] == 0 and result.get("answer"):
+        on_delta(result["answer"])
+    result["stream_stats"] = {
+        "first_token_sec": stats["first_token_sec"],
+        "deltas": stats["deltas"],
+        "total_sec": (datetime.now() - start_time).total_seconds(),
+    }
+    write({"type": "final", **result})
+    return result
+
 def main():
     """
     메인 실행 함수
@@ -59,6 +92,7 @@ def main():
         try:
             input_data = json.loads(sys.stdin.read())
             query = input_data.get("query", "")
+            stream = bool(input_data.get("stream"))
         except json.JSONDecodeError:
             result = {
                 "error": "Invalid JSON input",
@@ -72,6 +106,9 @@ def main():
                 "error": "No query provided",
                 "status": "error"
             }
+        elif stream:
+            stream_recommendation_query(query)
+            return
         else:
             result = process_recommendation_query(query)
 
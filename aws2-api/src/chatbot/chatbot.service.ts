@@ -266,8 +266,11 @@ export class ChatbotService {
       const sessionFileKey = `chatlogs/${sessionId}.json`;
 
       try {
-        // 세션 파일 직접 읽기
-        const fileData = await this.s3Service.getJson(sessionFileKey, 'chatlog-1293845');
+        // 세션 파일(스냅샷) 읽고 저널 꼬리 레코드 합치기
+        const fileData = await this.applyJournalTail(
+          sessionId,
+          await this.s3Service.getJson(sessionFileKey, 'chatlog-1293845'),
+        );
         
         
         // 실제 파일 구조에 맞게 처리: history 배열을 포함한 세션 객체
@@ -359,6 +362,57 @@ export class ChatbotService {
     }
   }
 
+  /**
+   * 세션 스냅샷에 저널 꼬리 레코드를 적용 (python-scripts/session_journal.py 형식)
+   * 스냅샷은 몇 턴마다만 갱신되므로 journal_seq 이후 턴은 chatlog_journal/session_id/<seq>.json 레코드에 있음
+   */
+  private async applyJournalTail(sessionId: string, fileData: any): Promise<any> {
+    if (!fileData || Array.isArray(fileData) || !Array.isArray(fileData.history)) return fileData;
+
+    const s3Client = (this.s3Service as any).s3;
+    const bucketName = 'chatlog-1293845';
+    const prefix = `chatlog_journal/${sessionId}/`;
+    const journalSeq = Number(fileData.journal_seq || 0);
+    const { ListObjectsV2Command } = await import('@aws-sdk/client-s3');
+
+    const keys: string[] = [];
+    let continuationToken: string | undefined;
+    do {
+      const listCommand: any = { Bucket: bucketName, Prefix: prefix };
+      if (continuationToken) {
+        listCommand.ContinuationToken = continuationToken;
+      } else if (journalSeq) {
+        listCommand.StartAfter = `${prefix}${String(journalSeq).padStart(8, '0')}.json`;
+      }
+      const response = await s3Client.send(new ListObjectsV2Command(listCommand));
+      for (const obj of response.Contents || []) {
+        if (obj.Key && obj.Key.endsWith('.json')) keys.push(obj.Key);
+      }
+      continuationToken = response.IsTruncated ? response.NextContinuationToken : undefined;
+    } while (continuationToken);
+
+    const merged = { ...fileData, history: [...fileData.history] };
+    let seq = journalSeq;
+    for (const key of keys.sort()) {
+      const recordSeq = parseInt(key.substring(prefix.length), 10);
+      if (isNaN(recordSeq) || recordSeq <= seq) continue;
+      try {
+        const record = await this.s3Service.getJson(key, bucketName);
+        if (record.turn) merged.history.push(record.turn);
+        for (const field of ['turn_id', 'last_sensor_ctx', 'followup_timestamp', 'followup_context']) {
+          if (field in record) merged[field] = record[field];
+        }
+        if (record.saved_at) merged.last_saved = record.saved_at;
+        seq = recordSeq;
+      } catch (error) {
+        this.logger.warn(`Failed to read session journal record ${key}:`, error);
+      }
+    }
+    // python 쪽 MAX_HISTORY_TURNS와 같은 길이로 유지
+    merged.history = merged.history.slice(-50);
+    return merged;
+  }
+
   /**
    * 챗봇 세션 목록을 S3에서 조회
    * 구조: chatlog-1293845/chatlogs/session_id.json